@@ -0,0 +1,173 @@
+#pragma once
+
+#include <atomic>
+#include <chrono>
+#include <condition_variable>
+#include <cstddef>
+#include <mutex>
+#include <shared_mutex>
+#include <type_traits>
+
+#include <amulet/utils/task_manager/cancel_manager.hpp>
+
+namespace Amulet {
+
+// A wrapper for a standard mutex type that adds timeouts and cancellation to locking.
+// Threads that cannot lock the mutex sleep on a condition variable until it is unlocked,
+// the timeout is reached or the task is cancelled through the cancel manager.
+// MutexT may be std::mutex, std::recursive_mutex or std::shared_mutex.
+// The shared methods are only available if MutexT is std::shared_mutex.
+// Like the wrapped mutex, this does not guarantee the order that waiting threads lock the mutex.
+// Use OrderedMutex if that is required.
+template <typename MutexT>
+class CancellableMutex {
+private:
+    MutexT _mutex;
+    // The mutex and condition used by waiting threads.
+    std::mutex _wait_mutex;
+    std::condition_variable _condition;
+    // The number of threads waiting on the condition.
+    // Unlocking only locks the wait mutex if this is not zero.
+    std::atomic<std::size_t> _waiter_count = 0;
+
+    static constexpr bool is_shared = std::is_same_v<MutexT, std::shared_mutex>;
+
+    // Wake the waiting threads so that they can try to lock the mutex.
+    void notify_waiters()
+    {
+        // Pairs with the fence in wait_lock so that either the waiter sees the mutex unlocked or this sees the waiter.
+        std::atomic_thread_fence(std::memory_order_seq_cst);
+        if (_waiter_count.load(std::memory_order_relaxed)) {
+            std::lock_guard lock(_wait_mutex);
+            _condition.notify_all();
+        }
+    }
+
+    // Wait until try_lock returns true, the timeout time is reached or the task is cancelled.
+    template <class TryLockT, class Clock, class Duration>
+    bool wait_lock(TryLockT try_lock, const std::chrono::time_point<Clock, Duration>& timeout_time, AbstractCancelManager& cancel_manager)
+    {
+        if (try_lock()) {
+            return true;
+        }
+
+        std::unique_lock lock(_wait_mutex);
+        // The wait mutex must be locked so that the notification cannot be missed.
+        auto token = cancel_manager.register_cancel_callback([this]() -> void {
+            std::lock_guard cancel_lock(_wait_mutex);
+            _condition.notify_all();
+        });
+        _waiter_count.fetch_add(1, std::memory_order_relaxed);
+        std::atomic_thread_fence(std::memory_order_seq_cst);
+        bool locked = false;
+        _condition.wait_until(lock, timeout_time, [&] {
+            locked = try_lock();
+            return locked || cancel_manager.is_cancel_requested();
+        });
+        _waiter_count.fetch_sub(1, std::memory_order_relaxed);
+        lock.unlock();
+        cancel_manager.unregister_cancel_callback(token);
+        return locked;
+    }
+
+public:
+    CancellableMutex() = default;
+    CancellableMutex(const CancellableMutex&) = delete;
+    CancellableMutex(CancellableMutex&&) = delete;
+
+    // Lock the mutex.
+    // Blocks until the mutex is locked or the task is cancelled through the cancel manager.
+    // If the task is cancelled before the mutex is locked, TaskCancelled is thrown.
+    // Thread safe.
+    void lock(AbstractCancelManager& cancel_manager = global_VoidCancelManager)
+    {
+        if (!try_lock_until(std::chrono::steady_clock::time_point::max(), cancel_manager)) {
+            throw TaskCancelled();
+        }
+    }
+
+    // Try to lock the mutex without blocking.
+    // Thread safe.
+    bool try_lock()
+    {
+        return _mutex.try_lock();
+    }
+
+    // Like try_lock but with a timeout duration.
+    // Returns true if the mutex was locked and false if it was not locked within the duration or if the task was cancelled.
+    // Thread safe.
+    template <class Rep, class Period>
+    bool try_lock_for(const std::chrono::duration<Rep, Period>& timeout_duration, AbstractCancelManager& cancel_manager = global_VoidCancelManager)
+    {
+        return try_lock_until(std::chrono::steady_clock::now() + timeout_duration, cancel_manager);
+    }
+
+    // Like try_lock but with a timeout time.
+    // Returns true if the mutex was locked and false if it was not locked before the timeout time or if the task was cancelled.
+    // Thread safe.
+    template <class Clock, class Duration>
+    bool try_lock_until(const std::chrono::time_point<Clock, Duration>& timeout_time, AbstractCancelManager& cancel_manager = global_VoidCancelManager)
+    {
+        return wait_lock([this] { return _mutex.try_lock(); }, timeout_time, cancel_manager);
+    }
+
+    // Unlock the mutex.
+    // Must be called by the thread that locked it.
+    // Thread safe.
+    void unlock()
+    {
+        _mutex.unlock();
+        notify_waiters();
+    }
+
+    // Lock the mutex in shared mode.
+    // See lock.
+    // Thread safe.
+    void lock_shared(AbstractCancelManager& cancel_manager = global_VoidCancelManager)
+        requires is_shared
+    {
+        if (!try_lock_shared_until(std::chrono::steady_clock::time_point::max(), cancel_manager)) {
+            throw TaskCancelled();
+        }
+    }
+
+    // Try to lock the mutex in shared mode without blocking.
+    // Thread safe.
+    bool try_lock_shared()
+        requires is_shared
+    {
+        return _mutex.try_lock_shared();
+    }
+
+    // Like try_lock_shared but with a timeout duration.
+    // See try_lock_for.
+    // Thread safe.
+    template <class Rep, class Period>
+    bool try_lock_shared_for(const std::chrono::duration<Rep, Period>& timeout_duration, AbstractCancelManager& cancel_manager = global_VoidCancelManager)
+        requires is_shared
+    {
+        return try_lock_shared_until(std::chrono::steady_clock::now() + timeout_duration, cancel_manager);
+    }
+
+    // Like try_lock_shared but with a timeout time.
+    // See try_lock_until.
+    // Thread safe.
+    template <class Clock, class Duration>
+    bool try_lock_shared_until(const std::chrono::time_point<Clock, Duration>& timeout_time, AbstractCancelManager& cancel_manager = global_VoidCancelManager)
+        requires is_shared
+    {
+        return wait_lock([this] { return _mutex.try_lock_shared(); }, timeout_time, cancel_manager);
+    }
+
+    // Unlock the mutex from shared mode.
+    // Must be called by the thread that locked it.
+    // Thread safe.
+    void unlock_shared()
+        requires is_shared
+    {
+        _mutex.unlock_shared();
+        notify_waiters();
+    }
+};
+
+} // namespace Amulet
@@ -6,6 +6,7 @@
 #include <pybind11/pybind11.h>
 
 #include <chrono>
+#include <limits>
 #include <memory>
 #include <mutex>
 #include <optional>
@@ -16,7 +17,11 @@
 #include <amulet/pybind11_extensions/py_module.hpp>
 #include <amulet/pybind11_extensions/pybind11.hpp>
 
+#include <amulet/utils/signal/signal.hpp>
+
+#include "cancellable_mutex.hpp"
 #include "mutex.hpp"
+#include "striped_mutex.hpp"
 #include "task_manager/cancel_manager.hpp"
 
 namespace py = pybind11;
@@ -37,78 +42,396 @@ static bool acquire_mutex(
     Amulet::AbstractCancelManager& cancel_manager,
     const std::pair<Amulet::ThreadAccessMode, Amulet::ThreadShareMode>& thread_mode)
 {
-    switch (thread_mode.first) {
-    case Amulet::ThreadAccessMode::Read:
-        switch (thread_mode.second) {
-        case Amulet::ThreadShareMode::Unique:
-            if (blocking) {
-                if (0 < timeout) {
-                    return self.try_lock_for<Amulet::ThreadAccessMode::Read, Amulet::ThreadShareMode::Unique>(std::chrono::duration<double>(timeout), cancel_manager);
-                } else {
-                    return self.try_lock_for<Amulet::ThreadAccessMode::Read, Amulet::ThreadShareMode::Unique>(std::chrono::years(1), cancel_manager);
-                }
+    return Amulet::detail::visit_thread_mode(thread_mode.first, thread_mode.second, [&]<Amulet::ThreadAccessMode AccessMode, Amulet::ThreadShareMode ShareMode>() -> bool {
+        if (blocking) {
+            if (0 < timeout) {
+                return self.try_lock_for<AccessMode, ShareMode>(std::chrono::duration<double>(timeout), cancel_manager);
             } else {
-                return self.try_lock<Amulet::ThreadAccessMode::Read, Amulet::ThreadShareMode::Unique>();
-            }
-        case Amulet::ThreadShareMode::SharedReadOnly:
-            if (blocking) {
-                if (0 < timeout) {
-                    return self.try_lock_for<Amulet::ThreadAccessMode::Read, Amulet::ThreadShareMode::SharedReadOnly>(std::chrono::duration<double>(timeout), cancel_manager);
-                } else {
-                    return self.try_lock_for<Amulet::ThreadAccessMode::Read, Amulet::ThreadShareMode::SharedReadOnly>(std::chrono::years(1), cancel_manager);
-                }
-            } else {
-                return self.try_lock<Amulet::ThreadAccessMode::Read, Amulet::ThreadShareMode::SharedReadOnly>();
-            }
-        case Amulet::ThreadShareMode::SharedReadWrite:
-            if (blocking) {
-                if (0 < timeout) {
-                    return self.try_lock_for<Amulet::ThreadAccessMode::Read, Amulet::ThreadShareMode::SharedReadWrite>(std::chrono::duration<double>(timeout), cancel_manager);
-                } else {
-                    return self.try_lock_for<Amulet::ThreadAccessMode::Read, Amulet::ThreadShareMode::SharedReadWrite>(std::chrono::years(1), cancel_manager);
-                }
-            } else {
-                return self.try_lock<Amulet::ThreadAccessMode::Read, Amulet::ThreadShareMode::SharedReadWrite>();
+                return self.try_lock_for<AccessMode, ShareMode>(std::chrono::years(1), cancel_manager);
             }
+        } else {
+            return self.try_lock<AccessMode, ShareMode>();
         }
-        break;
-    case Amulet::ThreadAccessMode::ReadWrite:
-        switch (thread_mode.second) {
-        case Amulet::ThreadShareMode::Unique:
-            if (blocking) {
-                if (0 < timeout) {
-                    return self.try_lock_for<Amulet::ThreadAccessMode::ReadWrite, Amulet::ThreadShareMode::Unique>(std::chrono::duration<double>(timeout), cancel_manager);
-                } else {
-                    return self.try_lock_for<Amulet::ThreadAccessMode::ReadWrite, Amulet::ThreadShareMode::Unique>(std::chrono::years(1), cancel_manager);
-                }
-            } else {
-                return self.try_lock<Amulet::ThreadAccessMode::ReadWrite, Amulet::ThreadShareMode::Unique>();
-            }
-        case Amulet::ThreadShareMode::SharedReadOnly:
-            if (blocking) {
-                if (0 < timeout) {
-                    return self.try_lock_for<Amulet::ThreadAccessMode::ReadWrite, Amulet::ThreadShareMode::SharedReadOnly>(std::chrono::duration<double>(timeout), cancel_manager);
-                } else {
-                    return self.try_lock_for<Amulet::ThreadAccessMode::ReadWrite, Amulet::ThreadShareMode::SharedReadOnly>(std::chrono::years(1), cancel_manager);
-                }
+    });
+}
+
+// Acquire the mutex with the GIL held.
+// The GIL is only released if the mutex cannot be locked immediately.
+static bool acquire_mutex_gil(
+    Amulet::OrderedMutex& self,
+    bool blocking,
+    double timeout,
+    Amulet::AbstractCancelManager& cancel_manager,
+    const std::pair<Amulet::ThreadAccessMode, Amulet::ThreadShareMode>& thread_mode)
+{
+    const bool locked = Amulet::detail::visit_thread_mode(thread_mode.first, thread_mode.second, [&]<Amulet::ThreadAccessMode AccessMode, Amulet::ThreadShareMode ShareMode>() -> bool {
+        return self.try_lock<AccessMode, ShareMode>();
+    });
+    if (locked || !blocking) {
+        return locked;
+    }
+    py::gil_scoped_release nogil;
+    return acquire_mutex(self, blocking, timeout, cancel_manager, thread_mode);
+}
+
+static bool upgrade_mutex(
+    Amulet::OrderedMutex& self,
+    bool blocking,
+    double timeout,
+    Amulet::AbstractCancelManager& cancel_manager,
+    const std::pair<Amulet::ThreadAccessMode, Amulet::ThreadShareMode>& thread_mode)
+{
+    return Amulet::detail::visit_thread_mode(thread_mode.first, thread_mode.second, [&]<Amulet::ThreadAccessMode AccessMode, Amulet::ThreadShareMode ShareMode>() -> bool {
+        if (blocking) {
+            if (0 < timeout) {
+                return self.try_upgrade_for<AccessMode, ShareMode>(std::chrono::duration<double>(timeout), cancel_manager);
             } else {
-                return self.try_lock<Amulet::ThreadAccessMode::ReadWrite, Amulet::ThreadShareMode::SharedReadOnly>();
+                return self.try_upgrade_for<AccessMode, ShareMode>(std::chrono::years(1), cancel_manager);
             }
-        case Amulet::ThreadShareMode::SharedReadWrite:
-            if (blocking) {
-                if (0 < timeout) {
-                    return self.try_lock_for<Amulet::ThreadAccessMode::ReadWrite, Amulet::ThreadShareMode::SharedReadWrite>(std::chrono::duration<double>(timeout), cancel_manager);
-                } else {
-                    return self.try_lock_for<Amulet::ThreadAccessMode::ReadWrite, Amulet::ThreadShareMode::SharedReadWrite>(std::chrono::years(1), cancel_manager);
-                }
-            } else {
-                return self.try_lock<Amulet::ThreadAccessMode::ReadWrite, Amulet::ThreadShareMode::SharedReadWrite>();
+        } else {
+            return self.try_upgrade<AccessMode, ShareMode>();
+        }
+    });
+}
+
+static void downgrade_mutex(
+    Amulet::OrderedMutex& self,
+    const std::pair<Amulet::ThreadAccessMode, Amulet::ThreadShareMode>& thread_mode)
+{
+    Amulet::detail::visit_thread_mode(thread_mode.first, thread_mode.second, [&]<Amulet::ThreadAccessMode AccessMode, Amulet::ThreadShareMode ShareMode>() {
+        self.downgrade<AccessMode, ShareMode>();
+    });
+}
+
+// Lock a CancellableMutex with the same arguments as OrderedLock.acquire.
+template <bool Shared, typename MutexT>
+static bool acquire_cancellable_mutex(
+    Amulet::CancellableMutex<MutexT>& self,
+    bool blocking,
+    double timeout,
+    Amulet::AbstractCancelManager& cancel_manager)
+{
+    auto try_lock_for = [&](const auto& timeout_duration) {
+        if constexpr (Shared) {
+            return self.try_lock_shared_for(timeout_duration, cancel_manager);
+        } else {
+            return self.try_lock_for(timeout_duration, cancel_manager);
+        }
+    };
+    if (blocking) {
+        if (0 < timeout) {
+            return try_lock_for(std::chrono::duration<double>(timeout));
+        } else {
+            return try_lock_for(std::chrono::years(1));
+        }
+    } else if constexpr (Shared) {
+        return self.try_lock_shared();
+    } else {
+        return self.try_lock();
+    }
+}
+
+static bool acquire_requests(
+    const std::vector<Amulet::OrderedMutexLockRequest>& requests,
+    bool blocking,
+    double timeout,
+    Amulet::AbstractCancelManager& cancel_manager)
+{
+    if (blocking) {
+        if (0 < timeout) {
+            return Amulet::try_lock_all_for(requests, std::chrono::duration<double>(timeout), cancel_manager);
+        } else {
+            return Amulet::try_lock_all_for(requests, std::chrono::years(1), cancel_manager);
+        }
+    } else {
+        return Amulet::try_lock_all(requests);
+    }
+}
+
+static bool acquire_all(
+    const std::vector<std::pair<Amulet::OrderedMutex*, std::pair<Amulet::ThreadAccessMode, Amulet::ThreadShareMode>>>& locks,
+    bool blocking,
+    double timeout,
+    Amulet::AbstractCancelManager& cancel_manager)
+{
+    std::vector<Amulet::OrderedMutexLockRequest> requests;
+    requests.reserve(locks.size());
+    for (const auto& [mutex, thread_mode] : locks) {
+        requests.push_back({ mutex, thread_mode.first, thread_mode.second });
+    }
+    return acquire_requests(requests, blocking, timeout, cancel_manager);
+}
+
+// Python keys are mapped to stripes by their hash.
+using StripedOrderedMutex = Amulet::StripedOrderedMutex<size_t>;
+
+static std::vector<size_t> get_key_hashes(const py::iterable& keys)
+{
+    std::vector<size_t> hashes;
+    for (const auto& key : keys) {
+        hashes.push_back(static_cast<size_t>(py::hash(key)));
+    }
+    return hashes;
+}
+
+// A context manager returned by OrderedLock.__call__.
+// Entering and exiting are native methods so that a with block does not allocate.
+// No state is stored between entering and exiting so it can be reused.
+class OrderedLockContextManager {
+public:
+    Amulet::OrderedMutex& mutex;
+    bool blocking;
+    double timeout;
+    Amulet::AbstractCancelManager& cancel_manager;
+    std::pair<Amulet::ThreadAccessMode, Amulet::ThreadShareMode> thread_mode;
+    // Keeps the owner of the mutex alive.
+    py::object owner;
+    // Keeps the cancel manager alive.
+    py::object cancel_manager_obj;
+
+    void enter()
+    {
+        if (!acquire_mutex_gil(mutex, blocking, timeout, cancel_manager, thread_mode)) {
+            throw Amulet::LockNotAcquired("Lock was not acquired.");
+        }
+    }
+
+    void exit()
+    {
+        mutex.unlock();
+    }
+};
+
+// The ownership of an OrderedMutex acquired by a coroutine.
+// The lock is held by the request rather than the event loop thread so other coroutines cannot release it.
+class AsyncLockToken {
+public:
+    // Keeps the mutex alive while the lock is held.
+    py::object mutex_obj;
+    // The granted request. This is null once the lock has been released.
+    std::shared_ptr<Amulet::OrderedMutex::AsyncRequest> request;
+};
+
+// Release a lock acquired by a coroutine.
+static void release_mutex_async(Amulet::OrderedMutex& mutex, AsyncLockToken& token)
+{
+    if (!token.request) {
+        throw std::runtime_error("This token has already been released.");
+    }
+    if (&token.mutex_obj.cast<Amulet::OrderedMutex&>() != &mutex) {
+        throw std::invalid_argument("This token was not issued by this lock.");
+    }
+    auto request = std::move(token.request);
+    token.request.reset();
+    py::gil_scoped_release nogil;
+    mutex.unlock_async(*request);
+}
+
+// The state of an asyncio acquire call.
+// This is shared by the callbacks run by the event loop and the thread that grants the lock.
+// The python objects must only be used with the GIL held.
+class AsyncAcquire : public std::enable_shared_from_this<AsyncAcquire> {
+public:
+    Amulet::OrderedMutex& mutex;
+    // Keeps the mutex alive while the request is queued.
+    py::object mutex_obj;
+    Amulet::AbstractCancelManager& cancel_manager;
+    py::object cancel_manager_obj;
+    // The exception type the future raises on failure. If None the future returns None.
+    py::object exception_type;
+    // If not null the token is also stored here when the lock is granted.
+    std::shared_ptr<py::object> token_out;
+    std::shared_ptr<Amulet::OrderedMutex::AsyncRequest> request;
+    py::object loop;
+    py::object future;
+    py::object timer_handle;
+    std::optional<Amulet::SignalToken<>> cancel_token;
+
+    AsyncAcquire(
+        Amulet::OrderedMutex& mutex,
+        py::object mutex_obj,
+        Amulet::AbstractCancelManager& cancel_manager,
+        py::object cancel_manager_obj,
+        py::object exception_type,
+        std::shared_ptr<py::object> token_out)
+        : mutex(mutex)
+        , mutex_obj(std::move(mutex_obj))
+        , cancel_manager(cancel_manager)
+        , cancel_manager_obj(std::move(cancel_manager_obj))
+        , exception_type(std::move(exception_type))
+        , token_out(std::move(token_out))
+        , loop(py::module::import("asyncio").attr("get_running_loop")())
+        , future(loop.attr("create_future")())
+    {
+    }
+
+    // Schedule a method to be called by the event loop.
+    // This can be called from any thread.
+    void call_soon_threadsafe(void (AsyncAcquire::*method)())
+    {
+        py::gil_scoped_acquire gil;
+        try {
+            loop.attr("call_soon_threadsafe")(py::cpp_function([self = shared_from_this(), method]() {
+                ((*self).*method)();
+            }));
+        } catch (py::error_already_set& e) {
+            // The event loop is closed.
+            e.discard_as_unraisable(__func__);
+            if (method == &AsyncAcquire::on_granted) {
+                // The lock has been granted to the request but nothing will claim it.
+                py::gil_scoped_release nogil;
+                mutex.unlock_async(*request);
             }
         }
     }
-    throw std::runtime_error("This should be unreachable.");
+
+    void set_granted()
+    {
+        py::object token = py::cast(AsyncLockToken { mutex_obj, request });
+        if (token_out) {
+            *token_out = token;
+        }
+        future.attr("set_result")(token);
+    }
+
+    void set_failed()
+    {
+        if (exception_type.is_none()) {
+            future.attr("set_result")(py::none());
+        } else {
+            future.attr("set_exception")(exception_type("Lock was not acquired."));
+        }
+        if (token_out) {
+            *token_out = py::object();
+        }
+    }
+
+    // Stop the timeout and cancel callbacks.
+    void cleanup()
+    {
+        if (timer_handle) {
+            timer_handle.attr("cancel")();
+            timer_handle = py::object();
+        }
+        if (cancel_token) {
+            py::gil_scoped_release nogil;
+            cancel_manager.unregister_cancel_callback(*cancel_token);
+            cancel_token.reset();
+        }
+    }
+
+    // Called by the event loop when the lock has been granted to the request.
+    void on_granted()
+    {
+        cleanup();
+        if (future.attr("done")().cast<bool>()) {
+            // The awaiting task was cancelled.
+            mutex.unlock_async(*request);
+        } else {
+            mutex.claim_async(*request);
+            set_granted();
+        }
+    }
+
+    // Called by the event loop when the timeout is reached or the task is cancelled through the cancel manager.
+    void on_failed()
+    {
+        if (future.attr("done")().cast<bool>()) {
+            return;
+        }
+        if (mutex.cancel_async(*request)) {
+            cleanup();
+            set_failed();
+        }
+        // Otherwise the lock has been granted and on_granted is pending.
+    }
+
+    // Called by the event loop when the future is done.
+    void on_done()
+    {
+        if (future.attr("cancelled")().cast<bool>() && mutex.cancel_async(*request)) {
+            // The awaiting task was cancelled while the request was queued.
+            cleanup();
+        }
+    }
+
+    // Start acquiring the lock.
+    // Returns the future.
+    py::object start(bool blocking, double timeout, const std::pair<Amulet::ThreadAccessMode, Amulet::ThreadShareMode>& thread_mode)
+    {
+        // The callback is called by the thread that unlocked the mutex, which may be inside OrderedMutex::unlock
+        // while holding other locks, so it must not wait for the GIL.
+        // The grant is handed to the async event loop which takes the GIL and schedules on_granted.
+        // It must only release its reference to this object while the GIL is held.
+        request = std::make_shared<Amulet::OrderedMutex::AsyncRequest>(
+            thread_mode.first,
+            thread_mode.second,
+            [self_ptr = shared_from_this()]() mutable {
+                Amulet::detail::submit_async([self_ptr = std::move(self_ptr)]() mutable {
+                    py::gil_scoped_acquire gil;
+                    auto self = std::move(self_ptr);
+                    self->call_soon_threadsafe(&AsyncAcquire::on_granted);
+                });
+            });
+        if (blocking ? mutex.lock_async(*request) : mutex.try_lock_async(*request)) {
+            // The request was not queued.
+            set_granted();
+            return future;
+        }
+        if (!blocking) {
+            request.reset();
+            set_failed();
+            return future;
+        }
+        future.attr("add_done_callback")(py::cpp_function([self = shared_from_this()](py::object) {
+            self->on_done();
+        }));
+        if (0 < timeout) {
+            timer_handle = loop.attr("call_later")(timeout, py::cpp_function([self = shared_from_this()]() {
+                self->on_failed();
+            }));
+        }
+        cancel_token = cancel_manager.register_cancel_callback([self = shared_from_this()]() {
+            self->call_soon_threadsafe(&AsyncAcquire::on_failed);
+        });
+        if (cancel_manager.is_cancel_requested()) {
+            on_failed();
+        }
+        return future;
+    }
+};
+
+static py::object acquire_mutex_async(
+    py::object self,
+    bool blocking,
+    double timeout,
+    py::object cancel_manager,
+    const std::pair<Amulet::ThreadAccessMode, Amulet::ThreadShareMode>& thread_mode,
+    py::object exception_type,
+    std::shared_ptr<py::object> token_out = nullptr)
+{
+    auto state = std::make_shared<AsyncAcquire>(
+        self.cast<Amulet::OrderedMutex&>(),
+        self,
+        cancel_manager.cast<Amulet::AbstractCancelManager&>(),
+        cancel_manager,
+        std::move(exception_type),
+        std::move(token_out));
+    return state->start(blocking, timeout, thread_mode);
 }
 
+// An asynchronous context manager returned by OrderedLock.async_context.
+class AsyncContextManager {
+public:
+    py::object mutex;
+    bool blocking;
+    double timeout;
+    py::object cancel_manager;
+    std::pair<Amulet::ThreadAccessMode, Amulet::ThreadShareMode> thread_mode;
+    // The token of the lock acquired when entering. This is None while not entered.
+    std::shared_ptr<py::object> token = std::make_shared<py::object>();
+};
+
 void init_lock(py::module m_parent)
 {
     auto m = m_parent.def_submodule("lock");
@@ -157,20 +480,103 @@ void init_lock(py::module m_parent)
         py::name("__repr__"),
         py::is_method(ThreadShareMode));
 
+    py::class_<Amulet::OrderedMutexSpinStats> OrderedLockSpinStats(m, "OrderedLockSpinStats",
+        "Statistics about the spinning phase of contended OrderedLock acquire calls.");
+    OrderedLockSpinStats.def_readonly(
+        "spin_count",
+        &Amulet::OrderedMutexSpinStats::spin_count,
+        py::doc("The number of blocking acquire calls that could not acquire the lock immediately and spun."));
+    OrderedLockSpinStats.def_readonly(
+        "spin_success_count",
+        &Amulet::OrderedMutexSpinStats::spin_success_count,
+        py::doc("The number of spinning acquire calls that acquired the lock while spinning."));
+    OrderedLockSpinStats.def_readonly(
+        "park_count",
+        &Amulet::OrderedMutexSpinStats::park_count,
+        py::doc("The number of blocking acquire calls that waited in the queue."));
+
+    py::class_<Amulet::OrderedMutexProfile> OrderedLockProfile(m, "OrderedLockProfile",
+        "Contention statistics of an OrderedLock.\n"
+        "These are only recorded while profiling is enabled.");
+    OrderedLockProfile.def_readonly(
+        "name",
+        &Amulet::OrderedMutexProfile::name,
+        py::doc("The name the lock was registered with when profiling was enabled."));
+    OrderedLockProfile.def_property_readonly(
+        "acquire_count",
+        [](const Amulet::OrderedMutexProfile& self) {
+            py::dict acquire_count;
+            for (auto access_mode : { Amulet::ThreadAccessMode::Read, Amulet::ThreadAccessMode::ReadWrite }) {
+                for (auto share_mode : { Amulet::ThreadShareMode::Unique, Amulet::ThreadShareMode::SharedReadOnly, Amulet::ThreadShareMode::SharedReadWrite }) {
+                    acquire_count[py::make_tuple(access_mode, share_mode)] = self.acquire_count[static_cast<size_t>(access_mode)][static_cast<size_t>(share_mode)];
+                }
+            }
+            return acquire_count;
+        },
+        py::doc("The number of successful acquire calls for each thread mode."));
+    OrderedLockProfile.def_readonly(
+        "contended_count",
+        &Amulet::OrderedMutexProfile::contended_count,
+        py::doc("The number of successful acquire calls that could not acquire the lock immediately."));
+    OrderedLockProfile.def_property_readonly(
+        "total_wait_time",
+        [](const Amulet::OrderedMutexProfile& self) {
+            return std::chrono::duration<double>(self.total_wait_time).count();
+        },
+        py::doc("The total number of seconds contended acquire calls waited before acquiring the lock."));
+    OrderedLockProfile.def_property_readonly(
+        "max_wait_time",
+        [](const Amulet::OrderedMutexProfile& self) {
+            return std::chrono::duration<double>(self.max_wait_time).count();
+        },
+        py::doc("The longest number of seconds a contended acquire call waited before acquiring the lock."));
+    OrderedLockProfile.def_property_readonly(
+        "hold_time_histogram",
+        [](const Amulet::OrderedMutexProfile& self) {
+            py::list hold_time_histogram;
+            for (const auto& count : self.hold_time_histogram) {
+                hold_time_histogram.append(count);
+            }
+            return hold_time_histogram;
+        },
+        py::doc(
+            "The number of times the lock was held for each duration.\n"
+            "Bucket i counts hold times of at least 2**i nanoseconds and less than 2**(i+1) nanoseconds.\n"
+            "The first bucket also counts zero and the last bucket also counts longer hold times."));
+    OrderedLockProfile.def_readonly(
+        "timeout_count",
+        &Amulet::OrderedMutexProfile::timeout_count,
+        py::doc("The number of acquire calls that timed out."));
+    OrderedLockProfile.def_readonly(
+        "cancel_count",
+        &Amulet::OrderedMutexProfile::cancel_count,
+        py::doc("The number of acquire calls that were cancelled."));
+
     py::class_<Amulet::OrderedMutex> OrderedLock(m, "OrderedLock",
         "This is a custom mutex implementation that prioritises acquisition order and allows parallelism where possible.\n"
         "The acquirer can define the required permissions for this thread and permissions for other parallel threads.\n"
         "It also supports cancelling waiting through a CancelManager instance.");
 
-    OrderedLock.def(py::init<>());
+    OrderedLock.def(
+        py::init<bool>(),
+        py::arg("reentrant") = false,
+        py::doc(
+            ":param reentrant: If true a thread that holds the lock can acquire it again in a mode that is covered by the held mode.\n"
+            "    The held mode must have at least the access of the new mode and block other threads at least as much.\n"
+            "    The lock must be released as many times as it was acquired.\n"
+            "    Acquiring in a mode that is not covered raises :class:`Deadlock`. Use :meth:`upgrade` to change the mode.\n"
+            "    If false (default) acquiring the lock again raises :class:`Deadlock`."));
+    OrderedLock.def_property_readonly(
+        "reentrant",
+        &Amulet::OrderedMutex::is_reentrant,
+        py::doc("Is the lock re-entrant."));
     OrderedLock.def(
         "acquire",
-        &acquire_mutex,
+        &acquire_mutex_gil,
         py::arg("blocking") = true,
         py::arg("timeout") = -1.0,
         py::arg("cancel_manager") = Amulet::VoidCancelManager(),
         py::arg("thread_mode") = std::make_pair(Amulet::ThreadAccessMode::ReadWrite, Amulet::ThreadShareMode::Unique),
-        py::call_guard<py::gil_scoped_release>(),
         py::doc(
             "Acquire the lock.\n"
             "Thread safe.\n"
@@ -190,42 +596,173 @@ void init_lock(py::module m_parent)
     OrderedLock.def(
         "release",
         &Amulet::OrderedMutex::unlock,
-        py::call_guard<py::gil_scoped_release>(),
         py::doc(
             "Release the lock.\n"
             "Must be called by the thread that locked it.\n"
             "Thread safe.\n"
             "\n"
             "Only use this if you know what you are doing. Consider using the context manager instead\n"));
+    OrderedLock.def(
+        "upgrade",
+        &upgrade_mutex,
+        py::arg("blocking") = true,
+        py::arg("timeout") = -1.0,
+        py::arg("cancel_manager") = Amulet::VoidCancelManager(),
+        py::arg("thread_mode") = std::make_pair(Amulet::ThreadAccessMode::ReadWrite, Amulet::ThreadShareMode::Unique),
+        py::call_guard<py::gil_scoped_release>(),
+        py::doc(
+            "Change the mode the lock is held in by this thread without releasing it.\n"
+            "No other thread can acquire the lock in between.\n"
+            "This waits for the other threads holding the lock and takes priority over threads waiting to acquire it.\n"
+            "Must be called by the thread that acquired the lock.\n"
+            "Thread safe.\n"
+            "\n"
+            ":param blocking:\n"
+            "    If true (default) this will block until the mode is changed, the timeout is reached or the task is cancelled.\n"
+            "    If false and the mode cannot be changed on the first try, this returns False.\n"
+            ":param timeout: The maximum number of seconds to block for. Has no effect if blocking is False. Default is forever.\n"
+            ":param cancel_manager: A custom object through which upgrading can be cancelled.\n"
+            ":param thread_mode: The new permissions for the current and other parallel threads.\n"
+            ":return: True if the mode was changed otherwise False. The original mode is kept if False.\n"
+            ":raises Deadlock: If another thread is already waiting to upgrade."));
+    OrderedLock.def(
+        "downgrade",
+        &downgrade_mutex,
+        py::arg("thread_mode") = std::make_pair(Amulet::ThreadAccessMode::Read, Amulet::ThreadShareMode::SharedReadOnly),
+        py::call_guard<py::gil_scoped_release>(),
+        py::doc(
+            "Change the mode the lock is held in by this thread to a mode covered by the held mode without releasing it.\n"
+            "The new mode must have at most the access of the held mode and block other threads at most as much.\n"
+            "This never blocks. Threads waiting to acquire the lock that can now acquire it are woken.\n"
+            "Must be called by the thread that acquired the lock.\n"
+            "Thread safe.\n"
+            "\n"
+            ":param thread_mode: The new permissions for the current and other parallel threads.\n"
+            ":raises ValueError: If the new mode is not covered by the held mode."));
+    OrderedLock.def_property(
+        "max_spin",
+        &Amulet::OrderedMutex::get_max_spin,
+        &Amulet::OrderedMutex::set_max_spin,
+        py::doc(
+            "The maximum number of times a contended blocking acquire checks the lock before waiting in the queue.\n"
+            "Spinning avoids the cost of sleeping and waking when the lock is held for a short time.\n"
+            "The number of checks adapts to how long recent successful spins took.\n"
+            "Zero disables spinning. None (default) uses the global default.\n"
+            "Thread safe."));
+    OrderedLock.def_static(
+        "get_default_max_spin",
+        &Amulet::OrderedMutex::get_default_max_spin,
+        py::doc(
+            "Get the global default max_spin.\n"
+            "This is zero on single core machines and 100 otherwise.\n"
+            "Thread safe."));
+    OrderedLock.def_static(
+        "set_default_max_spin",
+        &Amulet::OrderedMutex::set_default_max_spin,
+        py::arg("max_spin"),
+        py::doc(
+            "Set the global default max_spin used by locks without their own value.\n"
+            "Thread safe."));
+    OrderedLock.def_property_readonly(
+        "spin_stats",
+        &Amulet::OrderedMutex::get_spin_stats,
+        py::doc(
+            "Statistics about the spinning phase of contended acquire calls.\n"
+            "These can be used to find if spinning helps for a given workload.\n"
+            "Thread safe."));
+    OrderedLock.def(
+        "reset_spin_stats",
+        &Amulet::OrderedMutex::reset_spin_stats,
+        py::doc(
+            "Reset the spin statistics to zero.\n"
+            "Thread safe."));
+    OrderedLock.def(
+        "enable_profiling",
+        &Amulet::OrderedMutex::enable_profiling,
+        py::arg("name") = "",
+        py::doc(
+            "Start recording contention statistics for this lock and add it to the global registry.\n"
+            "Profiling adds a small cost to each acquire call so it is disabled by default.\n"
+            "If profiling is already enabled the lock is renamed and the statistics are kept.\n"
+            "Thread safe.\n"
+            "\n"
+            ":param name: The name used to identify the lock in :func:`get_ordered_lock_profiles`."));
+    OrderedLock.def(
+        "disable_profiling",
+        &Amulet::OrderedMutex::disable_profiling,
+        py::doc(
+            "Stop recording contention statistics and remove the lock from the global registry.\n"
+            "The recorded statistics are kept.\n"
+            "Thread safe."));
+    OrderedLock.def_property_readonly(
+        "profiling",
+        &Amulet::OrderedMutex::is_profiling,
+        py::doc("Is profiling enabled."));
+    OrderedLock.def_property_readonly(
+        "profile",
+        &Amulet::OrderedMutex::get_profile,
+        py::doc(
+            "The recorded contention statistics.\n"
+            "Thread safe."));
+    OrderedLock.def(
+        "reset_profile",
+        &Amulet::OrderedMutex::reset_profile,
+        py::doc(
+            "Reset the recorded contention statistics to zero.\n"
+            "Thread safe."));
+    py::class_<OrderedLockContextManager>(py::handle(), "OrderedLockContextManager", py::module_local())
+        .def(
+            "__enter__",
+            &OrderedLockContextManager::enter)
+        .def(
+            "__exit__",
+            [](OrderedLockContextManager& self, py::handle, py::handle, py::handle) -> std::optional<bool> {
+                self.exit();
+                return false;
+            });
+
+    // This overload is tried first so that a call with no arguments skips converting the default arguments.
+    OrderedLock.def(
+        "__call__",
+        [](py::object self) {
+            return self;
+        },
+        py::doc(
+            "A context manager to acquire and release the lock in read write unique mode.\n"
+            "The lock is its own context manager for the default arguments so this does not allocate.\n"
+            "Thread safe.\n"
+            "\n"
+            ">>> lock: OrderedLock\n"
+            ">>> with lock():\n"
+            ">>>     # code with lock acquired\n"
+            ">>> # the lock will automatically be released here\n"
+            "\n"
+            ":return: contextlib.AbstractContextManager[None]"));
     OrderedLock.def(
         "__call__",
         [](
-            Amulet::OrderedMutex& self,
+            py::object self,
             bool blocking,
             double timeout,
-            Amulet::AbstractCancelManager& cancel_manager,
+            py::object cancel_manager,
             const std::pair<Amulet::ThreadAccessMode, Amulet::ThreadShareMode>& thread_mode) {
-            return pyext::contextlib::make_context_manager<void, std::optional<bool>>(
-                [&self, blocking, timeout, &cancel_manager, thread_mode]() -> void {
-                    py::gil_scoped_release nogil;
-                    if (!acquire_mutex(self, blocking, timeout, cancel_manager, thread_mode)) {
-                        throw Amulet::LockNotAcquired("Lock was not acquired.");
-                    }
-                },
-                [&self](py::object, py::object, py::object) -> std::optional<bool> {
-                    py::gil_scoped_release nogil;
-                    self.unlock();
-                    return false;
-                });
+            return OrderedLockContextManager {
+                self.cast<Amulet::OrderedMutex&>(),
+                blocking,
+                timeout,
+                cancel_manager.cast<Amulet::AbstractCancelManager&>(),
+                thread_mode,
+                self,
+                cancel_manager
+            };
         },
         py::arg("blocking") = true,
         py::arg("timeout") = -1.0,
         py::arg("cancel_manager") = Amulet::VoidCancelManager(),
         py::arg("thread_mode") = std::make_pair(Amulet::ThreadAccessMode::ReadWrite, Amulet::ThreadShareMode::Unique),
-        py::keep_alive<0, 1>(),
-        py::keep_alive<0, 4>(),
         py::doc(
             "A context manager to acquire and release the lock.\n"
+            "The context manager can be reused. Create it once outside of a loop to avoid the cost of creating it.\n"
             "Thread safe.\n"
             "\n"
             ">>> lock: OrderedLock\n"
@@ -249,16 +786,348 @@ void init_lock(py::module m_parent)
             ":param thread_mode: The permissions for the current and other parallel threads.\n"
             ":return: contextlib.AbstractContextManager[None]"));
 
-    py::class_<std::mutex> Lock(m, "Lock",
-        "A wrapper for std::mutex.");
+    OrderedLock.def(
+        "__enter__",
+        [](Amulet::OrderedMutex& self) {
+            if (!self.try_lock()) {
+                py::gil_scoped_release nogil;
+                self.lock();
+            }
+        },
+        py::doc(
+            "Acquire the lock in read write unique mode.\n"
+            "This blocks until the lock is acquired.\n"
+            "Use :meth:`__call__` for other modes.\n"
+            "\n"
+            ">>> lock: OrderedLock\n"
+            ">>> with lock:\n"
+            ">>>     # code with lock acquired\n"
+            ">>> # the lock will automatically be released here"));
+    OrderedLock.def(
+        "__exit__",
+        [](Amulet::OrderedMutex& self, py::handle, py::handle, py::handle) -> std::optional<bool> {
+            self.unlock();
+            return false;
+        },
+        py::arg("exc_type"),
+        py::arg("exc_val"),
+        py::arg("exc_tb"),
+        py::doc("Release the lock."));
+    py::class_<AsyncLockToken>(m, "AsyncLockToken",
+        "The ownership of an :class:`OrderedLock` acquired by a coroutine.\n"
+        "Pass it to :meth:`OrderedLock.release_async` to release the lock.");
+
+    OrderedLock.def(
+        "acquire_async",
+        [](
+            py::object self,
+            bool blocking,
+            double timeout,
+            py::object cancel_manager,
+            const std::pair<Amulet::ThreadAccessMode, Amulet::ThreadShareMode>& thread_mode) {
+            return acquire_mutex_async(self, blocking, timeout, cancel_manager, thread_mode, py::none());
+        },
+        py::arg("blocking") = true,
+        py::arg("timeout") = -1.0,
+        py::arg("cancel_manager") = Amulet::VoidCancelManager(),
+        py::arg("thread_mode") = std::make_pair(Amulet::ThreadAccessMode::ReadWrite, Amulet::ThreadShareMode::Unique),
+        py::doc(
+            "Acquire the lock from a coroutine without blocking the event loop.\n"
+            "This must be called from the thread running the event loop.\n"
+            "The coroutine waits in the same queue as threads calling :meth:`acquire`.\n"
+            "Once granted the lock is held by the returned token rather than the event loop thread.\n"
+            "It must be released by passing the token to :meth:`release_async`.\n"
+            "Unlike :meth:`acquire` this does not raise :class:`Deadlock` if the event loop thread already holds the lock\n"
+            "because it may be held by another coroutine.\n"
+            "If the awaiting task is cancelled the lock is not acquired.\n"
+            "\n"
+            ">>> lock: OrderedLock\n"
+            ">>> token = await lock.acquire_async()\n"
+            ">>> if token is not None:\n"
+            ">>>     try:\n"
+            ">>>         # code with lock acquired\n"
+            ">>>     finally:\n"
+            ">>>         lock.release_async(token)\n"
+            "\n"
+            ":param blocking:\n"
+            "    If true (default) this will wait until the lock is acquired, the timeout is reached or the task is cancelled.\n"
+            "    If false and the lock cannot be acquired on the first try, this returns False.\n"
+            ":param timeout: The maximum number of seconds to wait for. Has no effect if blocking is False. Default is forever.\n"
+            ":param cancel_manager: A custom object through which acquiring can be cancelled.\n"
+            ":param thread_mode: The permissions for the event loop thread and other parallel threads.\n"
+            ":return: An awaitable returning a token if the lock was acquired otherwise None."));
+    OrderedLock.def(
+        "release_async",
+        &release_mutex_async,
+        py::arg("token"),
+        py::doc(
+            "Release a lock acquired by :meth:`acquire_async`.\n"
+            "This may be called from any thread.\n"
+            "Thread safe.\n"
+            "\n"
+            ":param token: The token returned by :meth:`acquire_async`.\n"
+            ":raises RuntimeError: If the token has already been released.\n"
+            ":raises ValueError: If the token was issued by a different lock."));
+
+    py::class_<AsyncContextManager>(py::handle(), "AsyncContextManager", py::module_local())
+        .def(
+            "__aenter__",
+            [LockNotAcquired](const AsyncContextManager& self) {
+                if (*self.token) {
+                    throw std::runtime_error("This context manager has already been entered.");
+                }
+                // Mark the context manager as entered until the lock is granted or fails.
+                *self.token = py::none();
+                return acquire_mutex_async(self.mutex, self.blocking, self.timeout, self.cancel_manager, self.thread_mode, LockNotAcquired, self.token);
+            })
+        .def(
+            "__aexit__",
+            [](const AsyncContextManager& self, py::object, py::object, py::object) {
+                py::object token = std::move(*self.token);
+                *self.token = py::object();
+                if (!token || token.is_none()) {
+                    throw std::runtime_error("This context manager has not been entered.");
+                }
+                release_mutex_async(self.mutex.cast<Amulet::OrderedMutex&>(), token.cast<AsyncLockToken&>());
+                py::object future = py::module::import("asyncio").attr("get_running_loop")().attr("create_future")();
+                future.attr("set_result")(false);
+                return future;
+            });
+
+    OrderedLock.def(
+        "async_context",
+        [](
+            py::object self,
+            bool blocking,
+            double timeout,
+            py::object cancel_manager,
+            const std::pair<Amulet::ThreadAccessMode, Amulet::ThreadShareMode>& thread_mode) {
+            return AsyncContextManager { self, blocking, timeout, cancel_manager, thread_mode };
+        },
+        py::arg("blocking") = true,
+        py::arg("timeout") = -1.0,
+        py::arg("cancel_manager") = Amulet::VoidCancelManager(),
+        py::arg("thread_mode") = std::make_pair(Amulet::ThreadAccessMode::ReadWrite, Amulet::ThreadShareMode::Unique),
+        py::doc(
+            "An asynchronous context manager to acquire and release the lock from a coroutine.\n"
+            "See :meth:`acquire_async`.\n"
+            "\n"
+            ">>> lock: OrderedLock\n"
+            ">>> async with lock.async_context():\n"
+            ">>>     # code with lock acquired\n"
+            ">>> # the lock will automatically be released here\n"
+            "\n"
+            "Entering the context manager acquires the lock without blocking the event loop and returns its token.\n"
+            "If the lock could not be acquired :class:`LockNotAcquired` is raised.\n"
+            "Exiting the context manager releases the lock.\n"
+            "The context manager cannot be entered again until it has been exited.\n"
+            "\n"
+            ":param blocking:\n"
+            "    If true (default) entering the context manager will wait until the lock is acquired, the timeout is reached or the task is cancelled.\n"
+            "    If false entering the context manager will immediately fail if the lock could not be acquired.\n"
+            ":param timeout:\n"
+            "    The maximum number of seconds to wait for when entering the context manager.\n"
+            "    Has no effect if blocking is False. Default is forever.\n"
+            ":param cancel_manager: A custom object through which acquiring can be cancelled.\n"
+            ":param thread_mode: The permissions for the event loop thread and other parallel threads.\n"
+            ":return: contextlib.AbstractAsyncContextManager[AsyncLockToken]"));
+
+    py::class_<StripedOrderedMutex> StripedOrderedLock(m, "StripedOrderedLock",
+        "A fixed size table of :class:`OrderedLock` instances shared by an unbounded set of keys.\n"
+        "Each key is mapped to one stripe by its hash so the memory used does not depend on the number of keys.\n"
+        "Keys that map to the same stripe block each other. A larger stripe count makes this less likely.\n"
+        "Acquiring two keys that map to the same stripe from one thread raises :class:`Deadlock`.\n"
+        "Use :meth:`acquire_all` to acquire several keys.");
+    StripedOrderedLock.def(
+        py::init<size_t>(),
+        py::arg("stripe_count") = 1024,
+        py::doc(":param stripe_count: The number of stripes. This is rounded up to a power of two."));
+    StripedOrderedLock.def_property_readonly(
+        "stripe_count",
+        &StripedOrderedMutex::get_stripe_count,
+        py::doc("The number of stripes."));
+    StripedOrderedLock.def(
+        "get_lock",
+        [](StripedOrderedMutex& self, py::handle key) -> Amulet::OrderedMutex& {
+            return self.get_mutex(py::hash(key));
+        },
+        py::arg("key"),
+        py::return_value_policy::reference_internal,
+        py::doc(
+            "Get the lock a key maps to.\n"
+            "Thread safe."));
+    StripedOrderedLock.def(
+        "acquire",
+        [](
+            StripedOrderedMutex& self,
+            py::handle key,
+            bool blocking,
+            double timeout,
+            Amulet::AbstractCancelManager& cancel_manager,
+            const std::pair<Amulet::ThreadAccessMode, Amulet::ThreadShareMode>& thread_mode) {
+            auto& mutex = self.get_mutex(py::hash(key));
+            py::gil_scoped_release nogil;
+            return acquire_mutex(mutex, blocking, timeout, cancel_manager, thread_mode);
+        },
+        py::arg("key"),
+        py::arg("blocking") = true,
+        py::arg("timeout") = -1.0,
+        py::arg("cancel_manager") = Amulet::VoidCancelManager(),
+        py::arg("thread_mode") = std::make_pair(Amulet::ThreadAccessMode::ReadWrite, Amulet::ThreadShareMode::Unique),
+        py::doc(
+            "Acquire the lock of a key.\n"
+            "See :meth:`OrderedLock.acquire`.\n"
+            "Thread safe.\n"
+            "\n"
+            ":param key: A hashable key.\n"
+            ":return: True if the lock was acquired otherwise False."));
+    StripedOrderedLock.def(
+        "release",
+        [](StripedOrderedMutex& self, py::handle key) {
+            auto& mutex = self.get_mutex(py::hash(key));
+            py::gil_scoped_release nogil;
+            mutex.unlock();
+        },
+        py::arg("key"),
+        py::doc(
+            "Release the lock of a key.\n"
+            "Must be called by the thread that acquired it.\n"
+            "Thread safe."));
+    StripedOrderedLock.def(
+        "__call__",
+        [](
+            py::object self,
+            py::handle key,
+            bool blocking,
+            double timeout,
+            py::object cancel_manager,
+            const std::pair<Amulet::ThreadAccessMode, Amulet::ThreadShareMode>& thread_mode) {
+            return OrderedLockContextManager {
+                self.cast<StripedOrderedMutex&>().get_mutex(py::hash(key)),
+                blocking,
+                timeout,
+                cancel_manager.cast<Amulet::AbstractCancelManager&>(),
+                thread_mode,
+                self,
+                cancel_manager
+            };
+        },
+        py::arg("key"),
+        py::arg("blocking") = true,
+        py::arg("timeout") = -1.0,
+        py::arg("cancel_manager") = Amulet::VoidCancelManager(),
+        py::arg("thread_mode") = std::make_pair(Amulet::ThreadAccessMode::ReadWrite, Amulet::ThreadShareMode::Unique),
+        py::doc(
+            "A context manager to acquire and release the lock of a key.\n"
+            "See :meth:`OrderedLock.__call__`.\n"
+            "Thread safe.\n"
+            "\n"
+            ":param key: A hashable key.\n"
+            ":return: contextlib.AbstractContextManager[None]"));
+    StripedOrderedLock.def(
+        "acquire_all",
+        [](
+            StripedOrderedMutex& self,
+            const py::iterable& keys,
+            bool blocking,
+            double timeout,
+            Amulet::AbstractCancelManager& cancel_manager,
+            const std::pair<Amulet::ThreadAccessMode, Amulet::ThreadShareMode>& thread_mode) {
+            auto requests = self.get_lock_requests(get_key_hashes(keys), thread_mode.first, thread_mode.second);
+            py::gil_scoped_release nogil;
+            return acquire_requests(requests, blocking, timeout, cancel_manager);
+        },
+        py::arg("keys"),
+        py::arg("blocking") = true,
+        py::arg("timeout") = -1.0,
+        py::arg("cancel_manager") = Amulet::VoidCancelManager(),
+        py::arg("thread_mode") = std::make_pair(Amulet::ThreadAccessMode::ReadWrite, Amulet::ThreadShareMode::Unique),
+        py::doc(
+            "Acquire the locks of several keys without deadlocking.\n"
+            "Keys that map to the same stripe share one lock so it is only acquired once.\n"
+            "Either all of the locks are acquired or none of them are.\n"
+            "The locks must be released with :meth:`release_all` with the same keys.\n"
+            "See :func:`acquire_all`.\n"
+            "Thread safe.\n"
+            "\n"
+            ":param keys: The hashable keys to acquire.\n"
+            ":param blocking:\n"
+            "    If true (default) this will block until all locks are acquired, the timeout is reached or the task is cancelled.\n"
+            "    If false and the locks cannot be acquired on the first try, this returns False.\n"
+            ":param timeout: The maximum number of seconds to block for. Has no effect if blocking is False. Default is forever.\n"
+            ":param cancel_manager: A custom object through which acquiring can be cancelled.\n"
+            ":param thread_mode: The permissions for the current and other parallel threads.\n"
+            ":return: True if all locks were acquired otherwise False."));
+    StripedOrderedLock.def(
+        "release_all",
+        [](StripedOrderedMutex& self, const py::iterable& keys) {
+            auto hashes = get_key_hashes(keys);
+            py::gil_scoped_release nogil;
+            self.unlock_all(hashes);
+        },
+        py::arg("keys"),
+        py::doc(
+            "Release the locks of several keys acquired with :meth:`acquire_all`.\n"
+            "Must be called by the thread that acquired them.\n"
+            "Thread safe."));
+
+    m.def(
+        "acquire_all",
+        &acquire_all,
+        py::arg("locks"),
+        py::arg("blocking") = true,
+        py::arg("timeout") = -1.0,
+        py::arg("cancel_manager") = Amulet::VoidCancelManager(),
+        py::call_guard<py::gil_scoped_release>(),
+        py::doc(
+            "Acquire several locks, each in its own thread mode, without deadlocking.\n"
+            "Either all of the locks are acquired or none of them are.\n"
+            "While waiting for one lock no other lock is held so this cannot deadlock with another call.\n"
+            "Each lock must be released by the caller.\n"
+            "Thread safe.\n"
+            "\n"
+            ">>> if acquire_all([(lock_a, (ThreadAccessMode.Read, ThreadShareMode.SharedReadOnly)), (lock_b, (ThreadAccessMode.ReadWrite, ThreadShareMode.Unique))]):\n"
+            ">>>     try:\n"
+            ">>>         # code with both locks acquired\n"
+            ">>>     finally:\n"
+            ">>>         lock_a.release()\n"
+            ">>>         lock_b.release()\n"
+            "\n"
+            ":param locks: The locks to acquire and the permissions for the current and other parallel threads.\n"
+            ":param blocking:\n"
+            "    If true (default) this will block until all locks are acquired, the timeout is reached or the task is cancelled.\n"
+            "    If false and the locks cannot be acquired on the first try, this returns False.\n"
+            ":param timeout: The maximum number of seconds to block for. Has no effect if blocking is False. Default is forever.\n"
+            ":param cancel_manager: A custom object through which acquiring can be cancelled.\n"
+            ":return: True if all locks were acquired otherwise False.\n"
+            ":raises Deadlock: If a lock is requested more than once or is already held by this thread and is not re-entrant."));
+    m.def(
+        "get_ordered_lock_profiles",
+        [](std::optional<size_t> count) {
+            return Amulet::get_ordered_mutex_profiles(count.value_or(std::numeric_limits<size_t>::max()));
+        },
+        py::arg("count") = py::none(),
+        py::doc(
+            "Get the contention statistics of the locks that are being profiled.\n"
+            "The most contended locks are first, ordered by the total time acquire calls waited.\n"
+            "Thread safe.\n"
+            "\n"
+            ":param count: The maximum number of profiles to return. Default is all.\n"
+            ":return: A list of profiles."));
+
+    py::class_<Amulet::CancellableMutex<std::mutex>> Lock(m, "Lock",
+        "A wrapper for std::mutex.\n"
+        "Acquiring supports timeouts and cancellation.");
     Lock.def(py::init());
     Lock.def(
         "__enter__",
-        &std::mutex::lock,
+        [](Amulet::CancellableMutex<std::mutex>& self) {
+            self.lock();
+        },
         py::call_guard<py::gil_scoped_release>());
     Lock.def(
         "__exit__",
-        [](std::mutex& self, py::object, py::object, py::object) {
+        [](Amulet::CancellableMutex<std::mutex>& self, py::object, py::object, py::object) {
             py::gil_scoped_release nogil;
             self.unlock();
         },
@@ -267,31 +1136,39 @@ void init_lock(py::module m_parent)
         py::arg("exc_tb"));
     Lock.def(
         "acquire",
-        [](std::mutex& self, bool blocking) {
-            if (blocking) {
-                self.lock();
-                return true;
-            } else {
-                return self.try_lock();
-            }
-        },
+        &acquire_cancellable_mutex<false, std::mutex>,
         py::arg("blocking") = true,
-        py::call_guard<py::gil_scoped_release>());
+        py::arg("timeout") = -1.0,
+        py::arg("cancel_manager") = Amulet::VoidCancelManager(),
+        py::call_guard<py::gil_scoped_release>(),
+        py::doc(
+            "Acquire the lock.\n"
+            "Thread safe.\n"
+            "\n"
+            ":param blocking:\n"
+            "    If true (default) this will block until the lock is acquired, the timeout is reached or the task is cancelled.\n"
+            "    If false and the lock cannot be acquired on the first try, this returns False.\n"
+            ":param timeout: The maximum number of seconds to block for. Has no effect if blocking is False. Default is forever.\n"
+            ":param cancel_manager: A custom object through which acquiring can be cancelled.\n"
+            ":return: True if the lock was acquired otherwise False."));
     Lock.def(
         "release",
-        &std::mutex::unlock,
+        &Amulet::CancellableMutex<std::mutex>::unlock,
         py::call_guard<py::gil_scoped_release>());
 
-    py::class_<std::recursive_mutex> RLock(m, "RLock",
-        "A wrapper for std::recursive_mutex.");
+    py::class_<Amulet::CancellableMutex<std::recursive_mutex>> RLock(m, "RLock",
+        "A wrapper for std::recursive_mutex.\n"
+        "Acquiring supports timeouts and cancellation.");
     RLock.def(py::init());
     RLock.def(
         "__enter__",
-        &std::recursive_mutex::lock,
+        [](Amulet::CancellableMutex<std::recursive_mutex>& self) {
+            self.lock();
+        },
         py::call_guard<py::gil_scoped_release>());
     RLock.def(
         "__exit__",
-        [](std::recursive_mutex& self, py::object, py::object, py::object) {
+        [](Amulet::CancellableMutex<std::recursive_mutex>& self, py::object, py::object, py::object) {
             py::gil_scoped_release nogil;
             self.unlock();
         },
@@ -300,43 +1177,54 @@ void init_lock(py::module m_parent)
         py::arg("exc_tb"));
     RLock.def(
         "acquire",
-        [](std::recursive_mutex& self, bool blocking) {
-            if (blocking) {
-                self.lock();
-                return true;
-            } else {
-                return self.try_lock();
-            }
-        },
+        &acquire_cancellable_mutex<false, std::recursive_mutex>,
         py::arg("blocking") = true,
-        py::call_guard<py::gil_scoped_release>());
+        py::arg("timeout") = -1.0,
+        py::arg("cancel_manager") = Amulet::VoidCancelManager(),
+        py::call_guard<py::gil_scoped_release>(),
+        py::doc(
+            "Acquire the lock.\n"
+            "Thread safe.\n"
+            "\n"
+            ":param blocking:\n"
+            "    If true (default) this will block until the lock is acquired, the timeout is reached or the task is cancelled.\n"
+            "    If false and the lock cannot be acquired on the first try, this returns False.\n"
+            ":param timeout: The maximum number of seconds to block for. Has no effect if blocking is False. Default is forever.\n"
+            ":param cancel_manager: A custom object through which acquiring can be cancelled.\n"
+            ":return: True if the lock was acquired otherwise False."));
     RLock.def(
         "release",
-        &std::recursive_mutex::unlock,
+        &Amulet::CancellableMutex<std::recursive_mutex>::unlock,
         py::call_guard<py::gil_scoped_release>());
 
-    py::class_<std::shared_mutex> SharedLock(m, "SharedLock",
-        "A wrapper for std::shared_mutex.");
+    py::class_<Amulet::CancellableMutex<std::shared_mutex>> SharedLock(m, "SharedLock",
+        "A wrapper for std::shared_mutex.\n"
+        "Acquiring supports timeouts and cancellation.");
     SharedLock.def(py::init());
     SharedLock.def(
         "acquire_unique",
-        [](std::shared_mutex& self, bool blocking) {
-            if (blocking) {
-                self.lock();
-                return true;
-            } else {
-                return self.try_lock();
-            }
-        },
+        &acquire_cancellable_mutex<false, std::shared_mutex>,
         py::arg("blocking") = true,
-        py::call_guard<py::gil_scoped_release>());
+        py::arg("timeout") = -1.0,
+        py::arg("cancel_manager") = Amulet::VoidCancelManager(),
+        py::call_guard<py::gil_scoped_release>(),
+        py::doc(
+            "Acquire the lock in unique mode.\n"
+            "Thread safe.\n"
+            "\n"
+            ":param blocking:\n"
+            "    If true (default) this will block until the lock is acquired, the timeout is reached or the task is cancelled.\n"
+            "    If false and the lock cannot be acquired on the first try, this returns False.\n"
+            ":param timeout: The maximum number of seconds to block for. Has no effect if blocking is False. Default is forever.\n"
+            ":param cancel_manager: A custom object through which acquiring can be cancelled.\n"
+            ":return: True if the lock was acquired otherwise False."));
     SharedLock.def(
         "release_unique",
-        &std::shared_mutex::unlock,
+        &Amulet::CancellableMutex<std::shared_mutex>::unlock,
         py::call_guard<py::gil_scoped_release>());
     SharedLock.def(
         "unique",
-        [](std::shared_mutex& self) {
+        [](Amulet::CancellableMutex<std::shared_mutex>& self) {
             return pyext::contextlib::make_context_manager<void, std::optional<bool>>(
                 [&self]() -> void {
                     py::gil_scoped_release nogil;
@@ -351,23 +1239,28 @@ void init_lock(py::module m_parent)
         py::keep_alive<0, 1>());
     SharedLock.def(
         "acquire_shared",
-        [](std::shared_mutex& self, bool blocking) {
-            if (blocking) {
-                self.lock_shared();
-                return true;
-            } else {
-                return self.try_lock_shared();
-            }
-        },
+        &acquire_cancellable_mutex<true, std::shared_mutex>,
         py::arg("blocking") = true,
-        py::call_guard<py::gil_scoped_release>());
+        py::arg("timeout") = -1.0,
+        py::arg("cancel_manager") = Amulet::VoidCancelManager(),
+        py::call_guard<py::gil_scoped_release>(),
+        py::doc(
+            "Acquire the lock in shared mode.\n"
+            "Thread safe.\n"
+            "\n"
+            ":param blocking:\n"
+            "    If true (default) this will block until the lock is acquired, the timeout is reached or the task is cancelled.\n"
+            "    If false and the lock cannot be acquired on the first try, this returns False.\n"
+            ":param timeout: The maximum number of seconds to block for. Has no effect if blocking is False. Default is forever.\n"
+            ":param cancel_manager: A custom object through which acquiring can be cancelled.\n"
+            ":return: True if the lock was acquired otherwise False."));
     SharedLock.def(
         "release_shared",
-        &std::shared_mutex::unlock_shared,
+        &Amulet::CancellableMutex<std::shared_mutex>::unlock_shared,
         py::call_guard<py::gil_scoped_release>());
     SharedLock.def(
         "shared",
-        [](std::shared_mutex& self) {
+        [](Amulet::CancellableMutex<std::shared_mutex>& self) {
             return pyext::contextlib::make_context_manager<void, std::optional<bool>>(
                 [&self]() -> void {
                     py::gil_scoped_release nogil;
@@ -1,21 +1,34 @@
 from __future__ import annotations
 
+import collections.abc
 import contextlib
 import typing
 
 import amulet.utils.task_manager.cancel_manager
 
 __all__ = [
+    "AsyncLockToken",
     "Deadlock",
     "Lock",
     "LockNotAcquired",
     "OrderedLock",
+    "OrderedLockProfile",
+    "OrderedLockSpinStats",
     "RLock",
     "SharedLock",
+    "StripedOrderedLock",
     "ThreadAccessMode",
     "ThreadShareMode",
+    "acquire_all",
+    "get_ordered_lock_profiles",
 ]
 
+class AsyncLockToken:
+    """
+    The ownership of an :class:`OrderedLock` acquired by a coroutine.
+    Pass it to :meth:`OrderedLock.release_async` to release the lock.
+    """
+
 class Deadlock(RuntimeError):
     """
     An exception raised in some deadlock cases.
@@ -24,6 +37,7 @@ class Deadlock(RuntimeError):
 class Lock:
     """
     A wrapper for std::mutex.
+    Acquiring supports timeouts and cancellation.
     """
 
     def __enter__(self) -> None: ...
@@ -31,7 +45,24 @@ class Lock:
         self, exc_type: typing.Any, exc_val: typing.Any, exc_tb: typing.Any
     ) -> None: ...
     def __init__(self) -> None: ...
-    def acquire(self, blocking: bool = True) -> bool: ...
+    def acquire(
+        self,
+        blocking: bool = True,
+        timeout: float = -1.0,
+        cancel_manager: amulet.utils.task_manager.cancel_manager.AbstractCancelManager = ...,
+    ) -> bool:
+        """
+        Acquire the lock.
+        Thread safe.
+
+        :param blocking:
+            If true (default) this will block until the lock is acquired, the timeout is reached or the task is cancelled.
+            If false and the lock cannot be acquired on the first try, this returns False.
+        :param timeout: The maximum number of seconds to block for. Has no effect if blocking is False. Default is forever.
+        :param cancel_manager: A custom object through which acquiring can be cancelled.
+        :return: True if the lock was acquired otherwise False.
+        """
+
     def release(self) -> None: ...
 
 class LockNotAcquired(RuntimeError):
@@ -46,6 +77,22 @@ class OrderedLock:
     It also supports cancelling waiting through a CancelManager instance.
     """
 
+    @typing.overload
+    def __call__(self) -> contextlib.AbstractContextManager[None, bool | None]:
+        """
+        A context manager to acquire and release the lock in read write unique mode.
+        The lock is its own context manager for the default arguments so this does not allocate.
+        Thread safe.
+
+        >>> lock: OrderedLock
+        >>> with lock():
+        >>>     # code with lock acquired
+        >>> # the lock will automatically be released here
+
+        :return: contextlib.AbstractContextManager[None]
+        """
+
+    @typing.overload
     def __call__(
         self,
         blocking: bool = True,
@@ -55,6 +102,7 @@ class OrderedLock:
     ) -> contextlib.AbstractContextManager[None, bool | None]:
         """
         A context manager to acquire and release the lock.
+        The context manager can be reused. Create it once outside of a loop to avoid the cost of creating it.
         Thread safe.
 
         >>> lock: OrderedLock
@@ -79,7 +127,34 @@ class OrderedLock:
         :return: contextlib.AbstractContextManager[None]
         """
 
-    def __init__(self) -> None: ...
+    def __enter__(self) -> None:
+        """
+        Acquire the lock in read write unique mode.
+        This blocks until the lock is acquired.
+        Use :meth:`__call__` for other modes.
+
+        >>> lock: OrderedLock
+        >>> with lock:
+        >>>     # code with lock acquired
+        >>> # the lock will automatically be released here
+        """
+
+    def __exit__(
+        self, exc_type: typing.Any, exc_val: typing.Any, exc_tb: typing.Any
+    ) -> bool | None:
+        """
+        Release the lock.
+        """
+
+    def __init__(self, reentrant: bool = False) -> None:
+        """
+        :param reentrant: If true a thread that holds the lock can acquire it again in a mode that is covered by the held mode.
+            The held mode must have at least the access of the new mode and block other threads at least as much.
+            The lock must be released as many times as it was acquired.
+            Acquiring in a mode that is not covered raises :class:`Deadlock`. Use :meth:`upgrade` to change the mode.
+            If false (default) acquiring the lock again raises :class:`Deadlock`.
+        """
+
     def acquire(
         self,
         blocking: bool = True,
@@ -105,6 +180,110 @@ class OrderedLock:
         :return: True if the lock was acquired otherwise False.
         """
 
+    def acquire_async(
+        self,
+        blocking: bool = True,
+        timeout: float = -1.0,
+        cancel_manager: amulet.utils.task_manager.cancel_manager.AbstractCancelManager = ...,
+        thread_mode: tuple[ThreadAccessMode, ThreadShareMode] = ...,
+    ) -> collections.abc.Awaitable[AsyncLockToken | None]:
+        """
+        Acquire the lock from a coroutine without blocking the event loop.
+        This must be called from the thread running the event loop.
+        The coroutine waits in the same queue as threads calling :meth:`acquire`.
+        Once granted the lock is held by the returned token rather than the event loop thread.
+        It must be released by passing the token to :meth:`release_async`.
+        Unlike :meth:`acquire` this does not raise :class:`Deadlock` if the event loop thread already holds the lock
+        because it may be held by another coroutine.
+        If the awaiting task is cancelled the lock is not acquired.
+
+        >>> lock: OrderedLock
+        >>> token = await lock.acquire_async()
+        >>> if token is not None:
+        >>>     try:
+        >>>         # code with lock acquired
+        >>>     finally:
+        >>>         lock.release_async(token)
+
+        :param blocking:
+            If true (default) this will wait until the lock is acquired, the timeout is reached or the task is cancelled.
+            If false and the lock cannot be acquired on the first try, this returns False.
+        :param timeout: The maximum number of seconds to wait for. Has no effect if blocking is False. Default is forever.
+        :param cancel_manager: A custom object through which acquiring can be cancelled.
+        :param thread_mode: The permissions for the event loop thread and other parallel threads.
+        :return: An awaitable returning a token if the lock was acquired otherwise None.
+        """
+
+    def async_context(
+        self,
+        blocking: bool = True,
+        timeout: float = -1.0,
+        cancel_manager: amulet.utils.task_manager.cancel_manager.AbstractCancelManager = ...,
+        thread_mode: tuple[ThreadAccessMode, ThreadShareMode] = ...,
+    ) -> contextlib.AbstractAsyncContextManager[AsyncLockToken]:
+        """
+        An asynchronous context manager to acquire and release the lock from a coroutine.
+        See :meth:`acquire_async`.
+
+        >>> lock: OrderedLock
+        >>> async with lock.async_context():
+        >>>     # code with lock acquired
+        >>> # the lock will automatically be released here
+
+        Entering the context manager acquires the lock without blocking the event loop and returns its token.
+        If the lock could not be acquired :class:`LockNotAcquired` is raised.
+        Exiting the context manager releases the lock.
+        The context manager cannot be entered again until it has been exited.
+
+        :param blocking:
+            If true (default) entering the context manager will wait until the lock is acquired, the timeout is reached or the task is cancelled.
+            If false entering the context manager will immediately fail if the lock could not be acquired.
+        :param timeout:
+            The maximum number of seconds to wait for when entering the context manager.
+            Has no effect if blocking is False. Default is forever.
+        :param cancel_manager: A custom object through which acquiring can be cancelled.
+        :param thread_mode: The permissions for the event loop thread and other parallel threads.
+        """
+
+    def disable_profiling(self) -> None:
+        """
+        Stop recording contention statistics and remove the lock from the global registry.
+        The recorded statistics are kept.
+        Thread safe.
+        """
+
+    def downgrade(
+        self, thread_mode: tuple[ThreadAccessMode, ThreadShareMode] = ...
+    ) -> None:
+        """
+        Change the mode the lock is held in by this thread to a mode covered by the held mode without releasing it.
+        The new mode must have at most the access of the held mode and block other threads at most as much.
+        This never blocks. Threads waiting to acquire the lock that can now acquire it are woken.
+        Must be called by the thread that acquired the lock.
+        Thread safe.
+
+        :param thread_mode: The new permissions for the current and other parallel threads.
+        :raises ValueError: If the new mode is not covered by the held mode.
+        """
+
+    def enable_profiling(self, name: str = "") -> None:
+        """
+        Start recording contention statistics for this lock and add it to the global registry.
+        Profiling adds a small cost to each acquire call so it is disabled by default.
+        If profiling is already enabled the lock is renamed and the statistics are kept.
+        Thread safe.
+
+        :param name: The name used to identify the lock in :func:`get_ordered_lock_profiles`.
+        """
+
+    @staticmethod
+    def get_default_max_spin() -> int:
+        """
+        Get the global default max_spin.
+        This is zero on single core machines and 100 otherwise.
+        Thread safe.
+        """
+
     def release(self) -> None:
         """
         Release the lock.
@@ -114,9 +293,182 @@ class OrderedLock:
         Only use this if you know what you are doing. Consider using the context manager instead
         """
 
+    def release_async(self, token: AsyncLockToken) -> None:
+        """
+        Release a lock acquired by :meth:`acquire_async`.
+        This may be called from any thread.
+        Thread safe.
+
+        :param token: The token returned by :meth:`acquire_async`.
+        :raises RuntimeError: If the token has already been released.
+        :raises ValueError: If the token was issued by a different lock.
+        """
+
+    def reset_profile(self) -> None:
+        """
+        Reset the recorded contention statistics to zero.
+        Thread safe.
+        """
+
+    def reset_spin_stats(self) -> None:
+        """
+        Reset the spin statistics to zero.
+        Thread safe.
+        """
+
+    @staticmethod
+    def set_default_max_spin(max_spin: int) -> None:
+        """
+        Set the global default max_spin used by locks without their own value.
+        Thread safe.
+        """
+
+    def upgrade(
+        self,
+        blocking: bool = True,
+        timeout: float = -1.0,
+        cancel_manager: amulet.utils.task_manager.cancel_manager.AbstractCancelManager = ...,
+        thread_mode: tuple[ThreadAccessMode, ThreadShareMode] = ...,
+    ) -> bool:
+        """
+        Change the mode the lock is held in by this thread without releasing it.
+        No other thread can acquire the lock in between.
+        This waits for the other threads holding the lock and takes priority over threads waiting to acquire it.
+        Must be called by the thread that acquired the lock.
+        Thread safe.
+
+        :param blocking:
+            If true (default) this will block until the mode is changed, the timeout is reached or the task is cancelled.
+            If false and the mode cannot be changed on the first try, this returns False.
+        :param timeout: The maximum number of seconds to block for. Has no effect if blocking is False. Default is forever.
+        :param cancel_manager: A custom object through which upgrading can be cancelled.
+        :param thread_mode: The new permissions for the current and other parallel threads.
+        :return: True if the mode was changed otherwise False. The original mode is kept if False.
+        :raises Deadlock: If another thread is already waiting to upgrade.
+        """
+
+    @property
+    def max_spin(self) -> int | None:
+        """
+        The maximum number of times a contended blocking acquire checks the lock before waiting in the queue.
+        Spinning avoids the cost of sleeping and waking when the lock is held for a short time.
+        The number of checks adapts to how long recent successful spins took.
+        Zero disables spinning. None (default) uses the global default.
+        Thread safe.
+        """
+
+    @max_spin.setter
+    def max_spin(self, arg1: int | None) -> None: ...
+    @property
+    def profile(self) -> OrderedLockProfile:
+        """
+        The recorded contention statistics.
+        Thread safe.
+        """
+
+    @property
+    def profiling(self) -> bool:
+        """
+        Is profiling enabled.
+        """
+
+    @property
+    def reentrant(self) -> bool:
+        """
+        Is the lock re-entrant.
+        """
+
+    @property
+    def spin_stats(self) -> OrderedLockSpinStats:
+        """
+        Statistics about the spinning phase of contended acquire calls.
+        These can be used to find if spinning helps for a given workload.
+        Thread safe.
+        """
+
+class OrderedLockProfile:
+    """
+    Contention statistics of an OrderedLock.
+    These are only recorded while profiling is enabled.
+    """
+
+    @property
+    def acquire_count(self) -> dict[tuple[ThreadAccessMode, ThreadShareMode], int]:
+        """
+        The number of successful acquire calls for each thread mode.
+        """
+
+    @property
+    def cancel_count(self) -> int:
+        """
+        The number of acquire calls that were cancelled.
+        """
+
+    @property
+    def contended_count(self) -> int:
+        """
+        The number of successful acquire calls that could not acquire the lock immediately.
+        """
+
+    @property
+    def hold_time_histogram(self) -> list[int]:
+        """
+        The number of times the lock was held for each duration.
+        Bucket i counts hold times of at least 2**i nanoseconds and less than 2**(i+1) nanoseconds.
+        The first bucket also counts zero and the last bucket also counts longer hold times.
+        """
+
+    @property
+    def max_wait_time(self) -> float:
+        """
+        The longest number of seconds a contended acquire call waited before acquiring the lock.
+        """
+
+    @property
+    def name(self) -> str:
+        """
+        The name the lock was registered with when profiling was enabled.
+        """
+
+    @property
+    def timeout_count(self) -> int:
+        """
+        The number of acquire calls that timed out.
+        """
+
+    @property
+    def total_wait_time(self) -> float:
+        """
+        The total number of seconds contended acquire calls waited before acquiring the lock.
+        """
+
+class OrderedLockSpinStats:
+    """
+    Statistics about the spinning phase of contended OrderedLock acquire calls.
+    """
+
+    @property
+    def park_count(self) -> int:
+        """
+        The number of blocking acquire calls that waited in the queue.
+        """
+
+    @property
+    def spin_count(self) -> int:
+        """
+        The number of blocking acquire calls that could not acquire the lock immediately and spun.
+        """
+
+    @property
+    def spin_success_count(self) -> int:
+        """
+        The number of spinning acquire calls that acquired the lock while spinning.
+        """
+
 class RLock:
     """
     A wrapper for std::recursive_mutex.
+    Acquiring supports timeouts and cancellation.
     """
 
     def __enter__(self) -> None: ...
@@ -124,22 +476,176 @@ class RLock:
         self, exc_type: typing.Any, exc_val: typing.Any, exc_tb: typing.Any
     ) -> None: ...
     def __init__(self) -> None: ...
-    def acquire(self, blocking: bool = True) -> bool: ...
+    def acquire(
+        self,
+        blocking: bool = True,
+        timeout: float = -1.0,
+        cancel_manager: amulet.utils.task_manager.cancel_manager.AbstractCancelManager = ...,
+    ) -> bool:
+        """
+        Acquire the lock.
+        Thread safe.
+
+        :param blocking:
+            If true (default) this will block until the lock is acquired, the timeout is reached or the task is cancelled.
+            If false and the lock cannot be acquired on the first try, this returns False.
+        :param timeout: The maximum number of seconds to block for. Has no effect if blocking is False. Default is forever.
+        :param cancel_manager: A custom object through which acquiring can be cancelled.
+        :return: True if the lock was acquired otherwise False.
+        """
+
     def release(self) -> None: ...
 
 class SharedLock:
     """
     A wrapper for std::shared_mutex.
+    Acquiring supports timeouts and cancellation.
     """
 
     def __init__(self) -> None: ...
-    def acquire_shared(self, blocking: bool = True) -> bool: ...
-    def acquire_unique(self, blocking: bool = True) -> bool: ...
+    def acquire_shared(
+        self,
+        blocking: bool = True,
+        timeout: float = -1.0,
+        cancel_manager: amulet.utils.task_manager.cancel_manager.AbstractCancelManager = ...,
+    ) -> bool:
+        """
+        Acquire the lock in shared mode.
+        Thread safe.
+
+        :param blocking:
+            If true (default) this will block until the lock is acquired, the timeout is reached or the task is cancelled.
+            If false and the lock cannot be acquired on the first try, this returns False.
+        :param timeout: The maximum number of seconds to block for. Has no effect if blocking is False. Default is forever.
+        :param cancel_manager: A custom object through which acquiring can be cancelled.
+        :return: True if the lock was acquired otherwise False.
+        """
+
+    def acquire_unique(
+        self,
+        blocking: bool = True,
+        timeout: float = -1.0,
+        cancel_manager: amulet.utils.task_manager.cancel_manager.AbstractCancelManager = ...,
+    ) -> bool:
+        """
+        Acquire the lock in unique mode.
+        Thread safe.
+
+        :param blocking:
+            If true (default) this will block until the lock is acquired, the timeout is reached or the task is cancelled.
+            If false and the lock cannot be acquired on the first try, this returns False.
+        :param timeout: The maximum number of seconds to block for. Has no effect if blocking is False. Default is forever.
+        :param cancel_manager: A custom object through which acquiring can be cancelled.
+        :return: True if the lock was acquired otherwise False.
+        """
+
     def release_shared(self) -> None: ...
     def release_unique(self) -> None: ...
     def shared(self) -> contextlib.AbstractContextManager[None, bool | None]: ...
     def unique(self) -> contextlib.AbstractContextManager[None, bool | None]: ...
 
+class StripedOrderedLock:
+    """
+    A fixed size table of :class:`OrderedLock` instances shared by an unbounded set of keys.
+    Each key is mapped to one stripe by its hash so the memory used does not depend on the number of keys.
+    Keys that map to the same stripe block each other. A larger stripe count makes this less likely.
+    Acquiring two keys that map to the same stripe from one thread raises :class:`Deadlock`.
+    Use :meth:`acquire_all` to acquire several keys.
+    """
+
+    def __call__(
+        self,
+        key: collections.abc.Hashable,
+        blocking: bool = True,
+        timeout: float = -1.0,
+        cancel_manager: amulet.utils.task_manager.cancel_manager.AbstractCancelManager = ...,
+        thread_mode: tuple[ThreadAccessMode, ThreadShareMode] = ...,
+    ) -> contextlib.AbstractContextManager[None, bool | None]:
+        """
+        A context manager to acquire and release the lock of a key.
+        See :meth:`OrderedLock.__call__`.
+        Thread safe.
+
+        :param key: A hashable key.
+        :return: contextlib.AbstractContextManager[None]
+        """
+
+    def __init__(self, stripe_count: int = 1024) -> None:
+        """
+        :param stripe_count: The number of stripes. This is rounded up to a power of two.
+        """
+
+    def acquire(
+        self,
+        key: collections.abc.Hashable,
+        blocking: bool = True,
+        timeout: float = -1.0,
+        cancel_manager: amulet.utils.task_manager.cancel_manager.AbstractCancelManager = ...,
+        thread_mode: tuple[ThreadAccessMode, ThreadShareMode] = ...,
+    ) -> bool:
+        """
+        Acquire the lock of a key.
+        See :meth:`OrderedLock.acquire`.
+        Thread safe.
+
+        :param key: A hashable key.
+        :return: True if the lock was acquired otherwise False.
+        """
+
+    def acquire_all(
+        self,
+        keys: collections.abc.Iterable[collections.abc.Hashable],
+        blocking: bool = True,
+        timeout: float = -1.0,
+        cancel_manager: amulet.utils.task_manager.cancel_manager.AbstractCancelManager = ...,
+        thread_mode: tuple[ThreadAccessMode, ThreadShareMode] = ...,
+    ) -> bool:
+        """
+        Acquire the locks of several keys without deadlocking.
+        Keys that map to the same stripe share one lock so it is only acquired once.
+        Either all of the locks are acquired or none of them are.
+        The locks must be released with :meth:`release_all` with the same keys.
+        See :func:`acquire_all`.
+        Thread safe.
+
+        :param keys: The hashable keys to acquire.
+        :param blocking:
+            If true (default) this will block until all locks are acquired, the timeout is reached or the task is cancelled.
+            If false and the locks cannot be acquired on the first try, this returns False.
+        :param timeout: The maximum number of seconds to block for. Has no effect if blocking is False. Default is forever.
+        :param cancel_manager: A custom object through which acquiring can be cancelled.
+        :param thread_mode: The permissions for the current and other parallel threads.
+        :return: True if all locks were acquired otherwise False.
+        """
+
+    def get_lock(self, key: collections.abc.Hashable) -> OrderedLock:
+        """
+        Get the lock a key maps to.
+        Thread safe.
+        """
+
+    def release(self, key: collections.abc.Hashable) -> None:
+        """
+        Release the lock of a key.
+        Must be called by the thread that acquired it.
+        Thread safe.
+        """
+
+    def release_all(
+        self, keys: collections.abc.Iterable[collections.abc.Hashable]
+    ) -> None:
+        """
+        Release the locks of several keys acquired with :meth:`acquire_all`.
+        Must be called by the thread that acquired them.
+        Thread safe.
+        """
+
+    @property
+    def stripe_count(self) -> int:
+        """
+        The number of stripes.
+        """
+
 class ThreadAccessMode:
     """
     Members:
@@ -206,3 +712,45 @@ class ThreadShareMode:
     def name(self) -> str: ...
     @property
     def value(self) -> int: ...
+
+def acquire_all(
+    locks: collections.abc.Sequence[
+        tuple[OrderedLock, tuple[ThreadAccessMode, ThreadShareMode]]
+    ],
+    blocking: bool = True,
+    timeout: float = -1.0,
+    cancel_manager: amulet.utils.task_manager.cancel_manager.AbstractCancelManager = ...,
+) -> bool:
+    """
+    Acquire several locks, each in its own thread mode, without deadlocking.
+    Either all of the locks are acquired or none of them are.
+    While waiting for one lock no other lock is held so this cannot deadlock with another call.
+    Each lock must be released by the caller.
+    Thread safe.
+
+    >>> if acquire_all([(lock_a, (ThreadAccessMode.Read, ThreadShareMode.SharedReadOnly)), (lock_b, (ThreadAccessMode.ReadWrite, ThreadShareMode.Unique))]):
+    >>>     try:
+    >>>         # code with both locks acquired
+    >>>     finally:
+    >>>         lock_a.release()
+    >>>         lock_b.release()
+
+    :param locks: The locks to acquire and the permissions for the current and other parallel threads.
+    :param blocking:
+        If true (default) this will block until all locks are acquired, the timeout is reached or the task is cancelled.
+        If false and the locks cannot be acquired on the first try, this returns False.
+    :param timeout: The maximum number of seconds to block for. Has no effect if blocking is False. Default is forever.
+    :param cancel_manager: A custom object through which acquiring can be cancelled.
+    :return: True if all locks were acquired otherwise False.
+    :raises Deadlock: If a lock is requested more than once or is already held by this thread and is not re-entrant.
+    """
+
+def get_ordered_lock_profiles(count: int | None = None) -> list[OrderedLockProfile]:
+    """
+    Get the contention statistics of the locks that are being profiled.
+    The most contended locks are first, ordered by the total time acquire calls waited.
+    Thread safe.
+
+    :param count: The maximum number of profiles to return. Default is all.
+    :return: A list of profiles.
+    """
@@ -0,0 +1,88 @@
+#include <unordered_map>
+
+#include "mutex.hpp"
+
+namespace Amulet {
+namespace detail {
+
+    std::vector<LockedOrderedMutex>& get_locked_ordered_mutexes()
+    {
+        // Reserve space so that locking a few mutexes does not allocate.
+        thread_local std::vector<LockedOrderedMutex> locked_mutexes = [] {
+            std::vector<LockedOrderedMutex> locked_mutexes;
+            locked_mutexes.reserve(8);
+            return locked_mutexes;
+        }();
+        return locked_mutexes;
+    }
+
+    std::atomic<std::uint32_t>& get_ordered_mutex_default_max_spin()
+    {
+        // Spinning cannot help if there is no other core to release the mutex.
+        static std::atomic<std::uint32_t> default_max_spin = std::thread::hardware_concurrency() == 1 ? 0 : 100;
+        return default_max_spin;
+    }
+
+    // The profiled mutexes and their names.
+    static std::unordered_map<const OrderedMutex*, std::string>& get_profiled_ordered_mutexes()
+    {
+        static std::unordered_map<const OrderedMutex*, std::string> profiled_mutexes;
+        return profiled_mutexes;
+    }
+
+    std::recursive_mutex& get_ordered_mutex_registry_mutex()
+    {
+        static std::recursive_mutex registry_mutex;
+        return registry_mutex;
+    }
+
+    void register_profiled_ordered_mutex(const OrderedMutex& mutex, const std::string& name)
+    {
+        std::lock_guard lock(get_ordered_mutex_registry_mutex());
+        get_profiled_ordered_mutexes()[&mutex] = name;
+    }
+
+    void unregister_profiled_ordered_mutex(const OrderedMutex& mutex)
+    {
+        std::lock_guard lock(get_ordered_mutex_registry_mutex());
+        get_profiled_ordered_mutexes().erase(&mutex);
+    }
+
+    std::string get_profiled_ordered_mutex_name(const OrderedMutex& mutex)
+    {
+        std::lock_guard lock(get_ordered_mutex_registry_mutex());
+        auto& profiled_mutexes = get_profiled_ordered_mutexes();
+        auto it = profiled_mutexes.find(&mutex);
+        if (it == profiled_mutexes.end()) {
+            return "";
+        }
+        return it->second;
+    }
+
+} // namespace detail
+
+std::vector<OrderedMutexProfile> get_ordered_mutex_profiles(std::size_t count)
+{
+    std::vector<OrderedMutexProfile> profiles;
+    {
+        // The registry mutex stops the mutexes being destroyed while they are read.
+        std::lock_guard lock(detail::get_ordered_mutex_registry_mutex());
+        auto& profiled_mutexes = detail::get_profiled_ordered_mutexes();
+        profiles.reserve(profiled_mutexes.size());
+        for (const auto& [mutex, name] : profiled_mutexes) {
+            profiles.push_back(mutex->get_profile());
+        }
+    }
+    std::sort(profiles.begin(), profiles.end(), [](const OrderedMutexProfile& a, const OrderedMutexProfile& b) {
+        if (a.total_wait_time != b.total_wait_time) {
+            return a.total_wait_time > b.total_wait_time;
+        }
+        return a.contended_count > b.contended_count;
+    });
+    if (count < profiles.size()) {
+        profiles.resize(count);
+    }
+    return profiles;
+}
+
+} // namespace Amulet
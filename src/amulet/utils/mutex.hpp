@@ -1,16 +1,29 @@
 #pragma once
 
+#include <algorithm>
+#include <array>
+#include <atomic>
+#include <bit>
 #include <chrono>
 #include <condition_variable>
-#include <list>
-#include <map>
+#include <cstdint>
+#include <functional>
+#include <limits>
+#include <memory>
 #include <mutex>
 #include <optional>
+#include <span>
 #include <stdexcept>
 #include <string>
 #include <thread>
 #include <tuple>
 #include <type_traits>
+#include <utility>
+#include <vector>
+
+#if defined(_MSC_VER) && (defined(_M_X64) || defined(_M_IX86) || defined(_M_ARM64))
+#include <intrin.h>
+#endif
 
 #include <amulet/utils/dll.hpp>
 #include <amulet/utils/task_manager/cancel_manager.hpp>
@@ -48,6 +61,168 @@ enum class ThreadShareMode {
     SharedReadWrite // Other threads can read and write in parallel.
 };
 
+// Statistics about the spinning phase of contended OrderedMutex lock calls.
+// These can be used to find if spinning helps for a given workload.
+struct OrderedMutexSpinStats {
+    // The number of blocking lock calls that could not lock the mutex immediately and spun.
+    std::uint64_t spin_count = 0;
+    // The number of spinning lock calls that locked the mutex while spinning.
+    std::uint64_t spin_success_count = 0;
+    // The number of blocking lock calls that waited in the queue.
+    std::uint64_t park_count = 0;
+};
+
+// Contention statistics of an OrderedMutex.
+// These are only recorded while profiling is enabled.
+struct OrderedMutexProfile {
+    // The number of hold time histogram buckets.
+    static constexpr std::size_t HoldTimeBucketCount = 32;
+
+    // The name the mutex was registered with when profiling was enabled.
+    std::string name;
+    // The number of successful lock calls in each mode indexed by [access mode][share mode].
+    std::array<std::array<std::uint64_t, 3>, 2> acquire_count {};
+    // The number of successful lock calls that could not lock the mutex immediately.
+    std::uint64_t contended_count = 0;
+    // The total time contended lock calls waited before locking the mutex.
+    std::chrono::nanoseconds total_wait_time { 0 };
+    // The longest time a contended lock call waited before locking the mutex.
+    std::chrono::nanoseconds max_wait_time { 0 };
+    // The number of times the mutex was held for each duration.
+    // Bucket i counts hold times of at least 2**i nanoseconds and less than 2**(i+1) nanoseconds.
+    // The first bucket also counts zero and the last bucket also counts longer hold times.
+    std::array<std::uint64_t, HoldTimeBucketCount> hold_time_histogram {};
+    // The number of lock calls that timed out.
+    std::uint64_t timeout_count = 0;
+    // The number of lock calls that were cancelled.
+    std::uint64_t cancel_count = 0;
+};
+
+class OrderedMutex;
+
+namespace detail {
+    // A mutex locked by a thread and the mode it was locked in.
+    struct LockedOrderedMutex {
+        const OrderedMutex* mutex;
+        ThreadAccessMode access_mode;
+        ThreadShareMode share_mode;
+        // The number of times the thread has locked the mutex.
+        // This can only be more than one if the mutex is re-entrant.
+        std::size_t lock_count = 1;
+        // The time the mutex was locked if profiling was enabled.
+        std::chrono::steady_clock::time_point locked_time = {};
+    };
+
+    // The counters behind OrderedMutexProfile.
+    struct OrderedMutexProfileData {
+        std::array<std::atomic<std::uint64_t>, 6> acquire_count {};
+        std::atomic<std::uint64_t> contended_count = 0;
+        std::atomic<std::int64_t> total_wait_time = 0;
+        std::atomic<std::int64_t> max_wait_time = 0;
+        std::array<std::atomic<std::uint64_t>, OrderedMutexProfile::HoldTimeBucketCount> hold_time_histogram {};
+        std::atomic<std::uint64_t> timeout_count = 0;
+        std::atomic<std::uint64_t> cancel_count = 0;
+
+        void record_acquire(ThreadAccessMode access_mode, ThreadShareMode share_mode)
+        {
+            acquire_count[static_cast<std::size_t>(access_mode) * 3 + static_cast<std::size_t>(share_mode)].fetch_add(1, std::memory_order_relaxed);
+        }
+
+        void record_wait(std::chrono::nanoseconds wait_time)
+        {
+            const std::int64_t count = wait_time.count();
+            contended_count.fetch_add(1, std::memory_order_relaxed);
+            total_wait_time.fetch_add(count, std::memory_order_relaxed);
+            std::int64_t max_count = max_wait_time.load(std::memory_order_relaxed);
+            while (max_count < count && !max_wait_time.compare_exchange_weak(max_count, count, std::memory_order_relaxed)) { }
+        }
+
+        void record_hold(std::chrono::nanoseconds hold_time)
+        {
+            const std::uint64_t count = std::max<std::int64_t>(hold_time.count(), 0);
+            const std::size_t bucket = std::min<std::size_t>(std::bit_width(count), OrderedMutexProfile::HoldTimeBucketCount) - (count != 0);
+            hold_time_histogram[bucket].fetch_add(1, std::memory_order_relaxed);
+        }
+
+        void reset()
+        {
+            for (auto& count : acquire_count) {
+                count.store(0, std::memory_order_relaxed);
+            }
+            contended_count.store(0, std::memory_order_relaxed);
+            total_wait_time.store(0, std::memory_order_relaxed);
+            max_wait_time.store(0, std::memory_order_relaxed);
+            for (auto& count : hold_time_histogram) {
+                count.store(0, std::memory_order_relaxed);
+            }
+            timeout_count.store(0, std::memory_order_relaxed);
+            cancel_count.store(0, std::memory_order_relaxed);
+        }
+    };
+
+    // The mutex guarding the registry of profiled mutexes and their profile storage.
+    AMULET_UTILS_EXPORT std::recursive_mutex& get_ordered_mutex_registry_mutex();
+
+    // Call func with the thread mode as template arguments.
+    template <typename FuncT>
+    auto visit_thread_mode(ThreadAccessMode access_mode, ThreadShareMode share_mode, FuncT func)
+    {
+        switch (access_mode) {
+        case ThreadAccessMode::Read:
+            switch (share_mode) {
+            case ThreadShareMode::Unique:
+                return func.template operator()<ThreadAccessMode::Read, ThreadShareMode::Unique>();
+            case ThreadShareMode::SharedReadOnly:
+                return func.template operator()<ThreadAccessMode::Read, ThreadShareMode::SharedReadOnly>();
+            case ThreadShareMode::SharedReadWrite:
+                return func.template operator()<ThreadAccessMode::Read, ThreadShareMode::SharedReadWrite>();
+            }
+            break;
+        case ThreadAccessMode::ReadWrite:
+            switch (share_mode) {
+            case ThreadShareMode::Unique:
+                return func.template operator()<ThreadAccessMode::ReadWrite, ThreadShareMode::Unique>();
+            case ThreadShareMode::SharedReadOnly:
+                return func.template operator()<ThreadAccessMode::ReadWrite, ThreadShareMode::SharedReadOnly>();
+            case ThreadShareMode::SharedReadWrite:
+                return func.template operator()<ThreadAccessMode::ReadWrite, ThreadShareMode::SharedReadWrite>();
+            }
+        }
+        throw std::invalid_argument("Invalid thread mode.");
+    }
+
+    // Add a mutex to the registry of profiled mutexes or rename it if it is already registered.
+    AMULET_UTILS_EXPORT void register_profiled_ordered_mutex(const OrderedMutex& mutex, const std::string& name);
+
+    // Remove a mutex from the registry of profiled mutexes if it is registered.
+    AMULET_UTILS_EXPORT void unregister_profiled_ordered_mutex(const OrderedMutex& mutex);
+
+    // Get the name a mutex was registered with or an empty string if it is not registered.
+    AMULET_UTILS_EXPORT std::string get_profiled_ordered_mutex_name(const OrderedMutex& mutex);
+    // Get the OrderedMutex instances locked by the current thread.
+    // This is used to detect deadlocks and to find the mode to unlock without locking shared state.
+    AMULET_UTILS_EXPORT std::vector<LockedOrderedMutex>& get_locked_ordered_mutexes();
+
+    // The maximum number of spin iterations used by OrderedMutex instances without their own value.
+    AMULET_UTILS_EXPORT std::atomic<std::uint32_t>& get_ordered_mutex_default_max_spin();
+
+    // Hint to the processor that this is a spin loop.
+    inline void cpu_relax()
+    {
+#if defined(_MSC_VER) && (defined(_M_X64) || defined(_M_IX86))
+        _mm_pause();
+#elif defined(_MSC_VER) && defined(_M_ARM64)
+        __yield();
+#elif defined(__x86_64__) || defined(__i386__)
+        __builtin_ia32_pause();
+#elif defined(__aarch64__) || defined(__arm__)
+        asm volatile("yield");
+#else
+        std::this_thread::yield();
+#endif
+    }
+}
+
 // This is a custom mutex implementation that prioritises acquisition order and allows parallelism where possible.
 // The acquirer can define the required permissions for this thread and permissions for other parallel threads.
 // It also supports cancelling waiting through a CancelManager instance.
@@ -55,27 +230,358 @@ enum class ThreadShareMode {
 class OrderedMutex {
 protected:
     using LockMode = std::pair<ThreadAccessMode, ThreadShareMode>;
-    struct ThreadState {
-        std::thread::id id;
-        std::optional<LockMode> state; // The current lock mode. Empty if unlocked.
-    };
 
-    std::mutex mutex;
-    std::condition_variable condition;
+    // The lock counts are packed into one word so that uncontended locking and unlocking is a single atomic operation.
+    // Each count is stored in a 15 bit field.
+    using StateT = std::uint64_t;
+    static constexpr StateT CountMask = (StateT(1) << 15) - 1;
     // The number of threads that are reading
-    size_t read_count = 0;
+    static constexpr StateT ReadCountShift = 0;
     // The number of threads that are writing
-    size_t write_count = 0;
+    static constexpr StateT WriteCountShift = 16;
     // The number of locked threads blocking reading
-    size_t blocking_read_count = 0;
+    static constexpr StateT BlockingReadCountShift = 32;
     // The number of locked threads blocking writing
-    size_t blocking_write_count = 0;
-    // The threads that currently hold the lock.
-    std::list<ThreadState> locked_threads;
+    static constexpr StateT BlockingWriteCountShift = 48;
+    // Set while there are pending threads.
+    // New threads must queue behind them to preserve the acquisition order.
+    static constexpr StateT PendingFlag = StateT(1) << 63;
+
+    static constexpr StateT get_count(StateT state, StateT shift)
+    {
+        return (state >> shift) & CountMask;
+    }
+
+    // Get the value added to the state when locking in a mode.
+    static constexpr StateT get_state_delta(ThreadAccessMode access_mode, ThreadShareMode share_mode)
+    {
+        StateT delta = StateT(1) << ReadCountShift;
+        if (access_mode == ThreadAccessMode::ReadWrite) {
+            delta += StateT(1) << WriteCountShift;
+        }
+        switch (share_mode) {
+        case ThreadShareMode::Unique:
+            delta += StateT(1) << BlockingReadCountShift;
+            delta += StateT(1) << BlockingWriteCountShift;
+            break;
+        case ThreadShareMode::SharedReadOnly:
+            delta += StateT(1) << BlockingWriteCountShift;
+            break;
+        default:
+            break;
+        }
+        return delta;
+    }
+
+    // Can the mutex be locked in the mode given the current state.
+    static constexpr bool is_needed_state(StateT state, ThreadAccessMode access_mode, ThreadShareMode share_mode)
+    {
+        // Every locked thread increments the read count so the other counts can't overflow if it doesn't.
+        if (get_count(state, ReadCountShift) == CountMask) {
+            return false;
+        }
+
+        if (access_mode == ThreadAccessMode::Read) {
+            if (get_count(state, BlockingReadCountShift)) {
+                return false;
+            }
+        } else {
+            if (get_count(state, BlockingWriteCountShift)) {
+                return false;
+            }
+        }
+
+        switch (share_mode) {
+        case ThreadShareMode::Unique:
+            return get_count(state, ReadCountShift) == 0;
+        case ThreadShareMode::SharedReadOnly:
+            return get_count(state, WriteCountShift) == 0;
+        default:
+            return true;
+        }
+    }
+
+    // The lock state.
+    std::atomic<StateT> state = 0;
+
+    // A thread waiting to lock the mutex.
+    // Waiters live on the stack of the waiting thread and are linked into the queue so queueing does not allocate.
+    // Each waiter has its own condition so that only threads that can lock the mutex are woken.
+    // The mutex is locked on behalf of the waiter before it is woken.
+    struct Waiter {
+        ThreadAccessMode access_mode;
+        ThreadShareMode share_mode;
+        std::condition_variable condition;
+        // The state already held by this thread which is replaced when the mutex is granted.
+        // This is only non-zero when upgrading.
+        StateT held_delta = 0;
+        // Set when the mutex has been locked for this waiter and it has been removed from the queue.
+        bool granted = false;
+        // Called instead of notifying the condition if the waiter is an async request.
+        std::function<void()> on_granted;
+        Waiter* prev = nullptr;
+        Waiter* next = nullptr;
+    };
+
+    // The mutex used by pending threads.
+    std::mutex mutex;
     // The pending threads in the order the lock call was made.
-    std::list<ThreadState> pending_threads;
-    // Lookup from thread id to the iterator in locked_threads or pending_thread.
-    std::map<std::thread::id, std::list<ThreadState>::iterator> threads;
+    Waiter* pending_head = nullptr;
+    Waiter* pending_tail = nullptr;
+    // A thread that holds the mutex and is waiting to upgrade its lock mode.
+    // This takes priority over the queue because queued threads may be waiting for it.
+    Waiter* upgrader = nullptr;
+    // The callbacks of async requests granted while the queue mutex was locked.
+    // These are called once the queue mutex is unlocked.
+    std::vector<std::function<void()>> granted_callbacks;
+
+    // Can a thread that holds the mutex re-enter in a mode without changing the state.
+    // The held mode must have at least the access of the new mode and block at least as much.
+    static constexpr bool is_mode_covered(
+        ThreadAccessMode held_access_mode,
+        ThreadShareMode held_share_mode,
+        ThreadAccessMode access_mode,
+        ThreadShareMode share_mode)
+    {
+        if (access_mode == ThreadAccessMode::ReadWrite && held_access_mode != ThreadAccessMode::ReadWrite) {
+            return false;
+        }
+        switch (share_mode) {
+        case ThreadShareMode::Unique:
+            return held_share_mode == ThreadShareMode::Unique;
+        case ThreadShareMode::SharedReadOnly:
+            return held_share_mode != ThreadShareMode::SharedReadWrite;
+        default:
+            return true;
+        }
+    }
+
+    // Is the mutex re-entrant.
+    const bool reentrant = false;
+
+    // Add a waiter to the end of the queue.
+    // The queue mutex must be locked.
+    void push_waiter(Waiter& waiter)
+    {
+        waiter.prev = pending_tail;
+        waiter.next = nullptr;
+        if (pending_tail) {
+            pending_tail->next = &waiter;
+        } else {
+            pending_head = &waiter;
+        }
+        pending_tail = &waiter;
+    }
+
+    // Remove a waiter from the queue.
+    // The queue mutex must be locked.
+    void erase_waiter(Waiter& waiter)
+    {
+        if (waiter.prev) {
+            waiter.prev->next = waiter.next;
+        } else {
+            pending_head = waiter.next;
+        }
+        if (waiter.next) {
+            waiter.next->prev = waiter.prev;
+        } else {
+            pending_tail = waiter.prev;
+        }
+        waiter.prev = nullptr;
+        waiter.next = nullptr;
+    }
+
+    // Try to add the lock mode to the state.
+    // If Queued is false this fails while there are pending threads so that they are not overtaken.
+    // If clear_pending is true the pending flag is cleared in the same operation.
+    // held_delta is the state already held by this thread which is removed in the same operation.
+    template <bool Queued>
+    bool try_add_state(ThreadAccessMode access_mode, ThreadShareMode share_mode, bool clear_pending = false, StateT held_delta = 0)
+    {
+        const StateT delta = get_state_delta(access_mode, share_mode) - held_delta;
+        StateT current_state = state.load(std::memory_order_relaxed);
+        StateT new_state;
+        do {
+            if constexpr (!Queued) {
+                if (current_state & PendingFlag) {
+                    return false;
+                }
+            }
+            if (!is_needed_state(current_state - held_delta, access_mode, share_mode)) {
+                return false;
+            }
+            new_state = current_state + delta;
+            if (clear_pending) {
+                new_state &= ~PendingFlag;
+            }
+        } while (!state.compare_exchange_weak(current_state, new_state, std::memory_order_acquire, std::memory_order_relaxed));
+        return true;
+    }
+
+    // The per mutex maximum number of spin iterations or UseDefaultMaxSpin to use the global default.
+    static constexpr std::uint32_t UseDefaultMaxSpin = std::numeric_limits<std::uint32_t>::max();
+    // Spinning stops after a few more iterations than recent successful spins needed.
+    static constexpr std::uint32_t MinSpin = 16;
+    std::atomic<std::uint32_t> max_spin = UseDefaultMaxSpin;
+    // A moving average of the number of iterations successful spins needed.
+    std::atomic<std::uint32_t> spin_estimate = 0;
+    std::atomic<std::uint64_t> spin_count = 0;
+    std::atomic<std::uint64_t> spin_success_count = 0;
+    std::atomic<std::uint64_t> park_count = 0;
+
+    // The profile counters. This is allocated the first time profiling is enabled and is kept until the mutex is destroyed.
+    // This is guarded by the registry mutex.
+    std::unique_ptr<detail::OrderedMutexProfileData> profile_storage;
+    // The profile counters if profiling is enabled otherwise nullptr.
+    std::atomic<detail::OrderedMutexProfileData*> profile_data = nullptr;
+
+    // Spin while the mutex is held by another thread in the hope that it is released soon.
+    // This avoids the cost of sleeping and waking for short critical sections.
+    // The number of iterations adapts to how long recent successful spins took.
+    // Returns true if the mutex was locked.
+    template <ThreadAccessMode DesiredThreadAccessMode, ThreadShareMode DesiredThreadShareMode>
+    bool try_spin_lock()
+    {
+        const std::uint32_t estimate = spin_estimate.load(std::memory_order_relaxed);
+        const std::uint64_t limit = std::min<std::uint64_t>(get_max_spin().value_or(get_default_max_spin()), 2 * std::uint64_t(estimate) + MinSpin);
+        if (limit == 0) {
+            return false;
+        }
+        spin_count.fetch_add(1, std::memory_order_relaxed);
+        for (std::uint64_t i = 0; i < limit; i++) {
+            detail::cpu_relax();
+            const StateT current_state = state.load(std::memory_order_relaxed);
+            if (current_state & PendingFlag) {
+                // Other threads are queued. This thread must queue behind them.
+                break;
+            }
+            if (is_needed_state(current_state, DesiredThreadAccessMode, DesiredThreadShareMode) && try_add_state<false>(DesiredThreadAccessMode, DesiredThreadShareMode)) {
+                spin_success_count.fetch_add(1, std::memory_order_relaxed);
+                spin_estimate.store(estimate + (std::int64_t(i) - std::int64_t(estimate)) / 8, std::memory_order_relaxed);
+                return true;
+            }
+        }
+        spin_estimate.store(estimate - estimate / 8, std::memory_order_relaxed);
+        return false;
+    }
+
+    // Lock the mutex on behalf of every consecutive pending thread at the top of the queue that can lock it and wake them.
+    // A run of compatible threads is admitted in one step rather than each thread waking the next.
+    // The queue mutex must be locked.
+    void admit_waiters()
+    {
+        if (upgrader) {
+            if (!try_add_state<true>(upgrader->access_mode, upgrader->share_mode, pending_head == nullptr, upgrader->held_delta)) {
+                // Queued threads must not lock the mutex until the upgrade is complete.
+                return;
+            }
+            upgrader->granted = true;
+            upgrader->condition.notify_one();
+            upgrader = nullptr;
+        }
+        while (pending_head && try_add_state<true>(pending_head->access_mode, pending_head->share_mode, pending_head->next == nullptr)) {
+            Waiter& waiter = *pending_head;
+            erase_waiter(waiter);
+            waiter.granted = true;
+            if (waiter.on_granted) {
+                granted_callbacks.push_back(std::move(waiter.on_granted));
+                waiter.on_granted = nullptr;
+            } else {
+                waiter.condition.notify_one();
+            }
+        }
+    }
+
+    // Unlock the queue mutex and call the callbacks of the async requests granted while it was locked.
+    void unlock_queue(std::unique_lock<std::mutex>& lock)
+    {
+        if (granted_callbacks.empty()) {
+            lock.unlock();
+            return;
+        }
+        auto callbacks = std::move(granted_callbacks);
+        granted_callbacks.clear();
+        lock.unlock();
+        for (auto& callback : callbacks) {
+            callback();
+        }
+    }
+
+    // Remove a pending waiter that failed to lock the mutex from the queue.
+    // The queue mutex must be locked.
+    void erase_pending_waiter(Waiter& waiter)
+    {
+        bool is_first = pending_head == &waiter;
+        erase_waiter(waiter);
+        if (!pending_head && !upgrader) {
+            state.fetch_and(~PendingFlag, std::memory_order_relaxed);
+        }
+
+        // The next threads may be able to lock the mutex if the top pending thread changes.
+        if (is_first) {
+            admit_waiters();
+        }
+    }
+
+    // Remove a lock mode from the state and admit the pending threads that can then lock the mutex.
+    void remove_state(StateT delta)
+    {
+        if (state.fetch_sub(delta, std::memory_order_release) & PendingFlag) {
+            // The queue mutex must be locked so that the notification cannot be missed.
+            std::unique_lock lock(mutex);
+            admit_waiters();
+            unlock_queue(lock);
+        }
+    }
+
+    // Wait until the mutex is granted to the waiter, the timeout is reached or the task is cancelled.
+    // The queue mutex must be locked. It is unlocked when this returns.
+    // on_failed is called with the queue mutex locked if the mutex was not granted.
+    // Returns true if the mutex was granted.
+    template <bool Timed, class OnFailedT, class... Args>
+    bool wait_granted(std::unique_lock<std::mutex>& lock, Waiter& waiter, OnFailedT on_failed, Args&&... args_pack)
+    {
+        // Unpack the args
+        auto args = std::tie(args_pack...);
+        AbstractCancelManager& cancel_manager = std::get<std::tuple_size_v<decltype(args)> - 1>(args);
+
+        // The queue mutex must be locked so that the notification cannot be missed.
+        // The callback is unregistered after the queue mutex is unlocked because unregistering waits for a running callback.
+        auto token = cancel_manager.register_cancel_callback([&]() -> void {
+            std::lock_guard cancel_lock(mutex);
+            waiter.condition.notify_one();
+        });
+
+        auto pred = [&] { return waiter.granted || cancel_manager.is_cancel_requested(); };
+        if constexpr (Timed) {
+            static_assert(std::tuple_size_v<decltype(args)> == 2);
+            const auto& timeout = std::get<0>(args);
+            using TimeoutT = std::remove_cvref_t<decltype(timeout)>;
+            if constexpr (is_specialization_of<std::chrono::duration, TimeoutT>::value) {
+                waiter.condition.wait_for(lock, timeout, pred);
+            } else {
+                static_assert(is_specialization_of<std::chrono::time_point, TimeoutT>::value);
+                waiter.condition.wait_until(lock, timeout, pred);
+            }
+        } else {
+            waiter.condition.wait(lock, pred);
+        }
+        const bool granted = waiter.granted;
+        if (!granted) {
+            on_failed();
+        }
+        unlock_queue(lock);
+        cancel_manager.unregister_cancel_callback(token);
+        return granted;
+    }
+
+    // Find this mutex in the locked mutexes of the current thread.
+    std::vector<detail::LockedOrderedMutex>::iterator find_locked(std::vector<detail::LockedOrderedMutex>& locked_mutexes) const
+    {
+        return std::find_if(locked_mutexes.begin(), locked_mutexes.end(), [this](const detail::LockedOrderedMutex& locked) {
+            return locked.mutex == this;
+        });
+    }
 
     template <
         bool ReturnBool,
@@ -85,151 +591,94 @@ protected:
         class... Args>
     std::conditional_t<ReturnBool, bool, void> _lock_imp(Args... args_pack)
     {
-        // Lock the state.
-        std::unique_lock lock(mutex);
-
-        // Get the thread id
-        auto id = std::this_thread::get_id();
+        auto& locked_mutexes = detail::get_locked_ordered_mutexes();
+        auto* profile = profile_data.load(std::memory_order_acquire);
 
         // Check for a deadlock.
-        if (threads.find(id) != threads.end()) {
+        auto it = find_locked(locked_mutexes);
+        if (it != locked_mutexes.end()) {
+            if (reentrant && is_mode_covered(it->access_mode, it->share_mode, DesiredThreadAccessMode, DesiredThreadShareMode)) {
+                it->lock_count++;
+                if (profile) {
+                    profile->record_acquire(DesiredThreadAccessMode, DesiredThreadShareMode);
+                }
+                if constexpr (ReturnBool) {
+                    return true;
+                } else {
+                    return;
+                }
+            }
             throw Deadlock("Deadlock encountered.");
         }
 
-        auto is_needed_self_state = [&]() -> bool {
-            if constexpr (DesiredThreadAccessMode == ThreadAccessMode::Read) {
-                return blocking_read_count == 0;
-            } else {
-                static_assert(DesiredThreadAccessMode == ThreadAccessMode::ReadWrite);
-                return blocking_write_count == 0;
-            }
-        };
-
-        auto is_needed_other_state = [&]() -> bool {
-            if constexpr (DesiredThreadShareMode == ThreadShareMode::Unique) {
-                return read_count == 0;
-            } else if constexpr (DesiredThreadShareMode == ThreadShareMode::SharedReadOnly) {
-                return write_count == 0;
-            } else {
-                static_assert(DesiredThreadShareMode == ThreadShareMode::SharedReadWrite);
-                return true;
-            }
-        };
+        // The time waiting started if profiling is enabled.
+        std::chrono::steady_clock::time_point wait_start;
 
-        // Is mutex in a lockable state.
-        auto is_needed_state = [&]() -> bool {
-            return is_needed_self_state() && is_needed_other_state();
-        };
-
-        auto set_state = [&]() {
-            if constexpr (DesiredThreadAccessMode == ThreadAccessMode::Read) {
-                read_count++;
-            } else {
-                static_assert(DesiredThreadAccessMode == ThreadAccessMode::ReadWrite);
-                read_count++;
-                write_count++;
-            }
-            if constexpr (DesiredThreadShareMode == ThreadShareMode::Unique) {
-                blocking_read_count++;
-                blocking_write_count++;
-            } else if constexpr (DesiredThreadShareMode == ThreadShareMode::SharedReadOnly) {
-                blocking_write_count++;
-            } else {
-                static_assert(DesiredThreadShareMode == ThreadShareMode::SharedReadWrite);
+        auto add_locked = [&]() {
+            auto& locked = locked_mutexes.emplace_back(this, DesiredThreadAccessMode, DesiredThreadShareMode);
+            if (profile) {
+                locked.locked_time = std::chrono::steady_clock::now();
+                profile->record_acquire(DesiredThreadAccessMode, DesiredThreadShareMode);
+                if (wait_start != std::chrono::steady_clock::time_point {}) {
+                    profile->record_wait(locked.locked_time - wait_start);
+                }
             }
         };
 
-        if (pending_threads.empty() && is_needed_state()) {
-            // mutex can be locked without blocking. Lock it.
-            set_state();
-            auto it = locked_threads.insert(locked_threads.end(), { id, std::make_pair(DesiredThreadAccessMode, DesiredThreadShareMode) });
-            threads.emplace(id, it);
+        if (try_add_state<false>(DesiredThreadAccessMode, DesiredThreadShareMode)) {
+            // mutex was locked without blocking.
+            add_locked();
             if constexpr (ReturnBool) {
                 return true;
             }
         } else if constexpr (Blocking) {
-            // Wait until the mutex can be locked.
-
-            // Unpack the args
-            auto args = std::tie(args_pack...);
-            AbstractCancelManager& cancel_manager = std::get<std::tuple_size_v<decltype(args)> - 1>(args);
-
-            // Create the lock state
-            auto it = pending_threads.insert(pending_threads.end(), { id, std::nullopt });
-            threads.emplace(id, it);
-
-            auto is_lockable = [&]() -> bool {
-                return pending_threads.begin() == it && is_needed_state();
-            };
-
-            // If the state does not get locked it must be erased.
-            auto erase_state = [&]() -> void {
-                threads.erase(it->id);
-                pending_threads.erase(it);
-
-                // Notify other threads if the top pending thread changes.
-                if (it == pending_threads.begin()) {
-                    condition.notify_all();
+            if (profile) {
+                wait_start = std::chrono::steady_clock::now();
+            }
+            if (try_spin_lock<DesiredThreadAccessMode, DesiredThreadShareMode>()) {
+                add_locked();
+                if constexpr (ReturnBool) {
+                    return true;
+                } else {
+                    return;
                 }
-            };
-
-            // Function to lock the mutex.
-            auto lock_state = [&]() -> void {
-                // Update the mutex state
-                set_state();
+            }
 
-                // Move the thread state
-                locked_threads.splice(locked_threads.end(), pending_threads, pending_threads.begin());
-                it->state = std::make_pair(DesiredThreadAccessMode, DesiredThreadShareMode);
+            // Wait until the mutex can be locked.
+            park_count.fetch_add(1, std::memory_order_relaxed);
 
-                // Notify other threads that the top pending thread changed.
-                condition.notify_all();
-            };
+            // Lock the queue.
+            std::unique_lock lock(mutex);
 
-            auto token = cancel_manager.register_cancel_callback([&]() -> void {
-                condition.notify_all();
-            });
+            // Add this thread to the queue.
+            // The pending flag stops new threads locking without queueing.
+            Waiter waiter { DesiredThreadAccessMode, DesiredThreadShareMode };
+            push_waiter(waiter);
+            state.fetch_or(PendingFlag, std::memory_order_relaxed);
+            // The mutex may have been unlocked before the pending flag was set.
+            admit_waiters();
 
-            auto unregister_cancel = [&]() -> void {
-                cancel_manager.unregister_cancel_callback(token);
+            // Remove this thread from the queue.
+            auto erase_state = [&]() -> void {
+                erase_pending_waiter(waiter);
             };
 
-            if constexpr (ReturnBool) {
-                static_assert(std::tuple_size_v<decltype(args)> == 2);
-                const auto& timeout = std::get<0>(args);
-                using TimeoutT = std::remove_cvref_t<decltype(timeout)>;
-
-                auto wait = [&](std::unique_lock<std::mutex>& _lck, decltype(timeout) _timeout, std::function<bool()> _pred) -> bool {
-                    if constexpr (is_specialization_of<std::chrono::duration, TimeoutT>::value) {
-                        return condition.wait_for(_lck, _timeout, _pred);
-                    } else {
-                        static_assert(is_specialization_of<std::chrono::time_point, TimeoutT>::value);
-                        return condition.wait_until(_lck, _timeout, _pred);
-                    }
-                };
-
-                auto result = wait(lock, timeout, [&] { return cancel_manager.is_cancel_requested() || is_lockable(); });
-                unregister_cancel();
-                if (result && !cancel_manager.is_cancel_requested()) {
-                    lock_state();
-                    return true;
+            const bool locked = wait_granted<ReturnBool>(lock, waiter, erase_state, args_pack...);
+            if (locked) {
+                add_locked();
+            } else if (profile) {
+                AbstractCancelManager& cancel_manager = std::get<sizeof...(Args) - 1>(std::tie(args_pack...));
+                if (cancel_manager.is_cancel_requested()) {
+                    profile->cancel_count.fetch_add(1, std::memory_order_relaxed);
                 } else {
-                    erase_state();
-                    return false;
+                    profile->timeout_count.fetch_add(1, std::memory_order_relaxed);
                 }
-            } else {
-                // Wait until this is at the top of the queue and the mutex is unlocked.
-                condition.wait(lock,
-                    [&] {
-                        if (cancel_manager.is_cancel_requested()) {
-                            erase_state();
-                            unregister_cancel();
-                            throw TaskCancelled();
-                        }
-                        return is_lockable(); });
-
-                unregister_cancel();
-                lock_state();
+            }
+
+            if constexpr (ReturnBool) {
+                return locked;
+            } else if (!locked) {
+                throw TaskCancelled();
             }
         } else if constexpr (ReturnBool) {
             return false;
@@ -248,14 +697,98 @@ protected:
         return _lock_imp<ReturnBool, Blocking, DesiredThreadAccessMode, DesiredThreadShareMode>();
     }
 
+    template <
+        bool ReturnBool,
+        bool Blocking,
+        ThreadAccessMode DesiredThreadAccessMode,
+        ThreadShareMode DesiredThreadShareMode,
+        class... Args>
+    std::conditional_t<ReturnBool, bool, void> _upgrade_imp(Args... args_pack)
+    {
+        auto& locked_mutexes = detail::get_locked_ordered_mutexes();
+        auto it = find_locked(locked_mutexes);
+        if (it == locked_mutexes.end()) {
+            throw std::runtime_error("This mutex is not locked by this thread.");
+        }
+        const StateT held_delta = get_state_delta(it->access_mode, it->share_mode);
+
+        auto set_locked = [&]() {
+            it->access_mode = DesiredThreadAccessMode;
+            it->share_mode = DesiredThreadShareMode;
+        };
+
+        // Pending threads are not waited for because they may be waiting for this thread.
+        if (try_add_state<true>(DesiredThreadAccessMode, DesiredThreadShareMode, false, held_delta)) {
+            set_locked();
+            if constexpr (ReturnBool) {
+                return true;
+            }
+        } else if constexpr (Blocking) {
+            // Wait until the other threads holding the mutex unlock it.
+            park_count.fetch_add(1, std::memory_order_relaxed);
+
+            // Lock the queue.
+            std::unique_lock lock(mutex);
+
+            if (upgrader) {
+                throw Deadlock("Another thread is already upgrading this mutex.");
+            }
+
+            // The pending flag stops new threads locking while this thread is waiting.
+            Waiter waiter { DesiredThreadAccessMode, DesiredThreadShareMode };
+            waiter.held_delta = held_delta;
+            upgrader = &waiter;
+            state.fetch_or(PendingFlag, std::memory_order_relaxed);
+            // The mutex may have been unlocked before the pending flag was set.
+            admit_waiters();
+
+            auto erase_state = [&]() -> void {
+                upgrader = nullptr;
+                if (!pending_head) {
+                    state.fetch_and(~PendingFlag, std::memory_order_relaxed);
+                }
+                // Queued threads were blocked by the upgrade.
+                admit_waiters();
+            };
+
+            const bool upgraded = wait_granted<ReturnBool>(lock, waiter, erase_state, args_pack...);
+            if (upgraded) {
+                set_locked();
+            }
+
+            if constexpr (ReturnBool) {
+                return upgraded;
+            } else if (!upgraded) {
+                throw TaskCancelled();
+            }
+        } else if constexpr (ReturnBool) {
+            return false;
+        }
+    }
+
 public:
     // Constructors
     OrderedMutex() = default;
+
+    // Construct a mutex that may be re-entrant.
+    // A thread that holds a re-entrant mutex can lock it again in a mode that is covered by the held mode.
+    // The held mode must have at least the access of the new mode and block other threads at least as much.
+    // The mutex must be unlocked as many times as it was locked.
+    // Locking in a mode that is not covered raises Deadlock. Use upgrade to change the mode.
+    explicit OrderedMutex(bool reentrant)
+        : reentrant(reentrant)
+    {
+    }
     OrderedMutex(const OrderedMutex&) = delete;
     OrderedMutex(OrderedMutex&&) = delete;
 
     // Destructor
-    ~OrderedMutex() = default;
+    ~OrderedMutex()
+    {
+        if (profile_storage) {
+            detail::unregister_profiled_ordered_mutex(*this);
+        }
+    }
 
     // Locks the mutex in the requested mode (default is read write unique).
     // Blocks until the mutex is acquired or the task is cancelled through the cancel manager.
@@ -296,53 +829,356 @@ public:
 
     // Unlock the mutex.
     // Must be called by the thread that locked it.
+    // If this grants the mutex to a queued AsyncRequest its on_granted callback is called by this thread before this returns.
     // Thread safe.
     void unlock()
     {
-        // Lock the state.
+        auto& locked_mutexes = detail::get_locked_ordered_mutexes();
+
+        // Ensure that the mutex is locked by the thread.
+        auto it = find_locked(locked_mutexes);
+        if (it == locked_mutexes.end()) {
+            throw std::runtime_error("This mutex is not locked by this thread.");
+        }
+        if (1 < it->lock_count) {
+            // The mutex is re-entrant and was locked more than once.
+            it->lock_count--;
+            return;
+        }
+        const auto delta = get_state_delta(it->access_mode, it->share_mode);
+        if (it->locked_time != std::chrono::steady_clock::time_point {}) {
+            if (auto* profile = profile_data.load(std::memory_order_acquire)) {
+                profile->record_hold(std::chrono::steady_clock::now() - it->locked_time);
+            }
+        }
+        *it = locked_mutexes.back();
+        locked_mutexes.pop_back();
+
+        // Update the state.
+        remove_state(delta);
+    }
+
+    // A request to lock the mutex without blocking a thread.
+    // This is used to wait for the mutex in an event loop where many tasks share one thread.
+    // Once granted the mutex is held by the request rather than by a thread.
+    // It is not recorded in the locked mutexes of any thread and must be unlocked with unlock_async.
+    // The request must not be destroyed while it is queued or holds the mutex.
+    class AsyncRequest {
+    private:
+        friend class OrderedMutex;
+        Waiter waiter;
+        bool queued = false;
+        // The time waiting started if profiling is enabled.
+        std::chrono::steady_clock::time_point wait_start;
+        // The time the request was claimed if profiling is enabled.
+        std::chrono::steady_clock::time_point locked_time;
+
+    public:
+        // on_granted is called when the mutex is locked on behalf of the queued request.
+        // It is called by whichever thread made the mutex available, including from unlock, unlock_async and downgrade.
+        // That thread may hold other locks so on_granted must not block or wait for a lock such as the Python GIL.
+        // Hand any such work to another thread.
+        AsyncRequest(ThreadAccessMode access_mode, ThreadShareMode share_mode, std::function<void()> on_granted)
+            : waiter { access_mode, share_mode }
+        {
+            waiter.on_granted = std::move(on_granted);
+        }
+        AsyncRequest(const AsyncRequest&) = delete;
+        AsyncRequest(AsyncRequest&&) = delete;
+    };
+
+    // Try to lock the mutex for an async request without queueing.
+    // Unlike try_lock this does not check if the calling thread already holds the mutex
+    // because the tasks of an event loop share one thread.
+    // If this returns true the mutex is locked and claimed by the request. on_granted is destroyed without being called.
+    // Thread safe.
+    bool try_lock_async(AsyncRequest& request)
+    {
+        if (try_add_state<false>(request.waiter.access_mode, request.waiter.share_mode)) {
+            request.waiter.granted = true;
+            request.waiter.on_granted = nullptr;
+            claim_async(request);
+            return true;
+        }
+        return false;
+    }
+
+    // Lock the mutex for an async request without blocking the calling thread.
+    // If the mutex can be locked immediately it is locked and claimed by the request and this returns true.
+    // Otherwise the request is queued in order with the blocking lock calls and this returns false.
+    // Once the mutex is locked on behalf of the request on_granted is called by the thread that made it available.
+    // This may happen before this returns. The queue mutex is not locked when it is called and it must not throw.
+    // The granted mutex must then be claimed with claim_async or unlocked with unlock_async.
+    // Thread safe.
+    bool lock_async(AsyncRequest& request)
+    {
+        if (try_lock_async(request)) {
+            return true;
+        }
+        park_count.fetch_add(1, std::memory_order_relaxed);
+        if (profile_data.load(std::memory_order_relaxed)) {
+            request.wait_start = std::chrono::steady_clock::now();
+        }
+
         std::unique_lock lock(mutex);
+        push_waiter(request.waiter);
+        request.queued = true;
+        state.fetch_or(PendingFlag, std::memory_order_relaxed);
+        // The mutex may have been unlocked before the pending flag was set.
+        admit_waiters();
+        unlock_queue(lock);
+        return false;
+    }
 
-        // Get the thread id
-        auto id = std::this_thread::get_id();
+    // Remove a queued async request from the queue.
+    // Returns true if the request was removed. on_granted will not be called.
+    // Returns false if the request is not queued or the mutex has already been locked on behalf of it.
+    // Thread safe.
+    bool cancel_async(AsyncRequest& request)
+    {
+        std::unique_lock lock(mutex);
+        if (!request.queued || request.waiter.granted) {
+            return false;
+        }
+        request.queued = false;
+        erase_pending_waiter(request.waiter);
+        // Destroy the callback after the queue mutex is unlocked.
+        auto on_granted = std::move(request.waiter.on_granted);
+        request.waiter.on_granted = nullptr;
+        unlock_queue(lock);
+        return true;
+    }
+
+    // Record that the mutex locked on behalf of an async request is in use.
+    // The request keeps holding the mutex in its own mode until it is unlocked with unlock_async.
+    // Thread safe.
+    void claim_async(AsyncRequest& request)
+    {
+        if (auto* profile = profile_data.load(std::memory_order_acquire)) {
+            request.locked_time = std::chrono::steady_clock::now();
+            profile->record_acquire(request.waiter.access_mode, request.waiter.share_mode);
+            if (request.wait_start != std::chrono::steady_clock::time_point {}) {
+                profile->record_wait(request.locked_time - request.wait_start);
+            }
+        }
+    }
+
+    // Unlock the mutex locked on behalf of an async request.
+    // This may be called from any thread.
+    // Thread safe.
+    void unlock_async(AsyncRequest& request)
+    {
+        {
+            std::lock_guard lock(mutex);
+            if (!request.waiter.granted) {
+                throw std::runtime_error("This mutex is not locked by this request.");
+            }
+            request.waiter.granted = false;
+            request.queued = false;
+        }
+        if (request.locked_time != std::chrono::steady_clock::time_point {}) {
+            if (auto* profile = profile_data.load(std::memory_order_acquire)) {
+                profile->record_hold(std::chrono::steady_clock::now() - request.locked_time);
+            }
+            request.locked_time = {};
+        }
+        remove_state(get_state_delta(request.waiter.access_mode, request.waiter.share_mode));
+    }
+
+    // Is the mutex re-entrant.
+    // Thread safe.
+    bool is_reentrant() const
+    {
+        return reentrant;
+    }
+
+    // Change the mode that this thread holds the mutex in to the requested mode (default is read write unique).
+    // The mutex is not unlocked so no other thread can lock it in between.
+    // Blocks until the other threads that hold the mutex have unlocked it in a compatible mode or the task is cancelled.
+    // This takes priority over threads waiting to lock the mutex.
+    // If the task is cancelled before the mode is changed, TaskCancelled is thrown and the original mode is kept.
+    // If another thread is already waiting to upgrade, Deadlock is thrown.
+    // Must be called by the thread that locked it.
+    // Thread safe.
+    template <ThreadAccessMode DesiredThreadAccessMode = ThreadAccessMode::ReadWrite, ThreadShareMode DesiredThreadShareMode = ThreadShareMode::Unique>
+    void upgrade(AbstractCancelManager& cancel_manager = global_VoidCancelManager)
+    {
+        _upgrade_imp<false, true, DesiredThreadAccessMode, DesiredThreadShareMode, AbstractCancelManager&>(cancel_manager);
+    }
+
+    // Tries to upgrade the mode (default is read write unique).
+    // Immediately returns true if the mode was changed and false if it wasn't.
+    // Thread safe.
+    template <ThreadAccessMode DesiredThreadAccessMode = ThreadAccessMode::ReadWrite, ThreadShareMode DesiredThreadShareMode = ThreadShareMode::Unique>
+    bool try_upgrade()
+    {
+        return _upgrade_imp<true, false, DesiredThreadAccessMode, DesiredThreadShareMode>();
+    }
+
+    // Like try_upgrade but with a timeout duration.
+    // Returns true if the mode was changed and false if it was not changed within the duration or if the task was cancelled.
+    // Thread safe.
+    template <ThreadAccessMode DesiredThreadAccessMode = ThreadAccessMode::ReadWrite, ThreadShareMode DesiredThreadShareMode = ThreadShareMode::Unique, class Rep, class Period>
+    bool try_upgrade_for(const std::chrono::duration<Rep, Period>& timeout_duration, AbstractCancelManager& cancel_manager = global_VoidCancelManager)
+    {
+        return _upgrade_imp<true, true, DesiredThreadAccessMode, DesiredThreadShareMode, const std::chrono::duration<Rep, Period>&, AbstractCancelManager&>(timeout_duration, cancel_manager);
+    }
 
-        // Find the thread state
-        auto it = threads.find(id);
+    // Like try_upgrade but with a timeout time.
+    // Returns true if the mode was changed and false if it was not changed before the timeout time or if the task was cancelled.
+    // Thread safe.
+    template <ThreadAccessMode DesiredThreadAccessMode = ThreadAccessMode::ReadWrite, ThreadShareMode DesiredThreadShareMode = ThreadShareMode::Unique, class Clock, class Duration>
+    bool try_upgrade_until(const std::chrono::time_point<Clock, Duration>& timeout_time, AbstractCancelManager& cancel_manager = global_VoidCancelManager)
+    {
+        return _upgrade_imp<true, true, DesiredThreadAccessMode, DesiredThreadShareMode, const std::chrono::time_point<Clock, Duration>&, AbstractCancelManager&>(timeout_time, cancel_manager);
+    }
 
-        // Ensure that the mutex is locked in the same mode by the thread.
-        if (it == threads.end() || !it->second->state.has_value()) {
+    // Change the mode that this thread holds the mutex in to a mode that is covered by the held mode.
+    // The new mode must have at most the access of the held mode and block other threads at most as much.
+    // This never blocks. Pending threads that can now lock the mutex are woken.
+    // Must be called by the thread that locked it.
+    // Thread safe.
+    template <ThreadAccessMode DesiredThreadAccessMode = ThreadAccessMode::Read, ThreadShareMode DesiredThreadShareMode = ThreadShareMode::SharedReadOnly>
+    void downgrade()
+    {
+        auto& locked_mutexes = detail::get_locked_ordered_mutexes();
+        auto it = find_locked(locked_mutexes);
+        if (it == locked_mutexes.end()) {
             throw std::runtime_error("This mutex is not locked by this thread.");
         }
+        if (!is_mode_covered(it->access_mode, it->share_mode, DesiredThreadAccessMode, DesiredThreadShareMode)) {
+            throw std::invalid_argument("The new mode must be covered by the held mode. Use upgrade instead.");
+        }
+        const StateT held_delta = get_state_delta(it->access_mode, it->share_mode);
+        const StateT delta = get_state_delta(DesiredThreadAccessMode, DesiredThreadShareMode);
+        it->access_mode = DesiredThreadAccessMode;
+        it->share_mode = DesiredThreadShareMode;
+        // The new mode has no more counts than the held mode so the subtraction cannot underflow.
+        remove_state(held_delta - delta);
+    }
 
-        switch (it->second->state->first) {
-        case ThreadAccessMode::Read:
-            read_count--;
-            break;
-        case ThreadAccessMode::ReadWrite:
-            read_count--;
-            write_count--;
-            break;
-        default:
-            break;
+    // Get the maximum number of times a contended blocking lock call checks the mutex before waiting in the queue.
+    // If this has not been set the global default is used.
+    // Thread safe.
+    std::optional<std::uint32_t> get_max_spin() const
+    {
+        const std::uint32_t value = max_spin.load(std::memory_order_relaxed);
+        if (value == UseDefaultMaxSpin) {
+            return std::nullopt;
         }
+        return value;
+    }
 
-        switch (it->second->state->second) {
-        case ThreadShareMode::Unique:
-            blocking_read_count--;
-            blocking_write_count--;
-            break;
-        case ThreadShareMode::SharedReadOnly:
-            blocking_write_count--;
-            break;
-        default:
-            break;
+    // Set the maximum number of times a contended blocking lock call checks the mutex before waiting in the queue.
+    // Zero disables spinning. std::nullopt uses the global default.
+    // Thread safe.
+    void set_max_spin(std::optional<std::uint32_t> value)
+    {
+        max_spin.store(value ? std::min(*value, UseDefaultMaxSpin - 1) : UseDefaultMaxSpin, std::memory_order_relaxed);
+    }
+
+    // Get the global default maximum spin count.
+    // This is zero on single core machines and 100 otherwise.
+    // Thread safe.
+    static std::uint32_t get_default_max_spin()
+    {
+        return detail::get_ordered_mutex_default_max_spin().load(std::memory_order_relaxed);
+    }
+
+    // Set the global default maximum spin count used by mutexes without their own value.
+    // Thread safe.
+    static void set_default_max_spin(std::uint32_t value)
+    {
+        detail::get_ordered_mutex_default_max_spin().store(value, std::memory_order_relaxed);
+    }
+
+    // Get statistics about the spinning phase of contended lock calls.
+    // Thread safe.
+    OrderedMutexSpinStats get_spin_stats() const
+    {
+        return {
+            spin_count.load(std::memory_order_relaxed),
+            spin_success_count.load(std::memory_order_relaxed),
+            park_count.load(std::memory_order_relaxed)
+        };
+    }
+
+    // Reset the spin statistics to zero.
+    // Thread safe.
+    void reset_spin_stats()
+    {
+        spin_count.store(0, std::memory_order_relaxed);
+        spin_success_count.store(0, std::memory_order_relaxed);
+        park_count.store(0, std::memory_order_relaxed);
+    }
+
+    // Start recording contention statistics for this mutex and add it to the global registry.
+    // Profiling adds a small cost to each lock call so it is disabled by default.
+    // name is used to identify the mutex in get_ordered_mutex_profiles.
+    // If profiling is already enabled the mutex is renamed and the statistics are kept.
+    // Thread safe.
+    void enable_profiling(const std::string& name = "")
+    {
+        std::lock_guard lock(detail::get_ordered_mutex_registry_mutex());
+        if (!profile_storage) {
+            profile_storage = std::make_unique<detail::OrderedMutexProfileData>();
         }
+        detail::register_profiled_ordered_mutex(*this, name);
+        profile_data.store(profile_storage.get(), std::memory_order_release);
+    }
 
-        // Remove the thread state
-        locked_threads.erase(it->second);
-        threads.erase(it);
+    // Stop recording contention statistics and remove the mutex from the global registry.
+    // The recorded statistics are kept.
+    // Thread safe.
+    void disable_profiling()
+    {
+        std::lock_guard lock(detail::get_ordered_mutex_registry_mutex());
+        profile_data.store(nullptr, std::memory_order_release);
+        detail::unregister_profiled_ordered_mutex(*this);
+    }
 
-        // Wake up pending threads
-        condition.notify_all();
+    // Is profiling enabled.
+    // Thread safe.
+    bool is_profiling() const
+    {
+        return profile_data.load(std::memory_order_relaxed) != nullptr;
+    }
+
+    // Get the recorded contention statistics.
+    // Thread safe.
+    OrderedMutexProfile get_profile() const
+    {
+        std::lock_guard lock(detail::get_ordered_mutex_registry_mutex());
+        OrderedMutexProfile profile;
+        profile.name = detail::get_profiled_ordered_mutex_name(*this);
+        const auto* data = profile_storage.get();
+        if (!data) {
+            return profile;
+        }
+        for (std::size_t access = 0; access < 2; access++) {
+            for (std::size_t share = 0; share < 3; share++) {
+                profile.acquire_count[access][share] = data->acquire_count[access * 3 + share].load(std::memory_order_relaxed);
+            }
+        }
+        profile.contended_count = data->contended_count.load(std::memory_order_relaxed);
+        profile.total_wait_time = std::chrono::nanoseconds(data->total_wait_time.load(std::memory_order_relaxed));
+        profile.max_wait_time = std::chrono::nanoseconds(data->max_wait_time.load(std::memory_order_relaxed));
+        for (std::size_t i = 0; i < OrderedMutexProfile::HoldTimeBucketCount; i++) {
+            profile.hold_time_histogram[i] = data->hold_time_histogram[i].load(std::memory_order_relaxed);
+        }
+        profile.timeout_count = data->timeout_count.load(std::memory_order_relaxed);
+        profile.cancel_count = data->cancel_count.load(std::memory_order_relaxed);
+        return profile;
+    }
+
+    // Reset the recorded contention statistics to zero.
+    // Thread safe.
+    void reset_profile()
+    {
+        std::lock_guard lock(detail::get_ordered_mutex_registry_mutex());
+        if (profile_storage) {
+            profile_storage->reset();
+        }
     }
 
     // SharedTimedLockable
@@ -380,6 +1216,146 @@ public:
     }
 };
 
+// Get the contention statistics of the mutexes that are being profiled.
+// The most contended mutexes are first, ordered by the total time lock calls waited.
+// At most count profiles are returned.
+// Thread safe.
+AMULET_UTILS_EXPORT std::vector<OrderedMutexProfile> get_ordered_mutex_profiles(std::size_t count = std::numeric_limits<std::size_t>::max());
+
+// A mutex and the mode to lock it in.
+struct OrderedMutexLockRequest {
+    OrderedMutex* mutex;
+    ThreadAccessMode access_mode = ThreadAccessMode::ReadWrite;
+    ThreadShareMode share_mode = ThreadShareMode::Unique;
+};
+
+namespace detail {
+    // Lock all of the requested mutexes or none of them.
+    // lock_first blocks until the mutex is locked and returns false if it could not be locked.
+    // The mutexes are locked in a rotating order.
+    // If a mutex cannot be locked without blocking the locked mutexes are unlocked and the next attempt blocks on that mutex first.
+    // A thread holding some of the mutexes never waits for the others so this cannot deadlock with another caller.
+    template <typename LockFirstT>
+    bool lock_all(std::span<const OrderedMutexLockRequest> requests, LockFirstT lock_first)
+    {
+        if (requests.empty()) {
+            return true;
+        }
+        std::size_t first = 0;
+        std::size_t locked_count = 0;
+        auto unlock_locked = [&]() {
+            while (locked_count) {
+                locked_count--;
+                requests[(first + locked_count) % requests.size()].mutex->unlock();
+            }
+        };
+        try {
+            while (true) {
+                const auto& first_request = requests[first];
+                if (!lock_first(first_request)) {
+                    return false;
+                }
+                locked_count = 1;
+                while (locked_count < requests.size()) {
+                    const auto& request = requests[(first + locked_count) % requests.size()];
+                    const bool locked = visit_thread_mode(request.access_mode, request.share_mode, [&]<ThreadAccessMode AccessMode, ThreadShareMode ShareMode>() {
+                        return request.mutex->try_lock<AccessMode, ShareMode>();
+                    });
+                    if (!locked) {
+                        break;
+                    }
+                    locked_count++;
+                }
+                if (locked_count == requests.size()) {
+                    return true;
+                }
+                // Block on the mutex that could not be locked next time.
+                const std::size_t failed = (first + locked_count) % requests.size();
+                unlock_locked();
+                first = failed;
+            }
+        } catch (...) {
+            unlock_locked();
+            throw;
+        }
+    }
+}
+
+// Lock several mutexes, each in its own mode, without deadlocking.
+// Either all of the mutexes are locked or none of them are.
+// Blocks until all mutexes are locked or the task is cancelled through the cancel manager.
+// If the task is cancelled before the mutexes are locked, TaskCancelled is thrown.
+// Each mutex must be unlocked by the caller.
+// If a mutex is requested more than once or is already locked by this thread, Deadlock is thrown unless it is re-entrant.
+// Thread safe.
+inline void lock_all(std::span<const OrderedMutexLockRequest> requests, AbstractCancelManager& cancel_manager = global_VoidCancelManager)
+{
+    detail::lock_all(requests, [&](const OrderedMutexLockRequest& request) {
+        detail::visit_thread_mode(request.access_mode, request.share_mode, [&]<ThreadAccessMode AccessMode, ThreadShareMode ShareMode>() {
+            request.mutex->lock<AccessMode, ShareMode>(cancel_manager);
+        });
+        return true;
+    });
+}
+
+// Like lock_all but does not block.
+// Returns true if all mutexes were locked and false if none were locked.
+// Thread safe.
+inline bool try_lock_all(std::span<const OrderedMutexLockRequest> requests)
+{
+    std::size_t locked_count = 0;
+    auto unlock_locked = [&]() {
+        while (locked_count) {
+            locked_count--;
+            requests[locked_count].mutex->unlock();
+        }
+    };
+    try {
+        for (const auto& request : requests) {
+            const bool locked = detail::visit_thread_mode(request.access_mode, request.share_mode, [&]<ThreadAccessMode AccessMode, ThreadShareMode ShareMode>() {
+                return request.mutex->try_lock<AccessMode, ShareMode>();
+            });
+            if (!locked) {
+                unlock_locked();
+                return false;
+            }
+            locked_count++;
+        }
+    } catch (...) {
+        unlock_locked();
+        throw;
+    }
+    return true;
+}
+
+// Like lock_all but with a timeout time.
+// Returns true if all mutexes were locked and false if none were locked before the timeout time or if the task was cancelled.
+// Thread safe.
+template <class Clock, class Duration>
+bool try_lock_all_until(
+    std::span<const OrderedMutexLockRequest> requests,
+    const std::chrono::time_point<Clock, Duration>& timeout_time,
+    AbstractCancelManager& cancel_manager = global_VoidCancelManager)
+{
+    return detail::lock_all(requests, [&](const OrderedMutexLockRequest& request) {
+        return detail::visit_thread_mode(request.access_mode, request.share_mode, [&]<ThreadAccessMode AccessMode, ThreadShareMode ShareMode>() {
+            return request.mutex->try_lock_until<AccessMode, ShareMode>(timeout_time, cancel_manager);
+        });
+    });
+}
+
+// Like lock_all but with a timeout duration.
+// Returns true if all mutexes were locked and false if none were locked within the duration or if the task was cancelled.
+// Thread safe.
+template <class Rep, class Period>
+bool try_lock_all_for(
+    std::span<const OrderedMutexLockRequest> requests,
+    const std::chrono::duration<Rep, Period>& timeout_duration,
+    AbstractCancelManager& cancel_manager = global_VoidCancelManager)
+{
+    return try_lock_all_until(requests, std::chrono::steady_clock::now() + timeout_duration, cancel_manager);
+}
+
 template <
     ThreadAccessMode DesiredThreadAccessMode = ThreadAccessMode::ReadWrite,
     ThreadShareMode DesiredThreadShareMode = ThreadShareMode::Unique>
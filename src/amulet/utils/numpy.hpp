@@ -1,39 +1,971 @@
 #pragma once
 
+#include <algorithm>
+#include <atomic>
+#include <bit>
+#include <cstddef>
 #include <cstdint>
+#include <exception>
+#include <functional>
 #include <limits>
+#include <mutex>
+#include <optional>
 #include <span>
+#include <stdexcept>
+#include <thread>
+#include <tuple>
+#include <type_traits>
 #include <unordered_map>
 #include <utility>
 #include <vector>
 
 namespace Amulet {
+
+// The minimum number of elements processed by each thread in the parallel numpy functions.
+// Below this the cost of starting a thread outweighs the gain.
+constexpr size_t ParallelMinChunkSize = 1 << 16;
+
+// Integer value ranges up to this size always use a direct lookup table rather than a hash map.
+// Larger ranges use a lookup table if the range is not larger than the number of elements.
+constexpr size_t DenseMinRange = 1 << 16;
+
+// Arrays estimated to have at least this many unique values use an open addressing hash map.
+// Fewer unique values use std::unordered_map.
+constexpr size_t FlatHashMinUnique = 1 << 16;
+
+// The algorithm used to look up values in unique_inverse.
+// The result is the same for all methods.
+enum class UniqueInverseMethod {
+    // Use a lookup table if the value range is small enough.
+    // Otherwise choose a hash map from an estimate of the number of unique values.
+    Auto,
+    // Use std::unordered_map. This is fast for a small number of unique values.
+    Hash,
+    // Use an open addressing hash map reserved for the estimated number of unique values.
+    // This uses less memory and rehashes less when there are many unique values.
+    FlatHash
+};
+
+// A read only view of an N dimensional array with arbitrary strides.
+// This allows arrays that are not contiguous in memory to be processed without copying them.
+// Elements are visited in C order.
+template <typename T>
+class StridedSpan {
+private:
+    const std::byte* _data;
+    // The shape and byte strides with size 1 dimensions removed and contiguous dimensions merged.
+    std::vector<size_t> _shape;
+    std::vector<std::ptrdiff_t> _strides;
+    size_t _size;
+
+public:
+    // data is a pointer to the first element.
+    // strides are the number of bytes between elements in each dimension. They may be negative.
+    StridedSpan(const T* data, const std::vector<size_t>& shape, const std::vector<std::ptrdiff_t>& strides)
+        : _data(reinterpret_cast<const std::byte*>(data))
+        , _size(1)
+    {
+        if (shape.size() != strides.size()) {
+            throw std::invalid_argument("shape and strides must have the same size.");
+        }
+        for (size_t dim = 0; dim < shape.size(); dim++) {
+            _size *= shape[dim];
+            if (shape[dim] == 1) {
+                continue;
+            }
+            if (!_shape.empty() && _strides.back() == strides[dim] * static_cast<std::ptrdiff_t>(shape[dim])) {
+                // This dimension is contiguous with the previous one.
+                _shape.back() *= shape[dim];
+                _strides.back() = strides[dim];
+            } else {
+                _shape.push_back(shape[dim]);
+                _strides.push_back(strides[dim]);
+            }
+        }
+        if (_size == 0) {
+            _shape.clear();
+            _strides.clear();
+        }
+    }
+
+    // A view of a contiguous array.
+    StridedSpan(std::span<const T> arr)
+        : StridedSpan(arr.data(), { arr.size() }, { static_cast<std::ptrdiff_t>(sizeof(T)) })
+    {
+    }
+
+    // The number of elements in the array.
+    size_t size() const { return _size; }
+
+    // Is the array empty.
+    bool empty() const { return _size == 0; }
+
+    // Are the elements contiguous in memory.
+    bool is_contiguous() const
+    {
+        return _shape.empty() || (_shape.size() == 1 && _strides[0] == static_cast<std::ptrdiff_t>(sizeof(T)));
+    }
+
+    // Get a pointer to the first element.
+    const T* data() const { return reinterpret_cast<const T*>(_data); }
+
+    // Call func with each element in the range [start, stop) of the C order flattened array.
+    template <typename funcT>
+    void for_each(size_t start, size_t stop, funcT func) const
+    {
+        if (stop <= start) {
+            return;
+        }
+        if (_shape.empty()) {
+            // Zero dimensional array.
+            func(*data());
+            return;
+        }
+        const size_t ndim = _shape.size();
+        const size_t inner_size = _shape.back();
+        const std::ptrdiff_t inner_stride = _strides.back();
+
+        // Unravel the start index.
+        std::vector<size_t> index(ndim);
+        std::ptrdiff_t row_offset = 0;
+        size_t remainder = start;
+        for (size_t dim = ndim; dim-- > 0;) {
+            index[dim] = remainder % _shape[dim];
+            remainder /= _shape[dim];
+            if (dim + 1 < ndim) {
+                row_offset += static_cast<std::ptrdiff_t>(index[dim]) * _strides[dim];
+            }
+        }
+
+        size_t count = stop - start;
+        size_t inner = index.back();
+        while (true) {
+            const std::byte* ptr = _data + row_offset + static_cast<std::ptrdiff_t>(inner) * inner_stride;
+            const size_t run = std::min(inner_size - inner, count);
+            for (size_t i = 0; i < run; i++) {
+                func(*reinterpret_cast<const T*>(ptr));
+                ptr += inner_stride;
+            }
+            count -= run;
+            if (count == 0) {
+                return;
+            }
+            // Move to the start of the next row.
+            inner = 0;
+            for (size_t dim = ndim - 1; dim-- > 0;) {
+                index[dim]++;
+                row_offset += _strides[dim];
+                if (index[dim] < _shape[dim]) {
+                    break;
+                }
+                row_offset -= _strides[dim] * static_cast<std::ptrdiff_t>(_shape[dim]);
+                index[dim] = 0;
+            }
+        }
+    }
+};
+
+namespace detail {
+    // Get the number of threads to use.
+    // If thread_count is 0 the hardware concurrency is used.
+    inline size_t get_thread_count(size_t thread_count)
+    {
+        if (thread_count == 0) {
+            thread_count = std::thread::hardware_concurrency();
+        }
+        return std::max<size_t>(thread_count, 1);
+    }
+
+    // Get the number of chunks to split size elements into.
+    inline size_t get_chunk_count(size_t size, size_t thread_count)
+    {
+        return std::clamp<size_t>(size / ParallelMinChunkSize, 1, get_thread_count(thread_count));
+    }
+
+    // Get the start index of a chunk.
+    inline size_t get_chunk_start(size_t size, size_t chunk_count, size_t chunk_index)
+    {
+        return size * chunk_index / chunk_count;
+    }
+
+    // Call func with each index in the range [0, count).
+    // Index 0 is processed in the calling thread and the others in new threads.
+    // Blocks until all calls have finished.
+    // If any call throws, the first exception is rethrown once all threads have finished.
+    inline void parallel_for(size_t count, std::function<void(size_t)> func)
+    {
+        if (count == 0) {
+            return;
+        }
+        std::mutex exception_mutex;
+        std::exception_ptr exception;
+        auto run = [&](size_t index) {
+            try {
+                func(index);
+            } catch (...) {
+                std::lock_guard lock(exception_mutex);
+                if (!exception) {
+                    exception = std::current_exception();
+                }
+            }
+        };
+        std::vector<std::thread> threads;
+        threads.reserve(count - 1);
+        for (size_t index = 1; index < count; index++) {
+            threads.emplace_back(run, index);
+        }
+        run(0);
+        for (auto& thread : threads) {
+            thread.join();
+        }
+        if (exception) {
+            std::rethrow_exception(exception);
+        }
+    }
+
+    // Call func with each element in the range [start, stop) of a contiguous array.
+    template <typename T, typename funcT>
+    void for_each(std::span<const T> arr, size_t start, size_t stop, funcT func)
+    {
+        for (size_t i = start; i < stop; i++) {
+            func(arr[i]);
+        }
+    }
+
+    // Call func with each element in the range [start, stop) of a strided array.
+    template <typename T, typename funcT>
+    void for_each(const StridedSpan<T>& arr, size_t start, size_t stop, funcT func)
+    {
+        arr.for_each(start, stop, func);
+    }
+
+    // A map from value to index backed by a hash map.
+    template <typename dtypeT, typename inverseT>
+    class HashIndexMap {
+    private:
+        std::unordered_map<dtypeT, inverseT> _map;
+
+    public:
+        // Get the index of value.
+        // If value is not in the map, index is inserted and returned.
+        // The bool is true if the value was inserted.
+        std::pair<inverseT, bool> try_emplace(dtypeT value, inverseT index)
+        {
+            auto [it, inserted] = _map.try_emplace(value, index);
+            return std::make_pair(it->second, inserted);
+        }
+
+        // Remove all values from the map.
+        // The allocated buckets are kept so the map can be reused.
+        void clear(std::span<const dtypeT> values)
+        {
+            _map.clear();
+        }
+    };
+
+    // A map from value to index backed by a flat table.
+    // Only valid for integer values in the range [min, min + size).
+    template <typename dtypeT, typename inverseT>
+    class DenseIndexMap {
+    private:
+        using unsignedT = std::make_unsigned_t<dtypeT>;
+        static constexpr inverseT Empty = std::numeric_limits<inverseT>::max();
+
+        unsignedT _min = 0;
+        size_t _size = 0;
+        std::vector<inverseT> _table;
+
+        size_t get_offset(dtypeT value) const
+        {
+            // Unsigned arithmetic does not overflow.
+            return static_cast<unsignedT>(static_cast<unsignedT>(value) - _min);
+        }
+
+    public:
+        DenseIndexMap() = default;
+
+        DenseIndexMap(dtypeT min, size_t size)
+        {
+            set_range(min, size);
+        }
+
+        // Set the range of values the map supports.
+        // The map must be empty.
+        // The table only grows so it can be reused for different ranges.
+        void set_range(dtypeT min, size_t size)
+        {
+            _min = static_cast<unsignedT>(min);
+            _size = size;
+            if (_table.size() < size) {
+                _table.resize(size, Empty);
+            }
+        }
+
+        // Get the index of value.
+        // If value is not in the map, index is inserted and returned.
+        // The bool is true if the value was inserted.
+        std::pair<inverseT, bool> try_emplace(dtypeT value, inverseT index)
+        {
+            size_t offset = get_offset(value);
+            if (_size <= offset) {
+                throw std::invalid_argument("Value is outside the range of the lookup table.");
+            }
+            auto& slot = _table[offset];
+            if (slot == Empty) {
+                slot = index;
+                return std::make_pair(index, true);
+            }
+            return std::make_pair(slot, false);
+        }
+
+        // Remove values from the map.
+        // values must contain every value in the map.
+        // Only the slots of these values are reset which is cheaper than resetting the whole table.
+        void clear(std::span<const dtypeT> values)
+        {
+            for (const auto& value : values) {
+                _table[get_offset(value)] = Empty;
+            }
+        }
+    };
+
+    // A map from value to index backed by an open addressing hash table with linear probing.
+    // This avoids the per value allocations of std::unordered_map.
+    template <typename dtypeT, typename inverseT>
+    class FlatIndexMap {
+    private:
+        static constexpr inverseT Empty = std::numeric_limits<inverseT>::max();
+        // The table grows when more than 3/4 of the slots are used.
+        static constexpr size_t MaxLoadNumerator = 3;
+        static constexpr size_t MaxLoadDenominator = 4;
+
+        struct Slot {
+            dtypeT value;
+            inverseT index = Empty;
+        };
+
+        std::vector<Slot> _table;
+        size_t _mask = 0;
+        size_t _size = 0;
+
+        static size_t get_capacity(size_t count)
+        {
+            return std::bit_ceil(std::max<size_t>(16, count * MaxLoadDenominator / MaxLoadNumerator + 1));
+        }
+
+        static size_t hash(const dtypeT& value)
+        {
+            // Mix the bits because std::hash of an integer is usually the identity.
+            // This is the MurmurHash3 finaliser.
+            std::uint64_t h = std::hash<dtypeT> {}(value);
+            h ^= h >> 33;
+            h *= 0xff51afd7ed558ccdULL;
+            h ^= h >> 33;
+            h *= 0xc4ceb9fe1a85ec53ULL;
+            h ^= h >> 33;
+            return static_cast<size_t>(h);
+        }
+
+        Slot& find_slot(const dtypeT& value)
+        {
+            size_t slot_index = hash(value) & _mask;
+            while (true) {
+                auto& slot = _table[slot_index];
+                if (slot.index == Empty || slot.value == value) {
+                    return slot;
+                }
+                slot_index = (slot_index + 1) & _mask;
+            }
+        }
+
+        void rehash(size_t capacity)
+        {
+            std::vector<Slot> old_table(capacity);
+            std::swap(_table, old_table);
+            _mask = capacity - 1;
+            for (const auto& slot : old_table) {
+                if (slot.index != Empty) {
+                    find_slot(slot.value) = slot;
+                }
+            }
+        }
+
+    public:
+        // count is the expected number of values.
+        FlatIndexMap(size_t count = 0)
+        {
+            reserve(count);
+        }
+
+        // Make space for count values without rehashing.
+        void reserve(size_t count)
+        {
+            const size_t capacity = get_capacity(count);
+            if (_table.size() < capacity) {
+                rehash(capacity);
+            }
+        }
+
+        // Get the index of value.
+        // If value is not in the map, index is inserted and returned.
+        // The bool is true if the value was inserted.
+        std::pair<inverseT, bool> try_emplace(dtypeT value, inverseT index)
+        {
+            auto* slot = &find_slot(value);
+            if (slot->index != Empty) {
+                return std::make_pair(slot->index, false);
+            }
+            if (_table.size() * MaxLoadNumerator < (_size + 1) * MaxLoadDenominator) {
+                rehash(_table.size() * 2);
+                slot = &find_slot(value);
+            }
+            slot->value = value;
+            slot->index = index;
+            _size++;
+            return std::make_pair(index, true);
+        }
+
+        // Remove all values from the map.
+        // The table is kept so the map can be reused.
+        void clear(std::span<const dtypeT> values)
+        {
+            std::fill(_table.begin(), _table.end(), Slot());
+            _size = 0;
+        }
+    };
+
+    // The number of elements sampled to estimate the number of unique values.
+    constexpr size_t UniqueEstimateSampleCount = 16;
+    constexpr size_t UniqueEstimateSampleSize = 256;
+
+    // Estimate the number of unique values in arr from evenly spaced samples.
+    // This uses the bias corrected Chao1 estimator which extrapolates from
+    // the number of values seen exactly once and exactly twice in the sample.
+    template <typename dtypeT, typename arrT>
+    size_t estimate_unique_count(const arrT& arr)
+    {
+        const size_t sample_size = std::min(arr.size(), UniqueEstimateSampleCount * UniqueEstimateSampleSize);
+        FlatIndexMap<dtypeT, std::uint32_t> value_to_index(sample_size);
+        std::vector<std::uint32_t> counts;
+        auto add_values = [&](size_t start, size_t stop) {
+            for_each(arr, start, stop, [&](dtypeT value) {
+                auto [index, inserted] = value_to_index.try_emplace(value, static_cast<std::uint32_t>(counts.size()));
+                if (inserted) {
+                    counts.push_back(1);
+                } else {
+                    counts[index]++;
+                }
+            });
+        };
+        if (arr.size() == sample_size) {
+            add_values(0, arr.size());
+            return counts.size();
+        }
+        for (size_t sample_index = 0; sample_index < UniqueEstimateSampleCount; sample_index++) {
+            const size_t start = get_chunk_start(arr.size(), UniqueEstimateSampleCount, sample_index);
+            add_values(start, start + UniqueEstimateSampleSize);
+        }
+        const double f1 = static_cast<double>(std::count(counts.begin(), counts.end(), 1));
+        const double f2 = static_cast<double>(std::count(counts.begin(), counts.end(), 2));
+        const double estimate = static_cast<double>(counts.size()) + f1 * (f1 - 1) / (2 * (f2 + 1));
+        return static_cast<size_t>(std::min(estimate, static_cast<double>(arr.size())));
+    }
+
+    // Single threaded implementation of unique_inverse over the elements [start, stop) of arr.
+    // Values are appended to unique in the order they are first found.
+    // inverse is populated with the index of each value in unique.
+    template <typename dtypeT, typename inverseT, typename arrT, typename mapT>
+    void unique_inverse_serial(const arrT& arr, size_t start, size_t stop, std::vector<dtypeT>& unique, std::span<inverseT> inverse, mapT& value_to_index)
+    {
+        inverseT* inverse_ptr = inverse.data();
+        for_each(arr, start, stop, [&](dtypeT value) {
+            auto [index, inserted] = value_to_index.try_emplace(value, static_cast<inverseT>(unique.size()));
+            if (inserted) {
+                unique.push_back(value);
+            }
+            *inverse_ptr++ = index;
+        });
+    }
+
+    // Chunked implementation of unique_inverse.
+    // make_map is called to create a new empty index map for each chunk.
+    // The unique values of each chunk are merged into unique and value_to_index which may already contain values.
+    template <typename dtypeT, typename inverseT, typename arrT, typename makeMapT, typename mergeMapT>
+    void unique_inverse_chunked(
+        const arrT& arr,
+        std::vector<dtypeT>& unique,
+        std::span<inverseT> inverse,
+        size_t chunk_count,
+        makeMapT make_map,
+        mergeMapT& value_to_index)
+    {
+        // If there are no existing values, the first chunk's values are all new so its lookup is the identity.
+        const bool first_chunk_identity = unique.empty();
+
+        if (chunk_count == 1 && first_chunk_identity) {
+            unique_inverse_serial<dtypeT, inverseT>(arr, 0, arr.size(), unique, inverse, value_to_index);
+            return;
+        }
+
+        auto get_start = [&](size_t chunk_index) {
+            return get_chunk_start(arr.size(), chunk_count, chunk_index);
+        };
+        auto get_inverse_chunk = [&](size_t chunk_index) {
+            return inverse.subspan(get_start(chunk_index), get_start(chunk_index + 1) - get_start(chunk_index));
+        };
+
+        // Find the unique values in each chunk.
+        // The inverse of each chunk indexes into the unique values of that chunk.
+        std::vector<std::vector<dtypeT>> chunk_unique(chunk_count);
+        parallel_for(chunk_count, [&](size_t chunk_index) {
+            auto chunk_value_to_index = make_map();
+            unique_inverse_serial<dtypeT, inverseT>(
+                arr,
+                get_start(chunk_index),
+                get_start(chunk_index + 1),
+                chunk_unique[chunk_index],
+                get_inverse_chunk(chunk_index),
+                chunk_value_to_index);
+        });
+
+        // Merge the chunk values in chunk order.
+        // This preserves the order values are first found.
+        const size_t first_remap_chunk = first_chunk_identity ? 1 : 0;
+        std::vector<std::vector<inverseT>> chunk_lut(chunk_count);
+        for (size_t chunk_index = 0; chunk_index < chunk_count; chunk_index++) {
+            const bool remap = first_remap_chunk <= chunk_index;
+            auto& lut = chunk_lut[chunk_index];
+            if (remap) {
+                lut.reserve(chunk_unique[chunk_index].size());
+            }
+            for (const auto& value : chunk_unique[chunk_index]) {
+                auto [index, inserted] = value_to_index.try_emplace(value, static_cast<inverseT>(unique.size()));
+                if (inserted) {
+                    unique.push_back(value);
+                }
+                if (remap) {
+                    lut.push_back(index);
+                }
+            }
+        }
+
+        // Remap the chunk inverse to the merged unique values.
+        parallel_for(chunk_count - first_remap_chunk, [&](size_t index) {
+            const size_t chunk_index = index + first_remap_chunk;
+            const auto& lut = chunk_lut[chunk_index];
+            for (auto& i : get_inverse_chunk(chunk_index)) {
+                i = lut[i];
+            }
+        });
+    }
+
+    // Find the minimum and maximum value in a non-empty array.
+    template <typename dtypeT, typename arrT>
+    std::pair<dtypeT, dtypeT> minmax(const arrT& arr, size_t chunk_count)
+    {
+        std::vector<std::pair<dtypeT, dtypeT>> chunk_minmax(chunk_count);
+        parallel_for(chunk_count, [&](size_t chunk_index) {
+            size_t start = get_chunk_start(arr.size(), chunk_count, chunk_index);
+            size_t stop = get_chunk_start(arr.size(), chunk_count, chunk_index + 1);
+            dtypeT min = std::numeric_limits<dtypeT>::max();
+            dtypeT max = std::numeric_limits<dtypeT>::lowest();
+            // A plain loop is used for contiguous arrays because the compiler can vectorise it.
+            for_each(arr, start, stop, [&](dtypeT value) {
+                min = std::min(min, value);
+                max = std::max(max, value);
+            });
+            chunk_minmax[chunk_index] = std::make_pair(min, max);
+        });
+        auto result = chunk_minmax[0];
+        for (const auto& [min, max] : chunk_minmax) {
+            result.first = std::min(result.first, min);
+            result.second = std::max(result.second, max);
+        }
+        return result;
+    }
+
+    // Find the range of values in arr if it is small enough to use a DenseIndexMap.
+    // Returns the minimum value and the table size or std::nullopt if a hash map should be used.
+    template <typename dtypeT, typename arrT>
+    std::optional<std::pair<dtypeT, size_t>> get_dense_range(const arrT& arr, size_t chunk_count, std::optional<dtypeT> max_value)
+    {
+        if constexpr (std::is_integral_v<dtypeT> && !std::is_same_v<dtypeT, bool>) {
+            using unsignedT = std::make_unsigned_t<dtypeT>;
+            constexpr size_t dtype_range = std::numeric_limits<unsignedT>::max();
+
+            // Find the range of values.
+            dtypeT min;
+            dtypeT max;
+            if (max_value) {
+                if constexpr (std::is_signed_v<dtypeT>) {
+                    if (*max_value < 0) {
+                        throw std::invalid_argument("max_value must not be negative.");
+                    }
+                }
+                min = 0;
+                max = *max_value;
+            } else if (dtype_range < DenseMinRange && dtype_range < arr.size()) {
+                // The full range of the type is small enough.
+                min = std::numeric_limits<dtypeT>::min();
+                max = std::numeric_limits<dtypeT>::max();
+            } else {
+                std::tie(min, max) = minmax<dtypeT>(arr, chunk_count);
+            }
+
+            // The number of possible values minus one.
+            const size_t range = static_cast<unsignedT>(static_cast<unsignedT>(max) - static_cast<unsignedT>(min));
+            if (range < std::max(DenseMinRange, arr.size() / chunk_count)) {
+                return std::make_pair(min, range + 1);
+            }
+        }
+        return std::nullopt;
+    }
+
+    // Validate the arguments passed to unique_inverse.
+    template <typename dtypeT, typename inverseT, typename arrT>
+    void validate_unique_inverse(const arrT& arr, const std::vector<dtypeT>& unique, std::span<inverseT> inverse)
+    {
+        if (arr.size() != inverse.size()) {
+            throw std::invalid_argument("arr and inverse must have the same size.");
+        }
+        if (unique.size()) {
+            throw std::invalid_argument("unique must be empty.");
+        }
+        if (std::numeric_limits<inverseT>::max() < arr.size()) {
+            throw std::invalid_argument("inverseT is too small.");
+        }
+    }
+
+    template <typename dtypeT, typename inverseT, typename arrT>
+    void unique_inverse(
+        const arrT& arr,
+        std::vector<dtypeT>& unique,
+        std::span<inverseT> inverse,
+        size_t thread_count,
+        std::optional<dtypeT> max_value,
+        UniqueInverseMethod method)
+    {
+        validate_unique_inverse(arr, unique, inverse);
+        if (arr.empty()) {
+            return;
+        }
+
+        const size_t chunk_count = get_chunk_count(arr.size(), thread_count);
+
+        if (method == UniqueInverseMethod::Auto) {
+            if (auto dense_range = get_dense_range<dtypeT>(arr, chunk_count, max_value)) {
+                if constexpr (std::is_integral_v<dtypeT> && !std::is_same_v<dtypeT, bool>) {
+                    auto make_map = [&] {
+                        return DenseIndexMap<dtypeT, inverseT>(dense_range->first, dense_range->second);
+                    };
+                    auto value_to_index = make_map();
+                    unique_inverse_chunked<dtypeT, inverseT>(arr, unique, inverse, chunk_count, make_map, value_to_index);
+                    return;
+                }
+            }
+        }
+
+        // Arrays smaller than FlatHashMinUnique cannot have enough unique values to use the flat map.
+        // Skip the estimate for these so that Auto is no slower than Hash.
+        const bool estimate = method == UniqueInverseMethod::FlatHash
+            || (method == UniqueInverseMethod::Auto && FlatHashMinUnique <= arr.size());
+        const size_t unique_count = estimate ? estimate_unique_count<dtypeT>(arr) : 0;
+        if (method == UniqueInverseMethod::FlatHash || (method == UniqueInverseMethod::Auto && FlatHashMinUnique <= unique_count)) {
+            // Reserve each chunk map for the values expected in the chunk.
+            const size_t chunk_size = arr.size() / chunk_count + 1;
+            auto make_map = [&] {
+                return FlatIndexMap<dtypeT, inverseT>(std::min(unique_count, chunk_size));
+            };
+            FlatIndexMap<dtypeT, inverseT> value_to_index(unique_count);
+            unique_inverse_chunked<dtypeT, inverseT>(arr, unique, inverse, chunk_count, make_map, value_to_index);
+            return;
+        }
+
+        auto make_map = [] {
+            return HashIndexMap<dtypeT, inverseT>();
+        };
+        auto value_to_index = make_map();
+        unique_inverse_chunked<dtypeT, inverseT>(arr, unique, inverse, chunk_count, make_map, value_to_index);
+    }
+
+    // Process many arrays across a pool of threads.
+    // Each array is processed by a single thread.
+    // Each thread reuses its index maps between arrays.
+    template <typename dtypeT, typename inverseT>
+    void unique_inverse_many(
+        std::span<const StridedSpan<dtypeT>> arrs,
+        std::span<std::vector<dtypeT>> uniques,
+        std::span<const std::span<inverseT>> inverses,
+        size_t thread_count,
+        std::optional<dtypeT> max_value)
+    {
+        if (arrs.size() != uniques.size() || arrs.size() != inverses.size()) {
+            throw std::invalid_argument("arrs, uniques and inverses must have the same size.");
+        }
+        for (size_t i = 0; i < arrs.size(); i++) {
+            validate_unique_inverse(arrs[i], uniques[i], inverses[i]);
+        }
+
+        std::atomic<size_t> next_index = 0;
+        parallel_for(std::min(get_thread_count(thread_count), arrs.size()), [&](size_t) {
+            HashIndexMap<dtypeT, inverseT> hash_map;
+            std::conditional_t<
+                std::is_integral_v<dtypeT> && !std::is_same_v<dtypeT, bool>,
+                DenseIndexMap<dtypeT, inverseT>,
+                HashIndexMap<dtypeT, inverseT>>
+                dense_map;
+
+            auto process = [&](const StridedSpan<dtypeT>& arr, std::vector<dtypeT>& unique, std::span<inverseT> inverse, auto& value_to_index) {
+                if (arr.is_contiguous()) {
+                    std::span<const dtypeT> contiguous_arr(arr.data(), arr.size());
+                    unique_inverse_serial<dtypeT, inverseT>(contiguous_arr, 0, arr.size(), unique, inverse, value_to_index);
+                } else {
+                    unique_inverse_serial<dtypeT, inverseT>(arr, 0, arr.size(), unique, inverse, value_to_index);
+                }
+                value_to_index.clear(unique);
+            };
+
+            for (size_t i = next_index++; i < arrs.size(); i = next_index++) {
+                const auto& arr = arrs[i];
+                if (arr.empty()) {
+                    continue;
+                }
+                if (auto dense_range = get_dense_range<dtypeT>(arr, 1, max_value)) {
+                    if constexpr (std::is_integral_v<dtypeT> && !std::is_same_v<dtypeT, bool>) {
+                        dense_map.set_range(dense_range->first, dense_range->second);
+                    }
+                    process(arr, uniques[i], inverses[i], dense_map);
+                } else {
+                    process(arr, uniques[i], inverses[i], hash_map);
+                }
+            }
+        });
+    }
+
+    // The number of elements remapped between bounds checks.
+    // Each block is checked and then remapped in loops the compiler can vectorise.
+    constexpr size_t RemapBlockSize = 1024;
+
+    // Remap the elements [start, stop) of a contiguous index array.
+    template <typename indexT, typename valueT>
+    void remap_serial(std::span<const indexT> index, std::span<const valueT> lut, std::span<valueT> out, size_t start, size_t stop)
+    {
+        // Indexes can only be out of range if the lookup table is smaller than the index type.
+        const bool check = lut.size() <= std::numeric_limits<indexT>::max();
+        const indexT* index_ptr = index.data();
+        const valueT* lut_ptr = lut.data();
+        valueT* out_ptr = out.data();
+        for (size_t block_start = start; block_start < stop; block_start += RemapBlockSize) {
+            const size_t block_stop = std::min(block_start + RemapBlockSize, stop);
+            if (check) {
+                indexT block_max = 0;
+                for (size_t i = block_start; i < block_stop; i++) {
+                    block_max = std::max(block_max, index_ptr[i]);
+                }
+                if (lut.size() <= block_max) {
+                    throw std::invalid_argument("Index is outside of the lookup table.");
+                }
+            }
+            for (size_t i = block_start; i < block_stop; i++) {
+                out_ptr[i] = lut_ptr[index_ptr[i]];
+            }
+        }
+    }
+
+    // Remap the elements [start, stop) of a strided index array.
+    template <typename indexT, typename valueT>
+    void remap_serial(const StridedSpan<indexT>& index, std::span<const valueT> lut, std::span<valueT> out, size_t start, size_t stop)
+    {
+        valueT* out_ptr = out.data() + start;
+        index.for_each(start, stop, [&](const indexT& i) {
+            if (lut.size() <= i) {
+                throw std::invalid_argument("Index is outside of the lookup table.");
+            }
+            *out_ptr++ = lut[i];
+        });
+    }
+
+    template <typename indexT, typename valueT, typename arrT>
+    void remap(const arrT& index, std::span<const valueT> lut, std::span<valueT> out, size_t thread_count)
+    {
+        if (index.size() != out.size()) {
+            throw std::invalid_argument("index and out must have the same size.");
+        }
+        const size_t chunk_count = get_chunk_count(index.size(), thread_count);
+        parallel_for(chunk_count, [&](size_t chunk_index) {
+            remap_serial<indexT, valueT>(
+                index,
+                lut,
+                out,
+                get_chunk_start(index.size(), chunk_count, chunk_index),
+                get_chunk_start(index.size(), chunk_count, chunk_index + 1));
+        });
+    }
+} // namespace detail
+
+// Find the unique values in arr and the index of each element of arr in the unique values.
+// The unique values are in the order they are first found in arr.
+// Large arrays are split into chunks which are processed in parallel.
+// Integer arrays with a small range of values use a direct lookup table instead of a hash map.
+// thread_count is the maximum number of threads to use. If 0, the hardware concurrency is used.
+// max_value is an optional hint that all values are in the range [0, max_value].
+// If given, the value range is not computed.
+// If a lookup table is used and a value is outside of the range, std::invalid_argument is thrown.
+// method selects the lookup algorithm. See UniqueInverseMethod.
 // dtypeT can be any numerical type.
 // inverseT must be large enough to store the length of arr.
 template <typename dtypeT, typename inverseT>
-void unique_inverse(const std::span<dtypeT> arr, std::vector<dtypeT>& unique, std::span<inverseT>& inverse)
+void unique_inverse(
+    const std::span<dtypeT> arr,
+    std::vector<dtypeT>& unique,
+    std::span<inverseT>& inverse,
+    size_t thread_count = 0,
+    std::optional<dtypeT> max_value = std::nullopt,
+    UniqueInverseMethod method = UniqueInverseMethod::Auto)
 {
-    if (arr.size() != inverse.size()) {
-        throw std::invalid_argument("arr and inverse must have the same size.");
-    }
-    if (unique.size()) {
-        throw std::invalid_argument("unique must be empty.");
+    detail::unique_inverse<dtypeT, inverseT>(std::span<const dtypeT>(arr), unique, inverse, thread_count, max_value, method);
+}
+
+// An overload of unique_inverse for N dimensional strided arrays.
+// The elements are processed in C order and inverse is the C order flattened inverse array.
+template <typename dtypeT, typename inverseT>
+void unique_inverse(
+    const StridedSpan<dtypeT>& arr,
+    std::vector<dtypeT>& unique,
+    std::span<inverseT> inverse,
+    size_t thread_count = 0,
+    std::optional<dtypeT> max_value = std::nullopt,
+    UniqueInverseMethod method = UniqueInverseMethod::Auto)
+{
+    if (arr.is_contiguous()) {
+        detail::unique_inverse<dtypeT, inverseT>(std::span<const dtypeT>(arr.data(), arr.size()), unique, inverse, thread_count, max_value, method);
+    } else {
+        detail::unique_inverse<dtypeT, inverseT>(arr, unique, inverse, thread_count, max_value, method);
     }
-    if (std::numeric_limits<inverseT>::max() < arr.size()) {
-        throw std::invalid_argument("inverseT is too small.");
+}
+
+// A palette of unique values that grows as arrays are mapped onto it.
+// This allows many arrays to share one set of unique values.
+// The lookup from value to index persists between calls so existing values are not hashed again.
+// Not thread safe.
+template <typename dtypeT, typename inverseT>
+class UniquePalette {
+private:
+    std::vector<dtypeT> _values;
+    detail::HashIndexMap<dtypeT, inverseT> _value_to_index;
+
+public:
+    // Construct an empty palette.
+    UniquePalette() = default;
+
+    // Construct a palette from existing unique values.
+    // Throws std::invalid_argument if values contains duplicates.
+    UniquePalette(std::span<const dtypeT> values)
+    {
+        if (std::numeric_limits<inverseT>::max() < values.size()) {
+            throw std::invalid_argument("inverseT is too small.");
+        }
+        _values.reserve(values.size());
+        for (const auto& value : values) {
+            if (!_value_to_index.try_emplace(value, static_cast<inverseT>(_values.size())).second) {
+                throw std::invalid_argument("Palette values must be unique.");
+            }
+            _values.push_back(value);
+        }
     }
-    // Map from found values to their index in unique
-    std::unordered_map<dtypeT, inverseT> value_to_index;
 
-    for (inverseT i = 0; i < arr.size(); i++) {
-        dtypeT value = arr[i];
-        auto it = value_to_index.find(value);
-        if (it == value_to_index.end()) {
-            inverse[i] = value_to_index[value] = static_cast<inverseT>(unique.size());
-            unique.push_back(value);
+    // The values in the palette in the order they were added.
+    const std::vector<dtypeT>& values() const { return _values; }
+
+    // The number of values in the palette.
+    size_t size() const { return _values.size(); }
+
+    // Map arr onto the palette.
+    // Values that are not in the palette are appended in the order they are first found.
+    // inverse is populated with the index of each element of arr in the palette.
+    // Large arrays are split into chunks which are processed in parallel.
+    // thread_count is the maximum number of threads to use. If 0, the hardware concurrency is used.
+    void unique_inverse(const StridedSpan<dtypeT>& arr, std::span<inverseT> inverse, size_t thread_count = 0)
+    {
+        if (arr.size() != inverse.size()) {
+            throw std::invalid_argument("arr and inverse must have the same size.");
+        }
+        if (std::numeric_limits<inverseT>::max() - _values.size() < arr.size()) {
+            throw std::invalid_argument("inverseT is too small.");
+        }
+        if (arr.empty()) {
+            return;
+        }
+
+        const size_t chunk_count = detail::get_chunk_count(arr.size(), thread_count);
+
+        auto process = [&](const auto& arr) {
+            // Each chunk is first mapped with a temporary map.
+            // Only the unique values of each chunk are then looked up in the persistent map.
+            if (auto dense_range = detail::get_dense_range<dtypeT>(arr, chunk_count, std::nullopt)) {
+                if constexpr (std::is_integral_v<dtypeT> && !std::is_same_v<dtypeT, bool>) {
+                    detail::unique_inverse_chunked<dtypeT, inverseT>(arr, _values, inverse, chunk_count, [&] { return detail::DenseIndexMap<dtypeT, inverseT>(dense_range->first, dense_range->second); }, _value_to_index);
+                    return;
+                }
+            }
+            detail::unique_inverse_chunked<dtypeT, inverseT>(arr, _values, inverse, chunk_count, [] { return detail::HashIndexMap<dtypeT, inverseT>(); }, _value_to_index);
+        };
+
+        if (arr.is_contiguous()) {
+            process(std::span<const dtypeT>(arr.data(), arr.size()));
         } else {
-            inverse[i] = it->second;
+            process(arr);
         }
     }
+};
+
+// An overload of unique_inverse that maps arr onto an existing palette.
+// Values that are not in the palette are appended to it.
+// See UniquePalette::unique_inverse
+template <typename dtypeT, typename inverseT>
+void unique_inverse(
+    const StridedSpan<dtypeT>& arr,
+    UniquePalette<dtypeT, inverseT>& palette,
+    std::span<inverseT> inverse,
+    size_t thread_count = 0)
+{
+    palette.unique_inverse(arr, inverse, thread_count);
+}
+
+// Find the unique values and inverse of many arrays.
+// This is equivalent to calling unique_inverse on each array but the arrays are processed in parallel.
+// Each array is processed by one thread which reuses its lookup storage between arrays.
+// uniques and inverses must have the same size as arrs.
+// See unique_inverse for the other arguments.
+template <typename dtypeT, typename inverseT>
+void unique_inverse_many(
+    std::span<const StridedSpan<dtypeT>> arrs,
+    std::span<std::vector<dtypeT>> uniques,
+    std::span<const std::span<inverseT>> inverses,
+    size_t thread_count = 0,
+    std::optional<dtypeT> max_value = std::nullopt)
+{
+    detail::unique_inverse_many<dtypeT, inverseT>(arrs, uniques, inverses, thread_count, max_value);
 }
+
+// Look up each element of index in lut and write the values to out.
+// This is equivalent to out[i] = lut[index[i]] for each element.
+// The elements are processed in C order and out is the C order flattened output array.
+// out may be the same memory as index if index is contiguous and the types have the same size.
+// Large arrays are split into chunks which are processed in parallel.
+// thread_count is the maximum number of threads to use. If 0, the hardware concurrency is used.
+// Throws std::invalid_argument if an index is outside of lut. Some of out may have been written.
+template <typename indexT, typename valueT>
+void remap(
+    const StridedSpan<indexT>& index,
+    std::span<const valueT> lut,
+    std::span<valueT> out,
+    size_t thread_count = 0)
+{
+    if (index.is_contiguous()) {
+        detail::remap<indexT, valueT>(std::span<const indexT>(index.data(), index.size()), lut, out, thread_count);
+    } else {
+        detail::remap<indexT, valueT>(index, lut, out, thread_count);
+    }
 }
+} // namespace Amulet
@@ -4,11 +4,358 @@
 
 #include <amulet/pybind11_extensions/numpy.hpp>
 
+#include <limits>
+#include <memory>
+#include <mutex>
+#include <variant>
+
 #include <amulet/utils/numpy.hpp>
 
 namespace py = pybind11;
 namespace pyext = Amulet::pybind11_extensions;
 
+// Get a view of a buffer.
+template <typename dtypeT>
+static Amulet::StridedSpan<dtypeT> get_strided_span(const py::buffer_info& info)
+{
+    return Amulet::StridedSpan<dtypeT>(
+        static_cast<const dtypeT*>(info.ptr),
+        std::vector<size_t>(info.shape.begin(), info.shape.end()),
+        std::vector<std::ptrdiff_t>(info.strides.begin(), info.strides.end()));
+}
+
+// Get a span of a contiguous array.
+template <typename T>
+static std::span<T> get_span(pyext::numpy::array_t<T>& arr)
+{
+    return std::span<T>(arr.mutable_data(), arr.size());
+}
+
+// Create an array that takes ownership of the vector's memory without copying.
+template <typename T>
+static pyext::numpy::array_t<T> vector_to_array(std::vector<T>&& vec)
+{
+    auto owned = std::make_unique<std::vector<T>>(std::move(vec));
+    py::capsule owner(owned.get(), [](void* ptr) { delete static_cast<std::vector<T>*>(ptr); });
+    auto* data = owned.release();
+    return pyext::numpy::array_t<T>(data->size(), data->data(), owner);
+}
+
+// Validate an output array and get a span of its data.
+template <typename T>
+static std::span<T> get_out_span(py::array& out, const std::vector<py::ssize_t>& shape, const std::string& name)
+{
+    if (!out.dtype().equal(py::dtype::of<T>())) {
+        throw std::invalid_argument(name + " has the wrong dtype.");
+    }
+    if (!(out.flags() & py::array::c_style)) {
+        throw std::invalid_argument(name + " must be C contiguous.");
+    }
+    if (!out.writeable()) {
+        throw std::invalid_argument(name + " must be writeable.");
+    }
+    if (std::vector<py::ssize_t>(out.shape(), out.shape() + out.ndim()) != shape) {
+        throw std::invalid_argument(name + " has the wrong shape.");
+    }
+    return std::span<T>(static_cast<T*>(out.mutable_data()), out.size());
+}
+
+// Get the inverse array and a span of its data.
+// If inverse_out is defined it is validated and used otherwise a new array is created.
+static std::pair<py::array, std::span<std::uint32_t>> get_inverse(
+    const std::optional<py::array>& inverse_out,
+    const std::vector<py::ssize_t>& shape)
+{
+    if (inverse_out) {
+        py::array inverse_arr = *inverse_out;
+        auto inverse = get_out_span<std::uint32_t>(inverse_arr, shape, "inverse_out");
+        return std::make_pair(inverse_arr, inverse);
+    }
+    pyext::numpy::array_t<std::uint32_t> inverse_arr(shape);
+    auto inverse = get_span(inverse_arr);
+    return std::make_pair(inverse_arr, inverse);
+}
+
+// Validate unique_out and get a span of its data.
+// This is done before the unique values are computed. The size is checked once they are known.
+template <typename dtypeT>
+static std::optional<std::pair<py::array, std::span<dtypeT>>> get_unique_out(const std::optional<py::array>& unique_out)
+{
+    if (!unique_out) {
+        return std::nullopt;
+    }
+    py::array unique_arr = *unique_out;
+    if (unique_arr.ndim() != 1) {
+        throw std::invalid_argument("unique_out must be one dimensional.");
+    }
+    auto out = get_out_span<dtypeT>(unique_arr, { unique_arr.shape(0) }, "unique_out");
+    return std::make_pair(unique_arr, out);
+}
+
+// Get the unique array.
+// If unique_out is defined the values are copied into it and a view of the populated values is returned.
+// Otherwise the array takes ownership of the vector's memory.
+template <typename dtypeT>
+static py::array get_unique(const std::optional<std::pair<py::array, std::span<dtypeT>>>& unique_out, std::vector<dtypeT>&& unique)
+{
+    if (unique_out) {
+        const auto& [unique_arr, out] = *unique_out;
+        if (out.size() < unique.size()) {
+            throw std::invalid_argument("unique_out is too small.");
+        }
+        std::copy(unique.begin(), unique.end(), out.begin());
+        return unique_arr[py::slice(0, unique.size(), 1)];
+    }
+    return vector_to_array(std::move(unique));
+}
+
+// Convert the max value hint to the array type.
+// Hints larger than the maximum value of the type are clamped to it.
+template <typename dtypeT>
+static std::optional<dtypeT> get_max_value(const std::optional<py::int_>& max_value)
+{
+    if (max_value) {
+        if (*max_value < py::int_(0)) {
+            throw std::invalid_argument("max_value must not be negative.");
+        }
+        if (py::int_(std::numeric_limits<dtypeT>::max()) < *max_value) {
+            return std::numeric_limits<dtypeT>::max();
+        }
+        return max_value->cast<dtypeT>();
+    }
+    return std::nullopt;
+}
+
+template <typename dtypeT>
+static std::pair<py::array, py::array> unique_inverse_typed(
+    const py::buffer_info& arr_info,
+    size_t thread_count,
+    const std::optional<py::int_>& max_value,
+    const std::optional<py::array>& inverse_out,
+    const std::optional<py::array>& unique_out,
+    Amulet::UniqueInverseMethod method)
+{
+    // Get a view of the array
+    const auto arr = get_strided_span<dtypeT>(arr_info);
+    // create the unique container
+    std::vector<dtypeT> unique;
+    // get the inverse array
+    auto [inverse_arr, inverse] = get_inverse(inverse_out, arr_info.shape);
+    // Validate the unique output array before doing any work
+    auto unique_out_span = get_unique_out<dtypeT>(unique_out);
+    // Get the max value hint
+    auto max_value_hint = get_max_value<dtypeT>(max_value);
+    {
+        // Call unique
+        py::gil_scoped_release nogil;
+        Amulet::unique_inverse(arr, unique, inverse, thread_count, max_value_hint, method);
+    }
+    // Return the new values
+    return std::make_pair(get_unique(unique_out_span, std::move(unique)), inverse_arr);
+}
+
+template <typename dtypeT>
+static std::vector<std::pair<py::array, py::array>> unique_inverse_many_typed(
+    const std::vector<py::buffer_info>& arr_infos,
+    size_t thread_count,
+    const std::optional<py::int_>& max_value)
+{
+    std::vector<Amulet::StridedSpan<dtypeT>> arrs;
+    std::vector<std::vector<dtypeT>> uniques(arr_infos.size());
+    std::vector<pyext::numpy::array_t<std::uint32_t>> inverse_arrs;
+    std::vector<std::span<std::uint32_t>> inverses;
+    arrs.reserve(arr_infos.size());
+    inverse_arrs.reserve(arr_infos.size());
+    inverses.reserve(arr_infos.size());
+    for (const auto& arr_info : arr_infos) {
+        if (!arr_info.item_type_is_equivalent_to<dtypeT>()) {
+            throw std::invalid_argument("All arrays must have the same dtype.");
+        }
+        arrs.push_back(get_strided_span<dtypeT>(arr_info));
+        inverses.push_back(get_span(inverse_arrs.emplace_back(arr_info.shape)));
+    }
+    auto max_value_hint = get_max_value<dtypeT>(max_value);
+    {
+        py::gil_scoped_release nogil;
+        Amulet::unique_inverse_many<dtypeT, std::uint32_t>(arrs, uniques, inverses, thread_count, max_value_hint);
+    }
+    std::vector<std::pair<py::array, py::array>> result;
+    result.reserve(arr_infos.size());
+    for (size_t i = 0; i < arr_infos.size(); i++) {
+        result.emplace_back(vector_to_array(std::move(uniques[i])), inverse_arrs[i]);
+    }
+    return result;
+}
+
+// Call func templated on the integer type equivalent to the buffer's item type.
+template <typename funcT>
+static auto visit_int_dtype(const py::buffer_info& info, funcT func)
+{
+    if (info.item_type_is_equivalent_to<std::uint8_t>()) {
+        return func.template operator()<std::uint8_t>();
+    } else if (info.item_type_is_equivalent_to<std::uint16_t>()) {
+        return func.template operator()<std::uint16_t>();
+    } else if (info.item_type_is_equivalent_to<std::uint32_t>()) {
+        return func.template operator()<std::uint32_t>();
+    } else if (info.item_type_is_equivalent_to<std::uint64_t>()) {
+        return func.template operator()<std::uint64_t>();
+    } else if (info.item_type_is_equivalent_to<std::int8_t>()) {
+        return func.template operator()<std::int8_t>();
+    } else if (info.item_type_is_equivalent_to<std::int16_t>()) {
+        return func.template operator()<std::int16_t>();
+    } else if (info.item_type_is_equivalent_to<std::int32_t>()) {
+        return func.template operator()<std::int32_t>();
+    } else if (info.item_type_is_equivalent_to<std::int64_t>()) {
+        return func.template operator()<std::int64_t>();
+    }
+    throw std::invalid_argument("dtype must be an 8, 16, 32 or 64 bit signed or unsigned integer.");
+}
+
+// Call func templated on the unsigned integer type equivalent to the buffer's item type.
+template <typename funcT>
+static auto visit_uint_dtype(const py::buffer_info& info, funcT func)
+{
+    if (info.item_type_is_equivalent_to<std::uint8_t>()) {
+        return func.template operator()<std::uint8_t>();
+    } else if (info.item_type_is_equivalent_to<std::uint16_t>()) {
+        return func.template operator()<std::uint16_t>();
+    } else if (info.item_type_is_equivalent_to<std::uint32_t>()) {
+        return func.template operator()<std::uint32_t>();
+    } else if (info.item_type_is_equivalent_to<std::uint64_t>()) {
+        return func.template operator()<std::uint64_t>();
+    }
+    throw std::invalid_argument("dtype must be an 8, 16, 32 or 64 bit unsigned integer.");
+}
+
+// Get the range of bytes spanned by a buffer.
+static std::pair<const std::byte*, const std::byte*> get_byte_range(const py::buffer_info& info)
+{
+    const auto* start = static_cast<const std::byte*>(info.ptr);
+    const auto* stop = start + info.itemsize;
+    for (size_t dim = 0; dim < info.shape.size(); dim++) {
+        if (info.shape[dim] == 0) {
+            return std::make_pair(start, start);
+        }
+        const auto offset = (info.shape[dim] - 1) * info.strides[dim];
+        if (offset < 0) {
+            start += offset;
+        } else {
+            stop += offset;
+        }
+    }
+    return std::make_pair(start, stop);
+}
+
+template <typename indexT, typename valueT>
+static py::array remap_typed(
+    const py::buffer_info& index_info,
+    py::buffer lut_buffer,
+    const std::optional<py::array>& out,
+    size_t thread_count)
+{
+    const auto index = get_strided_span<indexT>(index_info);
+    // The lookup table is usually small so copy it if it is not contiguous.
+    pyext::numpy::array_t<valueT, py::array::c_style | py::array::forcecast> lut_arr(lut_buffer);
+    if (lut_arr.ndim() != 1) {
+        throw std::invalid_argument("lut must be one dimensional.");
+    }
+    const std::span<const valueT> lut(lut_arr.data(), lut_arr.size());
+    py::array out_arr;
+    std::span<valueT> out_span;
+    if (out) {
+        out_arr = *out;
+        out_span = get_out_span<valueT>(out_arr, index_info.shape, "out");
+        // Elements can only be written in place if each output element is exactly over the input element.
+        const auto [index_start, index_stop] = get_byte_range(index_info);
+        const auto* out_start = reinterpret_cast<const std::byte*>(out_span.data());
+        const auto* out_stop = reinterpret_cast<const std::byte*>(out_span.data() + out_span.size());
+        if (index_start < out_stop && out_start < index_stop && !(sizeof(indexT) == sizeof(valueT) && index.is_contiguous() && out_start == index_start)) {
+            throw std::invalid_argument("out must be the same array as index or not overlap it.");
+        }
+    } else {
+        pyext::numpy::array_t<valueT> new_arr(index_info.shape);
+        out_span = get_span(new_arr);
+        out_arr = new_arr;
+    }
+    {
+        py::gil_scoped_release nogil;
+        Amulet::remap<indexT, valueT>(index, lut, out_span, thread_count);
+    }
+    return out_arr;
+}
+
+// A thread safe wrapper for the typed palettes.
+class PyUniquePalette {
+private:
+    template <typename dtypeT>
+    using PaletteT = Amulet::UniquePalette<dtypeT, std::uint32_t>;
+
+    std::variant<
+        PaletteT<std::uint8_t>,
+        PaletteT<std::uint16_t>,
+        PaletteT<std::uint32_t>,
+        PaletteT<std::uint64_t>,
+        PaletteT<std::int8_t>,
+        PaletteT<std::int16_t>,
+        PaletteT<std::int32_t>,
+        PaletteT<std::int64_t>>
+        _palette;
+    std::mutex _mutex;
+
+    // Lock the mutex with the GIL released to avoid deadlocks.
+    std::unique_lock<std::mutex> lock()
+    {
+        py::gil_scoped_release nogil;
+        return std::unique_lock<std::mutex>(_mutex);
+    }
+
+public:
+    PyUniquePalette(py::buffer values_buffer)
+        : _palette(visit_int_dtype(values_buffer.request(), [&]<typename dtypeT>() {
+            pyext::numpy::array_t<dtypeT, py::array::c_style> values_arr(values_buffer);
+            return decltype(_palette)(PaletteT<dtypeT>(std::span<const dtypeT>(values_arr.data(), values_arr.size())));
+        }))
+    {
+    }
+
+    py::array unique_inverse(py::buffer arr_buffer, size_t thread_count, const std::optional<py::array>& inverse_out)
+    {
+        py::buffer_info arr_info = arr_buffer.request();
+        return std::visit(
+            [&]<typename dtypeT>(PaletteT<dtypeT>& palette) -> py::array {
+                if (!arr_info.item_type_is_equivalent_to<dtypeT>()) {
+                    throw std::invalid_argument("array must have the same dtype as the palette.");
+                }
+                const auto arr = get_strided_span<dtypeT>(arr_info);
+                auto [inverse_arr, inverse] = get_inverse(inverse_out, arr_info.shape);
+                {
+                    auto lock = this->lock();
+                    py::gil_scoped_release nogil;
+                    palette.unique_inverse(arr, inverse, thread_count);
+                }
+                return inverse_arr;
+            },
+            _palette);
+    }
+
+    py::array values()
+    {
+        return std::visit(
+            [&]<typename dtypeT>(PaletteT<dtypeT>& palette) -> py::array {
+                auto lock = this->lock();
+                const auto& values = palette.values();
+                return pyext::numpy::array_t<dtypeT>(values.size(), values.data());
+            },
+            _palette);
+    }
+
+    size_t size()
+    {
+        auto lock = this->lock();
+        return std::visit([](const auto& palette) { return palette.size(); }, _palette);
+    }
+};
+
 void init_numpy(py::module m_parent)
 {
     try {
@@ -22,39 +369,165 @@ void init_numpy(py::module m_parent)
     }
 
     auto m = m_parent.def_submodule("numpy");
+
+    py::enum_<Amulet::UniqueInverseMethod>(m, "UniqueInverseMethod",
+        "The algorithm used to look up values in :func:`unique_inverse`.\n"
+        "The result is the same for all methods.")
+        .value(
+            "Auto",
+            Amulet::UniqueInverseMethod::Auto,
+            "Use a lookup table if the value range is small enough otherwise choose a hash map from an estimate of the number of unique values.")
+        .value(
+            "Hash",
+            Amulet::UniqueInverseMethod::Hash,
+            "Use std::unordered_map. This is fast for a small number of unique values.")
+        .value(
+            "FlatHash",
+            Amulet::UniqueInverseMethod::FlatHash,
+            "Use an open addressing hash map. This uses less memory and rehashes less when there are many unique values.");
+
     m.def(
         "unique_inverse",
-        [](py::buffer arr_buffer) {
+        [](
+            py::buffer arr_buffer,
+            std::optional<py::int_> max_value,
+            size_t thread_count,
+            std::optional<py::array> inverse_out,
+            std::optional<py::array> unique_out,
+            Amulet::UniqueInverseMethod method) {
             py::buffer_info arr_info = arr_buffer.request();
-            // validate the input
-            if (!arr_info.item_type_is_equivalent_to<std::uint32_t>()) {
-                throw std::invalid_argument("dtype must be uint32.");
-            }
-            if (arr_info.ndim != 1) {
-                throw std::invalid_argument("Only 1D arrays are supported.");
+            return visit_int_dtype(arr_info, [&]<typename dtypeT>() {
+                return unique_inverse_typed<dtypeT>(arr_info, thread_count, max_value, inverse_out, unique_out, method);
+            });
+        },
+        py::arg("array"),
+        py::kw_only(),
+        py::arg("max_value") = py::none(),
+        py::arg("thread_count") = 0,
+        py::arg("inverse_out") = py::none(),
+        py::arg("unique_out") = py::none(),
+        py::arg("method") = Amulet::UniqueInverseMethod::Auto,
+        py::doc(
+            "Find the unique values in an array and the index of each element in the unique values.\n"
+            "The unique values are in the order they are first found.\n"
+            "Large arrays are processed in parallel with the GIL released.\n"
+            "Arrays with a small range of values use a direct lookup table rather than a hash map.\n"
+            "Arrays with many unique values use an open addressing hash map.\n"
+            "Arrays of any shape and strides are supported without copying.\n"
+            "\n"
+            ":param array: An array of 8, 16, 32 or 64 bit signed or unsigned integers.\n"
+            ":param max_value: An optional hint that all values are in the range 0 to max_value inclusive.\n"
+            "    This skips finding the range of the values.\n"
+            "    ValueError may be raised if a value is outside of this range.\n"
+            "    Hints larger than the maximum value of the dtype are clamped to it.\n"
+            ":param thread_count: The maximum number of threads to use. If 0 (default), the hardware concurrency is used.\n"
+            ":param inverse_out: An optional C contiguous uint32 array with the same shape as array to write the inverse into.\n"
+            "    If not defined a new array is created.\n"
+            ":param unique_out: An optional one dimensional C contiguous array with the same dtype as array to write the unique values into.\n"
+            "    A view of the populated start of this array is returned. ValueError is raised if it is too small.\n"
+            "    If not defined the unique values are returned without copying.\n"
+            ":param method: The algorithm used to look up values. The result is the same for all methods.\n"
+            ":return: The unique values with the same dtype as array and the uint32 inverse array with the same shape as array."));
+    m.def(
+        "unique_inverse_many",
+        [](const std::vector<py::buffer>& arr_buffers, std::optional<py::int_> max_value, size_t thread_count) {
+            std::vector<py::buffer_info> arr_infos;
+            arr_infos.reserve(arr_buffers.size());
+            for (const auto& arr_buffer : arr_buffers) {
+                arr_infos.push_back(arr_buffer.request());
             }
-            if (arr_info.strides[0] != arr_info.itemsize) {
-                throw std::invalid_argument("Slices are not supported.");
+            if (arr_infos.empty()) {
+                return std::vector<std::pair<py::array, py::array>>();
             }
-            // Get the array as a span
-            const std::span<std::uint32_t> arr(
-                static_cast<std::uint32_t*>(arr_info.ptr),
-                arr_info.size);
-            // create the unique container
-            std::vector<std::uint32_t> unique;
-            // create the inverse array
-            pyext::numpy::array_t<std::uint32_t> inverse_arr(arr_info.shape);
-            py::buffer_info inverse_info = inverse_arr.request();
-            // Get the inverse array as a span
-            std::span<std::uint32_t> inverse(
-                static_cast<std::uint32_t*>(inverse_info.ptr),
-                inverse_info.size);
-            // Call unique
-            Amulet::unique_inverse(arr, unique, inverse);
-            // create the unique array
-            pyext::numpy::array_t<std::uint32_t> unique_arr(unique.size(), unique.data());
-            // Return the new values
-            return std::pair(unique_arr, inverse_arr);
+            return visit_int_dtype(arr_infos[0], [&]<typename dtypeT>() {
+                return unique_inverse_many_typed<dtypeT>(arr_infos, thread_count, max_value);
+            });
         },
-        py::arg("array"));
+        py::arg("arrays"),
+        py::kw_only(),
+        py::arg("max_value") = py::none(),
+        py::arg("thread_count") = 0,
+        py::doc(
+            "Find the unique values and inverse of many arrays in one call.\n"
+            "This is equivalent to calling :func:`unique_inverse` on each array but with less overhead.\n"
+            "The arrays are processed in parallel with the GIL released.\n"
+            "Each array is processed by one thread which reuses its lookup storage between arrays.\n"
+            "\n"
+            ":param arrays: A sequence of arrays with the same integer dtype. They may have different shapes.\n"
+            "    To process a stacked array, pass a sequence of its sub-arrays.\n"
+            ":param max_value: An optional hint that all values in all arrays are in the range 0 to max_value inclusive.\n"
+            ":param thread_count: The maximum number of threads to use. If 0 (default), the hardware concurrency is used.\n"
+            ":return: A list containing the unique values and inverse array for each input array."));
+
+    m.def(
+        "remap",
+        [](py::buffer index_buffer, py::buffer lut_buffer, std::optional<py::array> out, size_t thread_count) {
+            py::buffer_info index_info = index_buffer.request();
+            py::buffer_info lut_info = lut_buffer.request();
+            return visit_uint_dtype(index_info, [&]<typename indexT>() {
+                return visit_uint_dtype(lut_info, [&]<typename valueT>() {
+                    return remap_typed<indexT, valueT>(index_info, lut_buffer, out, thread_count);
+                });
+            });
+        },
+        py::arg("index"),
+        py::arg("lut"),
+        py::kw_only(),
+        py::arg("out") = py::none(),
+        py::arg("thread_count") = 0,
+        py::doc(
+            "Look up each element of an index array in a lookup table.\n"
+            "This is equivalent to :code:`lut[index]` but is faster and does not create temporary arrays.\n"
+            "Large arrays are processed in parallel with the GIL released.\n"
+            "\n"
+            ">>> unique, inverse = unique_inverse(arr)\n"
+            ">>> lut = numpy.array([convert(value) for value in unique], dtype=numpy.uint32)\n"
+            ">>> remap(inverse, lut, out=inverse)\n"
+            "\n"
+            ":param index: An array of 8, 16, 32 or 64 bit unsigned integers. It may have any shape and strides.\n"
+            ":param lut: A one dimensional array of 8, 16, 32 or 64 bit unsigned integers.\n"
+            ":param out: An optional C contiguous array with the same dtype as lut and the same shape as index to write the values into.\n"
+            "    This may be index to remap in place if they have the same dtype.\n"
+            "    If not defined a new array is created.\n"
+            ":param thread_count: The maximum number of threads to use. If 0 (default), the hardware concurrency is used.\n"
+            ":return: The values with the same dtype as lut and the same shape as index.\n"
+            ":raises ValueError: If an index is outside of lut. Some of out may have been written."));
+
+    py::class_<PyUniquePalette> UniquePalette(m, "UniquePalette",
+        "A palette of unique values that grows as arrays are mapped onto it.\n"
+        "This allows many arrays to share one set of unique values.\n"
+        "The lookup from value to index is kept between calls so existing values are not processed again.\n"
+        "Thread safe.");
+    UniquePalette.def(
+        py::init<py::buffer>(),
+        py::arg("values"),
+        py::doc(
+            "Construct a palette from existing values.\n"
+            "\n"
+            ":param values: The unique values to start with. The dtype of this array is the dtype of the palette.\n"
+            "    It must be an 8, 16, 32 or 64 bit signed or unsigned integer.\n"
+            "    Pass an empty array to start with no values.\n"
+            ":raises ValueError: If the values are not unique."));
+    UniquePalette.def(
+        "unique_inverse",
+        &PyUniquePalette::unique_inverse,
+        py::arg("array"),
+        py::kw_only(),
+        py::arg("thread_count") = 0,
+        py::arg("inverse_out") = py::none(),
+        py::doc(
+            "Find the index of each element of an array in the palette.\n"
+            "Values that are not in the palette are appended in the order they are first found.\n"
+            "Large arrays are processed in parallel with the GIL released.\n"
+            "\n"
+            ":param array: An array with the same dtype as the palette. It may have any shape and strides.\n"
+            ":param thread_count: The maximum number of threads to use. If 0 (default), the hardware concurrency is used.\n"
+            ":param inverse_out: An optional C contiguous uint32 array with the same shape as array to write the inverse into.\n"
+            "    If not defined a new array is created.\n"
+            ":return: The uint32 inverse array with the same shape as array."));
+    UniquePalette.def_property_readonly(
+        "values",
+        &PyUniquePalette::values,
+        py::doc("A copy of the values in the palette in the order they were added."));
+    UniquePalette.def("__len__", &PyUniquePalette::size);
 }
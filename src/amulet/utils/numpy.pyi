@@ -1,11 +1,176 @@
 from __future__ import annotations
 
+import collections.abc
+
 import numpy
 import numpy.typing
+import typing
 import typing_extensions
 
-__all__ = ["unique_inverse"]
+__all__ = [
+    "UniqueInverseMethod",
+    "UniquePalette",
+    "remap",
+    "unique_inverse",
+    "unique_inverse_many",
+]
+
+class UniqueInverseMethod:
+    """
+    The algorithm used to look up values in :func:`unique_inverse`.
+    The result is the same for all methods.
+
+    Members:
+
+      Auto : Use a lookup table if the value range is small enough otherwise choose a hash map from an estimate of the number of unique values.
+
+      Hash : Use std::unordered_map. This is fast for a small number of unique values.
+
+      FlatHash : Use an open addressing hash map. This uses less memory and rehashes less when there are many unique values.
+    """
+
+    Auto: typing.ClassVar[UniqueInverseMethod]  # value = <UniqueInverseMethod.Auto: 0>
+    FlatHash: typing.ClassVar[
+        UniqueInverseMethod
+    ]  # value = <UniqueInverseMethod.FlatHash: 2>
+    Hash: typing.ClassVar[UniqueInverseMethod]  # value = <UniqueInverseMethod.Hash: 1>
+    __members__: typing.ClassVar[
+        dict[str, UniqueInverseMethod]
+    ]  # value = {'Auto': <UniqueInverseMethod.Auto: 0>, 'Hash': <UniqueInverseMethod.Hash: 1>, 'FlatHash': <UniqueInverseMethod.FlatHash: 2>}
+    def __eq__(self, other: typing.Any) -> bool: ...
+    def __getstate__(self) -> int: ...
+    def __hash__(self) -> int: ...
+    def __index__(self) -> int: ...
+    def __init__(self, value: int) -> None: ...
+    def __int__(self) -> int: ...
+    def __ne__(self, other: typing.Any) -> bool: ...
+    def __repr__(self) -> str: ...
+    def __setstate__(self, state: int) -> None: ...
+    def __str__(self) -> str: ...
+    @property
+    def name(self) -> str: ...
+    @property
+    def value(self) -> int: ...
+
+class UniquePalette:
+    """
+    A palette of unique values that grows as arrays are mapped onto it.
+    This allows many arrays to share one set of unique values.
+    The lookup from value to index is kept between calls so existing values are not processed again.
+    Thread safe.
+    """
+
+    def __init__(self, values: typing_extensions.Buffer) -> None:
+        """
+        Construct a palette from existing values.
+
+        :param values: The unique values to start with. The dtype of this array is the dtype of the palette.
+            It must be an 8, 16, 32 or 64 bit signed or unsigned integer.
+            Pass an empty array to start with no values.
+        :raises ValueError: If the values are not unique.
+        """
+
+    def __len__(self) -> int: ...
+    def unique_inverse(
+        self,
+        array: typing_extensions.Buffer,
+        *,
+        thread_count: int = 0,
+        inverse_out: numpy.typing.NDArray[numpy.uint32] | None = None,
+    ) -> numpy.typing.NDArray[numpy.uint32]:
+        """
+        Find the index of each element of an array in the palette.
+        Values that are not in the palette are appended in the order they are first found.
+        Large arrays are processed in parallel with the GIL released.
+
+        :param array: An array with the same dtype as the palette. It may have any shape and strides.
+        :param thread_count: The maximum number of threads to use. If 0 (default), the hardware concurrency is used.
+        :param inverse_out: An optional C contiguous uint32 array with the same shape as array to write the inverse into.
+            If not defined a new array is created.
+        :return: The uint32 inverse array with the same shape as array.
+        """
+
+    @property
+    def values(self) -> numpy.typing.NDArray[numpy.integer]:
+        """
+        A copy of the values in the palette in the order they were added.
+        """
+
+def remap(
+    index: typing_extensions.Buffer,
+    lut: typing_extensions.Buffer,
+    *,
+    out: numpy.typing.NDArray[numpy.unsignedinteger] | None = None,
+    thread_count: int = 0,
+) -> numpy.typing.NDArray[numpy.unsignedinteger]:
+    """
+    Look up each element of an index array in a lookup table.
+    This is equivalent to :code:`lut[index]` but is faster and does not create temporary arrays.
+    Large arrays are processed in parallel with the GIL released.
+
+    >>> unique, inverse = unique_inverse(arr)
+    >>> lut = numpy.array([convert(value) for value in unique], dtype=numpy.uint32)
+    >>> remap(inverse, lut, out=inverse)
+
+    :param index: An array of 8, 16, 32 or 64 bit unsigned integers. It may have any shape and strides.
+    :param lut: A one dimensional array of 8, 16, 32 or 64 bit unsigned integers.
+    :param out: An optional C contiguous array with the same dtype as lut and the same shape as index to write the values into.
+        This may be index to remap in place if they have the same dtype.
+        If not defined a new array is created.
+    :param thread_count: The maximum number of threads to use. If 0 (default), the hardware concurrency is used.
+    :return: The values with the same dtype as lut and the same shape as index.
+    :raises ValueError: If an index is outside of lut. Some of out may have been written.
+    """
 
 def unique_inverse(
     array: typing_extensions.Buffer,
-) -> tuple[numpy.typing.NDArray[numpy.uint32], numpy.typing.NDArray[numpy.uint32]]: ...
+    *,
+    max_value: int | None = None,
+    thread_count: int = 0,
+    inverse_out: numpy.typing.NDArray[numpy.uint32] | None = None,
+    unique_out: numpy.typing.NDArray[numpy.integer] | None = None,
+    method: UniqueInverseMethod = UniqueInverseMethod.Auto,
+) -> tuple[numpy.typing.NDArray[numpy.integer], numpy.typing.NDArray[numpy.uint32]]:
+    """
+    Find the unique values in an array and the index of each element in the unique values.
+    The unique values are in the order they are first found.
+    Large arrays are processed in parallel with the GIL released.
+    Arrays with a small range of values use a direct lookup table rather than a hash map.
+    Arrays with many unique values use an open addressing hash map.
+    Arrays of any shape and strides are supported without copying.
+
+    :param array: An array of 8, 16, 32 or 64 bit signed or unsigned integers.
+    :param max_value: An optional hint that all values are in the range 0 to max_value inclusive.
+        This skips finding the range of the values.
+        ValueError may be raised if a value is outside of this range.
+        Hints larger than the maximum value of the dtype are clamped to it.
+    :param thread_count: The maximum number of threads to use. If 0 (default), the hardware concurrency is used.
+    :param inverse_out: An optional C contiguous uint32 array with the same shape as array to write the inverse into.
+        If not defined a new array is created.
+    :param unique_out: An optional one dimensional C contiguous array with the same dtype as array to write the unique values into.
+        A view of the populated start of this array is returned. ValueError is raised if it is too small.
+        If not defined the unique values are returned without copying.
+    :param method: The algorithm used to look up values. The result is the same for all methods.
+    :return: The unique values with the same dtype as array and the uint32 inverse array with the same shape as array.
+    """
+
+def unique_inverse_many(
+    arrays: collections.abc.Sequence[typing_extensions.Buffer],
+    *,
+    max_value: int | None = None,
+    thread_count: int = 0,
+) -> list[
+    tuple[numpy.typing.NDArray[numpy.integer], numpy.typing.NDArray[numpy.uint32]]
+]:
+    """
+    Find the unique values and inverse of many arrays in one call.
+    This is equivalent to calling :func:`unique_inverse` on each array but with less overhead.
+    The arrays are processed in parallel with the GIL released.
+    Each array is processed by one thread which reuses its lookup storage between arrays.
+
+    :param arrays: A sequence of arrays with the same integer dtype. They may have different shapes.
+        To process a stacked array, pass a sequence of its sub-arrays.
+    :param max_value: An optional hint that all values in all arrays are in the range 0 to max_value inclusive.
+    :param thread_count: The maximum number of threads to use. If 0 (default), the hardware concurrency is used.
+    :return: A list containing the unique values and inverse array for each input array.
+    """
@@ -4,7 +4,12 @@ from typing import Protocol, TypeVarTuple, runtime_checkable
 from collections.abc import Callable
 from . import _connection_mode
 from ._connection_mode import ConnectionMode
-
+from . import _event_loop
+from ._event_loop import (
+    get_async_worker_count,
+    set_async_worker_count,
+    get_async_queue_depth,
+)
 
 Args = TypeVarTuple("Args")
 
@@ -13,18 +18,44 @@ class SignalToken(Protocol[*Args]):
     pass
 
 
+class SignalEmission(Protocol):
+    def is_done(self) -> bool:
+        """
+        Have all the parallel callbacks finished.
+        Thread safe.
+        """
+
+    def wait(self) -> None:
+        """
+        Block until all the parallel callbacks have finished.
+        The calling thread runs callbacks that have not been started by a worker thread.
+        Thread safe.
+        """
+
+
 @runtime_checkable
 class Signal(Protocol[*Args]):
     def connect(
         self,
         callback: Callable[[*Args], None],
         mode: ConnectionMode = ConnectionMode.Direct,
+        interval: float = 0.0,
+        debounce: bool = False,
     ) -> SignalToken[*Args]:
         """
         Connect a callback to this signal and return a token.
         The token must be kept alive for the callback to work.
         The token is used to disconnect the callback when it is not needed.
         Thread safe.
+
+        :param callback: The function to call when the signal is emitted.
+        :param mode: How the callback is called.
+        :param interval: If greater than zero, emissions are coalesced and the callback is
+            called with the latest arguments at most once every interval seconds.
+            The delayed calls are made from the async event loop whatever the mode is.
+            Must be finite. Values larger than a day are treated as a day.
+        :param debounce: If True, the callback is only called once no emissions have
+            arrived for interval seconds.
         """
 
     def disconnect(self, token: SignalToken[*Args]) -> None:
@@ -36,7 +67,16 @@ class Signal(Protocol[*Args]):
 
     def emit(self, *args: *Args) -> None:
         """
-        Call all callbacks with the given arguments from this thread.
-        Blocks until all callbacks are processed.
+        Call all callbacks with the given arguments.
+        Direct callbacks are called from this thread and parallel callbacks are called by worker threads.
+        Blocks until all direct and parallel callbacks are processed.
+        Thread safe.
+        """
+
+    def emit_nowait(self, *args: *Args) -> SignalEmission:
+        """
+        Call all callbacks with the given arguments.
+        Direct callbacks are called from this thread before this returns.
+        Parallel callbacks are started on worker threads and the returned handle can be used to wait for them to finish.
         Thread safe.
         """
@@ -11,6 +11,8 @@ class ConnectionMode:
       Direct : Directly called by the emitter.
 
       Async : Called asynchronously.
+
+      Parallel : Called by a worker thread in parallel with the other parallel callbacks. The emitter waits for it to finish.
     """
 
     Async: typing.ClassVar[
@@ -19,9 +21,12 @@ class ConnectionMode:
     Direct: typing.ClassVar[
         ConnectionMode
     ]  # value = amulet.utils.signal._connection_mode.ConnectionMode.Direct
+    Parallel: typing.ClassVar[
+        ConnectionMode
+    ]  # value = amulet.utils.signal._connection_mode.ConnectionMode.Parallel
     __members__: typing.ClassVar[
         dict[str, ConnectionMode]
-    ]  # value = {'Direct': amulet.utils.signal._connection_mode.ConnectionMode.Direct, 'Async': amulet.utils.signal._connection_mode.ConnectionMode.Async}
+    ]  # value = {'Direct': amulet.utils.signal._connection_mode.ConnectionMode.Direct, 'Async': amulet.utils.signal._connection_mode.ConnectionMode.Async, 'Parallel': amulet.utils.signal._connection_mode.ConnectionMode.Parallel}
     def __eq__(self, other: typing.Any) -> bool: ...
     def __hash__(self) -> int: ...
     def __index__(self) -> int: ...
@@ -0,0 +1,28 @@
+from __future__ import annotations
+
+__all__ = [
+    "get_async_queue_depth",
+    "get_async_worker_count",
+    "set_async_worker_count",
+]
+
+def get_async_queue_depth() -> int:
+    """
+    Get the number of async callbacks that have been queued and not started.
+    Thread safe.
+    """
+
+def get_async_worker_count() -> int:
+    """
+    Get the number of threads that call async callbacks.
+    Thread safe.
+    """
+
+def set_async_worker_count(worker_count: int) -> None:
+    """
+    Set the number of threads that call async callbacks.
+    Callbacks connected to a signal are called in the order the signal was emitted and never at the same time.
+    Different callbacks may be called at the same time.
+    Must be at least 1. Cannot be called from an async callback.
+    Thread safe.
+    """
@@ -1,9 +1,19 @@
+#include <algorithm>
+#include <chrono>
 #include <condition_variable>
 #include <cstdlib>
+#include <deque>
 #include <functional>
 #include <list>
+#include <map>
+#include <memory>
 #include <mutex>
+#include <stdexcept>
+#include <string>
 #include <thread>
+#include <unordered_map>
+#include <utility>
+#include <vector>
 
 #include <amulet/utils/logging/logging.hpp>
 
@@ -13,19 +23,40 @@ namespace Amulet {
 
 namespace {
 
+    // Set on the threads owned by the event loop.
+    thread_local bool is_event_loop_thread = false;
+
     class EventLoop {
     private:
+        // Held while the number of worker threads is being changed.
+        std::mutex _resize_mutex;
         std::mutex _mutex;
         std::condition_variable _condition;
-        std::thread _thread;
-        std::list<std::function<void()>> _events;
+        std::vector<std::thread> _threads;
+        // The number of worker threads that should be running.
+        size_t _worker_count;
+        // Events that can be run now and the key they were submitted with.
+        std::deque<std::pair<const void*, std::function<void()>>> _events;
+        // Events waiting for an earlier event with the same key to finish.
+        // A key is in this map while an event with that key is queued or running.
+        std::unordered_map<const void*, std::deque<std::function<void()>>> _ordered_events;
+        // Events that will be submitted when their time is reached.
+        std::multimap<std::chrono::steady_clock::time_point, std::pair<const void*, std::function<void()>>> _delayed_events;
+        // The number of events that have been submitted and not started.
+        size_t _queue_depth = 0;
         bool _exit = false;
 
-        void _event_loop();
+        void _event_loop(size_t index);
+
+        // Queue an event to be run. The caller must hold _mutex.
+        void _push(const void* key, std::function<void()> event);
+
+        // Queue the delayed events that are due. The caller must hold _mutex.
+        void _push_due();
 
     public:
-        // Construct a new event loop.
-        EventLoop();
+        // Construct a new event loop with the given number of worker threads.
+        EventLoop(size_t worker_count);
 
         // Destroy the event loop.
         ~EventLoop();
@@ -34,15 +65,31 @@ namespace {
         void exit();
 
         // Submit a new job to the event loop.
-        void submit(std::function<void()> event);
+        // Jobs with the same non-null key are run in the order they were submitted and never at the same time.
+        void submit(const void* key, std::function<void()> event);
+
+        // Submit a new job to the event loop that is run once time is reached.
+        void submit_at(const void* key, std::chrono::steady_clock::time_point time, std::function<void()> event);
+
+        // Get the number of worker threads.
+        size_t get_worker_count();
+
+        // Set the number of worker threads.
+        void set_worker_count(size_t worker_count);
+
+        // Get the number of jobs that have been submitted and not started.
+        size_t get_queue_depth();
     };
 
-    EventLoop::EventLoop()
-        : _thread(&EventLoop::_event_loop, this)
+    EventLoop::EventLoop(size_t worker_count)
+        : _worker_count(worker_count)
     {
         // This class may call debug during shutdown.
         // Ensure the logger outlives the EventLoop.
         Amulet::get_logger();
+        for (size_t i = 0; i < worker_count; i++) {
+            _threads.emplace_back(&EventLoop::_event_loop, this, i);
+        }
     }
 
     EventLoop::~EventLoop()
@@ -54,31 +101,41 @@ namespace {
     void EventLoop::exit()
     {
         debug("EventLoop::exit()");
+        std::lock_guard resize_lock(_resize_mutex);
         {
             std::unique_lock lock(_mutex);
             if (_exit) {
                 return;
             }
             _exit = true;
-            _condition.notify_one();
+            _condition.notify_all();
         }
         debug("EventLoop::exit() join");
-        _thread.join();
+        for (auto& thread : _threads) {
+            thread.join();
+        }
         debug("EventLoop::exit() exit");
     }
 
-    void EventLoop::_event_loop()
+    void EventLoop::_event_loop(size_t index)
     {
+        is_event_loop_thread = true;
         std::unique_lock lock(_mutex);
-        while (!_exit) {
+        while (!_exit && index < _worker_count) {
+            _push_due();
             if (_events.empty()) {
-                // If there are no events to process, wait until more are added.
-                _condition.wait(lock);
+                // If there are no events to process, wait until more are added or a delayed event is due.
+                if (_delayed_events.empty()) {
+                    _condition.wait(lock);
+                } else {
+                    _condition.wait_until(lock, _delayed_events.begin()->first);
+                }
                 // Re-check the exit condition.
                 continue;
             }
-            auto event = std::move(_events.front());
+            auto [key, event] = std::move(_events.front());
             _events.pop_front();
+            _queue_depth--;
             lock.unlock();
             try {
                 event();
@@ -87,33 +144,296 @@ namespace {
             } catch (...) {
                 Amulet::error("Unhandled exception in event loop.");
             }
+            event = nullptr;
             lock.lock();
+            if (key) {
+                // Release the next event with the same key.
+                auto it = _ordered_events.find(key);
+                if (it->second.empty()) {
+                    _ordered_events.erase(it);
+                } else {
+                    _events.emplace_back(key, std::move(it->second.front()));
+                    it->second.pop_front();
+                    _condition.notify_one();
+                }
+            }
+        }
+        if (!_events.empty() || !_delayed_events.empty()) {
+            // This thread may have been woken to process an event. Pass it on.
+            _condition.notify_one();
         }
         debug("EventLoop::_event_loop() exit");
     }
 
-    void EventLoop::submit(std::function<void()> event)
+    void EventLoop::_push(const void* key, std::function<void()> event)
+    {
+        if (key) {
+            auto [it, inserted] = _ordered_events.try_emplace(key);
+            if (!inserted) {
+                // An event with this key is queued or running.
+                it->second.push_back(std::move(event));
+                return;
+            }
+        }
+        _events.emplace_back(key, std::move(event));
+        _condition.notify_one();
+    }
+
+    void EventLoop::_push_due()
+    {
+        if (_delayed_events.empty()) {
+            return;
+        }
+        const auto now = std::chrono::steady_clock::now();
+        while (!_delayed_events.empty() && _delayed_events.begin()->first <= now) {
+            auto node = _delayed_events.extract(_delayed_events.begin());
+            _push(node.mapped().first, std::move(node.mapped().second));
+        }
+    }
+
+    void EventLoop::submit(const void* key, std::function<void()> event)
     {
         std::unique_lock lock(_mutex);
-        _events.push_back(std::move(event));
+        _queue_depth++;
+        _push(key, std::move(event));
+    }
+
+    void EventLoop::submit_at(const void* key, std::chrono::steady_clock::time_point time, std::function<void()> event)
+    {
+        std::unique_lock lock(_mutex);
+        _queue_depth++;
+        _delayed_events.emplace(time, std::make_pair(key, std::move(event)));
+        // Wake a thread so that it waits until the new event is due.
         _condition.notify_one();
     }
 
+    size_t EventLoop::get_worker_count()
+    {
+        std::unique_lock lock(_mutex);
+        return _worker_count;
+    }
+
+    void EventLoop::set_worker_count(size_t worker_count)
+    {
+        if (worker_count == 0) {
+            throw std::invalid_argument("The async worker count must be at least 1.");
+        }
+        if (is_event_loop_thread) {
+            throw std::runtime_error("The async worker count cannot be changed from an async callback.");
+        }
+        std::lock_guard resize_lock(_resize_mutex);
+        std::vector<std::thread> stopped_threads;
+        {
+            std::unique_lock lock(_mutex);
+            if (_exit) {
+                return;
+            }
+            _worker_count = worker_count;
+            while (_threads.size() < worker_count) {
+                _threads.emplace_back(&EventLoop::_event_loop, this, _threads.size());
+            }
+            while (worker_count < _threads.size()) {
+                stopped_threads.push_back(std::move(_threads.back()));
+                _threads.pop_back();
+            }
+            // Wake the threads that need to exit.
+            _condition.notify_all();
+        }
+        // The stopped threads finish their current event before exiting.
+        for (auto& thread : stopped_threads) {
+            thread.join();
+        }
+    }
+
+    size_t EventLoop::get_queue_depth()
+    {
+        std::unique_lock lock(_mutex);
+        return _queue_depth;
+    }
+
     EventLoop& get_global_event_loop()
     {
-        static EventLoop global_event_loop;
+        static EventLoop global_event_loop(std::clamp(std::thread::hardware_concurrency(), 1u, 4u));
         static int global_event_loop_atexit_registered = std::atexit([] { global_event_loop.exit(); });
         return global_event_loop;
     }
 
+    // A fixed number of threads that run the callbacks of parallel emissions.
+    class ThreadPool {
+    private:
+        std::mutex _mutex;
+        std::condition_variable _condition;
+        std::vector<std::thread> _threads;
+        std::deque<std::shared_ptr<detail::ParallelEmission>> _emissions;
+        bool _exit = false;
+
+        void _worker();
+
+    public:
+        // Construct a thread pool with the given number of threads.
+        ThreadPool(size_t thread_count);
+
+        // Destroy the thread pool.
+        ~ThreadPool();
+
+        // Exit the worker threads.
+        void exit();
+
+        // Submit an emission to be run by the worker threads.
+        void submit(std::shared_ptr<detail::ParallelEmission> emission);
+    };
+
+    ThreadPool::ThreadPool(size_t thread_count)
+    {
+        // This class may call debug during shutdown.
+        // Ensure the logger outlives the ThreadPool.
+        Amulet::get_logger();
+        for (size_t i = 0; i < thread_count; i++) {
+            _threads.emplace_back(&ThreadPool::_worker, this);
+        }
+    }
+
+    ThreadPool::~ThreadPool()
+    {
+        debug("ThreadPool::~ThreadPool() enter");
+        exit();
+    }
+
+    void ThreadPool::exit()
+    {
+        debug("ThreadPool::exit()");
+        {
+            std::unique_lock lock(_mutex);
+            if (_exit) {
+                return;
+            }
+            _exit = true;
+            _condition.notify_all();
+        }
+        debug("ThreadPool::exit() join");
+        for (auto& thread : _threads) {
+            thread.join();
+        }
+        debug("ThreadPool::exit() exit");
+    }
+
+    void ThreadPool::_worker()
+    {
+        std::unique_lock lock(_mutex);
+        while (!_exit) {
+            if (_emissions.empty()) {
+                // If there are no emissions to process, wait until more are added.
+                _condition.wait(lock);
+                // Re-check the exit condition.
+                continue;
+            }
+            auto emission = std::move(_emissions.front());
+            _emissions.pop_front();
+            lock.unlock();
+            // Callbacks handle their own exceptions.
+            while (emission->run_one()) { }
+            emission.reset();
+            lock.lock();
+        }
+    }
+
+    void ThreadPool::submit(std::shared_ptr<detail::ParallelEmission> emission)
+    {
+        std::unique_lock lock(_mutex);
+        // Each worker that takes the emission runs callbacks until none are left.
+        // The callbacks must run even if the emitter does not wait so a worker is always queued.
+        const size_t worker_count = std::min(emission->size(), _threads.size());
+        for (size_t i = 0; i < worker_count; i++) {
+            _emissions.push_back(emission);
+        }
+        _condition.notify_all();
+    }
+
+    ThreadPool& get_global_thread_pool()
+    {
+        // The emitting thread runs callbacks while it waits so one fewer thread than the core count is used.
+        static ThreadPool global_thread_pool(std::max(2u, std::thread::hardware_concurrency()) - 1);
+        static int global_thread_pool_atexit_registered = std::atexit([] { global_thread_pool.exit(); });
+        return global_thread_pool;
+    }
+
 } // namespace
 
 namespace detail {
 
     void submit_async(std::function<void()> event)
     {
-        get_global_event_loop().submit(std::move(event));
+        get_global_event_loop().submit(nullptr, std::move(event));
+    }
+
+    void submit_async(const void* key, std::function<void()> event)
+    {
+        get_global_event_loop().submit(key, std::move(event));
+    }
+
+    void submit_async_at(const void* key, std::chrono::steady_clock::time_point time, std::function<void()> event)
+    {
+        get_global_event_loop().submit_at(key, time, std::move(event));
+    }
+
+    void ParallelEmission::add(std::function<void()> callback)
+    {
+        _callbacks.push_back(std::move(callback));
+        _remaining++;
+    }
+
+    size_t ParallelEmission::size() const
+    {
+        return _callbacks.size();
+    }
+
+    bool ParallelEmission::run_one()
+    {
+        const size_t index = _next.fetch_add(1, std::memory_order_relaxed);
+        if (_callbacks.size() <= index) {
+            return false;
+        }
+        _callbacks[index]();
+        std::lock_guard lock(_mutex);
+        if (--_remaining == 0) {
+            _condition.notify_all();
+        }
+        return true;
+    }
+
+    bool ParallelEmission::is_done()
+    {
+        std::lock_guard lock(_mutex);
+        return _remaining == 0;
+    }
+
+    void ParallelEmission::wait()
+    {
+        while (run_one()) { }
+        std::unique_lock lock(_mutex);
+        _condition.wait(lock, [this] { return _remaining == 0; });
+    }
+
+    void submit_parallel(std::shared_ptr<ParallelEmission> emission)
+    {
+        get_global_thread_pool().submit(std::move(emission));
     }
 
 } // namespace detail
+
+size_t get_async_worker_count()
+{
+    return get_global_event_loop().get_worker_count();
+}
+
+void set_async_worker_count(size_t worker_count)
+{
+    get_global_event_loop().set_worker_count(worker_count);
+}
+
+size_t get_async_queue_depth()
+{
+    return get_global_event_loop().get_queue_depth();
+}
+
 } // namespace Amulet
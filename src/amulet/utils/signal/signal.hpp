@@ -1,11 +1,18 @@
 #pragma once
 
+#include <atomic>
+#include <chrono>
+#include <condition_variable>
+#include <cstddef>
 #include <functional>
 #include <memory>
 #include <mutex>
+#include <optional>
 #include <stdexcept>
 #include <string>
+#include <tuple>
 #include <utility>
+#include <vector>
 
 #include <amulet/utils/dll.hpp>
 #include <amulet/utils/logging/logging.hpp>
@@ -16,24 +23,105 @@ namespace Amulet {
 enum class ConnectionMode {
     Direct, // Directly called by the emitter.
     Async, // Called asynchronously.
+    Parallel, // Called by a worker thread in parallel with the other parallel callbacks. The emitter waits for it to finish.
 };
 
+// Limits how often a connected callback is called.
+// Emissions that arrive too soon are coalesced and the callback is later called once with the latest arguments.
+// The delayed calls are made from the async event loop whatever the connection mode is.
+struct RateLimit {
+    // The minimum time between calls. Zero disables rate limiting.
+    std::chrono::steady_clock::duration interval = std::chrono::steady_clock::duration::zero();
+    // If false, the callback is called at most once per interval.
+    // If true, the callback is called once no emissions have arrived for interval.
+    bool debounce = false;
+};
+
+// Get the number of threads that call async callbacks.
+// Thread safe.
+AMULET_UTILS_EXPORT std::size_t get_async_worker_count();
+
+// Set the number of threads that call async callbacks.
+// Callbacks connected to a signal are called in the order the signal was emitted and never at the same time.
+// Different callbacks may be called at the same time.
+// Must be at least 1. Cannot be called from an async callback.
+// Thread safe.
+AMULET_UTILS_EXPORT void set_async_worker_count(std::size_t worker_count);
+
+// Get the number of async callbacks that have been queued and not started.
+// Thread safe.
+AMULET_UTILS_EXPORT std::size_t get_async_queue_depth();
+
 namespace detail {
     AMULET_UTILS_EXPORT void submit_async(std::function<void()> event);
 
+    // Submit an event that is run after all earlier events with the same key have finished.
+    AMULET_UTILS_EXPORT void submit_async(const void* key, std::function<void()> event);
+
+    // Submit an event that is run once time is reached and after all earlier events with the same key have finished.
+    AMULET_UTILS_EXPORT void submit_async_at(const void* key, std::chrono::steady_clock::time_point time, std::function<void()> event);
+
+    // The parallel callbacks of one emit call.
+    // The callbacks are run by the signal worker threads and the thread waiting for them.
+    class ParallelEmission {
+    private:
+        std::vector<std::function<void()>> _callbacks;
+        // The index of the next callback to run.
+        std::atomic<std::size_t> _next = 0;
+        std::mutex _mutex;
+        std::condition_variable _condition;
+        // The number of callbacks that have not finished.
+        std::size_t _remaining = 0;
+
+    public:
+        // Add a callback. This must not be called after the emission has been submitted.
+        AMULET_UTILS_EXPORT void add(std::function<void()> callback);
+
+        // The number of callbacks.
+        AMULET_UTILS_EXPORT std::size_t size() const;
+
+        // Run the next callback that has not been started.
+        // Returns false if all callbacks have been started.
+        // Thread safe.
+        AMULET_UTILS_EXPORT bool run_one();
+
+        // Have all callbacks finished.
+        // Thread safe.
+        AMULET_UTILS_EXPORT bool is_done();
+
+        // Run the callbacks that have not been started then wait until all callbacks have finished.
+        // Thread safe.
+        AMULET_UTILS_EXPORT void wait();
+    };
+
+    // Run the callbacks of an emission on the signal worker threads.
+    AMULET_UTILS_EXPORT void submit_parallel(std::shared_ptr<ParallelEmission> emission);
+
     template <typename... Args>
     class SignalCallbackStorage {
     public:
         std::recursive_mutex mutex;
         std::function<void(Args...)> callback;
         ConnectionMode mode;
+        RateLimit rate_limit;
         bool disconnected = false;
 
+        // The state used to coalesce calls if rate_limit is enabled.
+        std::mutex coalesce_mutex;
+        // The arguments of the latest coalesced emission.
+        std::optional<std::tuple<Args...>> coalesced_args;
+        // Is a call to deliver coalesced_args scheduled.
+        bool coalesced_call_scheduled = false;
+        // The time of the last call or, if debouncing, the last emission.
+        std::chrono::steady_clock::time_point last_time = std::chrono::steady_clock::time_point::min();
+
         SignalCallbackStorage(
             std::function<void(Args...)> callback,
-            ConnectionMode mode)
+            ConnectionMode mode,
+            RateLimit rate_limit)
             : callback(std::move(callback))
             , mode(mode)
+            , rate_limit(rate_limit)
         {
         }
     };
@@ -43,6 +131,37 @@ namespace detail {
 template <typename... Args>
 class Signal;
 
+// A handle returned by Signal::emit_nowait to wait for the parallel callbacks to finish.
+class SignalEmission {
+private:
+    std::shared_ptr<detail::ParallelEmission> emission;
+
+public:
+    // Constructors.
+    SignalEmission() = default;
+    SignalEmission(std::shared_ptr<detail::ParallelEmission> emission)
+        : emission(std::move(emission))
+    {
+    }
+
+    // Have all the parallel callbacks finished.
+    // Thread safe.
+    bool is_done()
+    {
+        return !emission || emission->is_done();
+    }
+
+    // Block until all the parallel callbacks have finished.
+    // The calling thread runs callbacks that have not been started by a worker thread.
+    // Thread safe.
+    void wait()
+    {
+        if (emission) {
+            emission->wait();
+        }
+    }
+};
+
 // A token returned when connecting a callback to a signal.
 // The token must be kept alive and used to disconnect the callback when it is no longer needed.
 template <typename... Args>
@@ -70,7 +189,86 @@ private:
     using storageT = detail::SignalCallbackStorage<Args...>;
 
     std::mutex _mutex;
-    WeakSet<storageT> _callbacks;
+    // An immutable snapshot of the connected callbacks.
+    // This is replaced with a modified copy when a callback is connected or disconnected.
+    // Emit holds a reference to the snapshot so it does not need to copy it.
+    std::shared_ptr<const WeakSet<storageT>> _callbacks = std::make_shared<const WeakSet<storageT>>();
+
+    // Call a callback from a thread other than the emitter if it is still connected.
+    // kind is used in the error message.
+    static void call_weak(const std::weak_ptr<storageT>& ptr, const std::tuple<Args...>& args, const char* kind)
+    {
+        auto storage = ptr.lock();
+        if (!storage) {
+            return;
+        }
+        std::lock_guard storage_lock(storage->mutex);
+        if (storage->disconnected) {
+            // The callback was disconnected between getting the callback and processing it.
+            return;
+        }
+        try {
+            std::apply(storage->callback, args);
+        } catch (const std::exception& e) {
+            AmuletLog(40, "Error in " << kind << "callback: " << e.what());
+        } catch (...) {
+            AmuletLog(40, "Error in " << kind << "callback.");
+        }
+    }
+
+    // Deliver the latest coalesced arguments of a rate limited callback.
+    // This is run by the async event loop.
+    static void call_coalesced(const std::weak_ptr<storageT>& ptr)
+    {
+        auto storage = ptr.lock();
+        if (!storage) {
+            return;
+        }
+        std::optional<std::tuple<Args...>> args;
+        {
+            std::lock_guard coalesce_lock(storage->coalesce_mutex);
+            const auto now = std::chrono::steady_clock::now();
+            const auto due = storage->last_time + storage->rate_limit.interval;
+            if (storage->rate_limit.debounce && now < due) {
+                // There has been an emission since this was scheduled.
+                detail::submit_async_at(storage.get(), due, [ptr]() { call_coalesced(ptr); });
+                return;
+            }
+            args.swap(storage->coalesced_args);
+            storage->coalesced_call_scheduled = false;
+            if (!storage->rate_limit.debounce) {
+                storage->last_time = now;
+            }
+        }
+        if (args) {
+            call_weak(ptr, *args, "coalesced ");
+        }
+    }
+
+    // Record an emission to a rate limited callback.
+    // Returns true if the callback should be called now.
+    // Otherwise the arguments are stored and a later call is scheduled.
+    static bool coalesce(storageT& storage, const std::weak_ptr<storageT>& ptr, const Args&... args)
+    {
+        std::lock_guard coalesce_lock(storage.coalesce_mutex);
+        const auto now = std::chrono::steady_clock::now();
+        if (storage.rate_limit.debounce) {
+            storage.last_time = now;
+        } else if (!storage.coalesced_call_scheduled && storage.last_time <= now - storage.rate_limit.interval) {
+            // The last call was long enough ago.
+            storage.last_time = now;
+            return true;
+        }
+        storage.coalesced_args.emplace(args...);
+        if (!storage.coalesced_call_scheduled) {
+            storage.coalesced_call_scheduled = true;
+            detail::submit_async_at(
+                &storage,
+                storage.last_time + storage.rate_limit.interval,
+                [ptr]() { call_coalesced(ptr); });
+        }
+        return false;
+    }
 
 public:
     // The callback type for this signal.
@@ -87,12 +285,15 @@ public:
     // Connect a callback to this signal and return a token.
     // The token must be kept alive for the callback to work.
     // The token is used to disconnect the callback when it is not needed.
+    // rate_limit can be used to coalesce frequent emissions.
     // Thread safe.
-    tokenT connect(callbackT callback, ConnectionMode mode = ConnectionMode::Direct)
+    tokenT connect(callbackT callback, ConnectionMode mode = ConnectionMode::Direct, RateLimit rate_limit = {})
     {
         std::lock_guard lock(_mutex);
-        auto storage = std::make_shared<storageT>(std::move(callback), mode);
-        _callbacks.emplace(storage);
+        auto storage = std::make_shared<storageT>(std::move(callback), mode, rate_limit);
+        auto callbacks = std::make_shared<WeakSet<storageT>>(*_callbacks);
+        callbacks->emplace(storage);
+        _callbacks = std::move(callbacks);
         return storage;
     }
 
@@ -107,18 +308,32 @@ public:
         std::lock_guard lock(_mutex);
         std::lock_guard storage_lock(token.storage->mutex);
         token.storage->disconnected = true;
-        _callbacks.erase(token.storage);
+        if (_callbacks->contains(token.storage)) {
+            auto callbacks = std::make_shared<WeakSet<storageT>>(*_callbacks);
+            callbacks->erase(token.storage);
+            _callbacks = std::move(callbacks);
+        }
     }
 
-    // Call all callbacks with the given arguments from this thread.
-    // Blocks until all callbacks are processed.
+    // Call all callbacks with the given arguments.
+    // Direct callbacks are called from this thread and parallel callbacks are called by worker threads.
+    // Blocks until all direct and parallel callbacks are processed.
     // Thread safe.
     void emit(Args... args)
+    {
+        emit_nowait(std::move(args)...).wait();
+    }
+
+    // Call all callbacks with the given arguments.
+    // Direct callbacks are called from this thread before this returns.
+    // Parallel callbacks are started on worker threads and the returned handle can be used to wait for them to finish.
+    // Thread safe.
+    SignalEmission emit_nowait(Args... args)
     {
         AmuletLog(5, "emit");
-        WeakSet<storageT> temp_callbacks;
+        std::shared_ptr<const WeakSet<storageT>> temp_callbacks;
         {
-            // Copy callbacks
+            // Get the current snapshot of the callbacks.
             std::lock_guard lock(_mutex);
             temp_callbacks = _callbacks;
         }
@@ -126,10 +341,18 @@ public:
         // Storage elements that were destroyed.
         WeakList<storageT> null_storage;
 
-        std::shared_ptr<std::tuple<Args...>> async_args;
+        std::shared_ptr<std::tuple<Args...>> shared_args;
+        auto get_shared_args = [&]() {
+            if (!shared_args) {
+                shared_args = std::make_shared<std::tuple<Args...>>(args...);
+            }
+            return shared_args;
+        };
 
-        AmuletLog(5, "calling " + std::to_string(temp_callbacks.size()) + " callbacks");
-        for (const auto& ptr : temp_callbacks) {
+        std::shared_ptr<detail::ParallelEmission> parallel_emission;
+
+        AmuletLog(5, "calling " + std::to_string(temp_callbacks->size()) + " callbacks");
+        for (const auto& ptr : *temp_callbacks) {
             auto storage = ptr.lock();
             if (!storage) {
                 AmuletLog(5, "skipping destroyed callback");
@@ -137,6 +360,10 @@ public:
                 null_storage.emplace_back(ptr);
                 continue;
             }
+            if (storage->rate_limit.interval > std::chrono::steady_clock::duration::zero() && !coalesce(*storage, ptr, args...)) {
+                AmuletLog(5, "coalescing rate limited callback");
+                continue;
+            }
             switch (storage->mode) {
             case ConnectionMode::Direct: {
                 AmuletLog(5, "calling direct");
@@ -155,45 +382,45 @@ public:
             } break;
             case ConnectionMode::Async: {
                 AmuletLog(5, "calling async");
-                if (!async_args) {
-                    async_args = std::make_shared<std::tuple<Args...>>(args...);
+                // Calls to the same callback are run in order.
+                detail::submit_async(storage.get(), [async_args = get_shared_args(), ptr]() {
+                    call_weak(ptr, *async_args, "async ");
+                });
+            } break;
+            case ConnectionMode::Parallel: {
+                AmuletLog(5, "calling parallel");
+                if (!parallel_emission) {
+                    parallel_emission = std::make_shared<detail::ParallelEmission>();
                 }
-                detail::submit_async([async_args, ptr]() {
-                    auto storage = ptr.lock();
-                    if (!storage) {
-                        return;
-                    }
-                    std::lock_guard storage_lock(storage->mutex);
-                    if (storage->disconnected) {
-                        // The callback was disconnected between getting the callback and processing it.
-                        return;
-                    }
-                    try {
-                        std::apply(storage->callback, *async_args);
-                    } catch (const std::exception& e) {
-                        AmuletLog(40, "Error in async callback: " << e.what());
-                    } catch (...) {
-                        AmuletLog(40, "Error in async callback.");
-                    }
+                parallel_emission->add([parallel_args = get_shared_args(), ptr]() {
+                    call_weak(ptr, *parallel_args, "parallel ");
                 });
             } break;
             }
         }
 
+        if (parallel_emission) {
+            detail::submit_parallel(parallel_emission);
+        }
+
         if (!null_storage.empty()) {
             // Remove null storage pointers.
             std::lock_guard lock(_mutex);
+            auto callbacks = std::make_shared<WeakSet<storageT>>(*_callbacks);
             for (const auto& ptr : null_storage) {
-                _callbacks.erase(ptr);
+                callbacks->erase(ptr);
             }
+            _callbacks = std::move(callbacks);
         }
+
+        return parallel_emission;
     }
 
     // Destructor.
     ~Signal()
     {
         std::lock_guard lock(_mutex);
-        for (const auto& ptr : _callbacks) {
+        for (const auto& ptr : *_callbacks) {
             auto storage = ptr.lock();
             if (storage) {
                 std::lock_guard storage_lock(storage->mutex);
@@ -13,12 +13,15 @@ void init_signal(py::module m_parent)
     if (m_parent_name == nullptr) {
         throw py::error_already_set();
     }
-    std::string full_name = std::string(m_parent_name) + ".signal._connection_mode";
-    py::handle submodule = PyImport_AddModule(full_name.c_str());
-    if (!submodule) {
-        throw py::error_already_set();
-    }
-    auto m = py::reinterpret_borrow<py::module_>(submodule);
+    auto add_submodule = [&m_parent_name](const char* name) {
+        std::string full_name = std::string(m_parent_name) + ".signal." + name;
+        py::handle submodule = PyImport_AddModule(full_name.c_str());
+        if (!submodule) {
+            throw py::error_already_set();
+        }
+        return py::reinterpret_borrow<py::module_>(submodule);
+    };
+    auto m = add_submodule("_connection_mode");
 
     // Initialise amulet.utils.signal._connection_mode
     std::string module_name = m.attr("__name__").cast<std::string>();
@@ -32,6 +35,10 @@ void init_signal(py::module m_parent)
         "Async",
         Amulet::ConnectionMode::Async,
         "Called asynchronously.");
+    ConnectionMode.value(
+        "Parallel",
+        Amulet::ConnectionMode::Parallel,
+        "Called by a worker thread in parallel with the other parallel callbacks. The emitter waits for it to finish.");
     ConnectionMode.attr("__repr__") = py::cpp_function(
         [module_name, ConnectionMode](const py::object& arg) -> py::str {
             return py::str("{}.{}").format(module_name, ConnectionMode.attr("__str__")(arg));
@@ -39,6 +46,29 @@ void init_signal(py::module m_parent)
         py::name("__repr__"),
         py::is_method(ConnectionMode));
 
+    // Initialise amulet.utils.signal._event_loop
+    auto m_event_loop = add_submodule("_event_loop");
+    m_event_loop.def(
+        "get_async_worker_count",
+        &Amulet::get_async_worker_count,
+        py::doc("Get the number of threads that call async callbacks.\n"
+                "Thread safe."));
+    m_event_loop.def(
+        "set_async_worker_count",
+        &Amulet::set_async_worker_count,
+        py::arg("worker_count"),
+        py::call_guard<py::gil_scoped_release>(),
+        py::doc("Set the number of threads that call async callbacks.\n"
+                "Callbacks connected to a signal are called in the order the signal was emitted and never at the same time.\n"
+                "Different callbacks may be called at the same time.\n"
+                "Must be at least 1. Cannot be called from an async callback.\n"
+                "Thread safe."));
+    m_event_loop.def(
+        "get_async_queue_depth",
+        &Amulet::get_async_queue_depth,
+        py::doc("Get the number of async callbacks that have been queued and not started.\n"
+                "Thread safe."));
+
     // Import it so that stubgen picks it up.
     py::module::import("amulet.utils.signal");
 }
@@ -4,7 +4,11 @@
 #include <pybind11/pybind11.h>
 #include <pybind11/typing.h>
 
+#include <algorithm>
+#include <chrono>
+#include <cmath>
 #include <memory>
+#include <stdexcept>
 
 #include <amulet/pybind11_extensions/nogil_holder.hpp>
 #include <amulet/pybind11_extensions/pybind11.hpp>
@@ -30,17 +34,35 @@ class PySignalToken : public py::object {
     using object::object;
 };
 
+// The largest rate limit interval in seconds accepted from python.
+// Larger values are clamped to this.
+constexpr double MaxRateLimitInterval = 24 * 60 * 60;
+
 // Create a python binding for the signal class.
 template <typename signalT>
 void create_signal_binding()
 {
+    if (!pyext::is_class_bound<SignalEmission>()) {
+        pybind11::class_<SignalEmission>(pybind11::handle(), "SignalEmission", pybind11::module_local())
+            .def("is_done", &SignalEmission::is_done, py::call_guard<py::gil_scoped_release>())
+            .def("wait", &SignalEmission::wait, py::call_guard<py::gil_scoped_release>());
+    }
     if (!pyext::is_class_bound<signalT>()) {
         pybind11::class_<typename signalT::tokenT>(pybind11::handle(), "SignalToken", pybind11::module_local());
 
         pybind11::class_<signalT, pyext::nogil_shared_ptr<signalT>>(pybind11::handle(), "Signal", pybind11::module_local())
             .def(
                 "connect",
-                [](signalT& self, typename signalT::callbackT callback, ConnectionMode mode) {
+                [](signalT& self, typename signalT::callbackT callback, ConnectionMode mode, double interval, bool debounce) {
+                    if (!std::isfinite(interval) || interval < 0.0) {
+                        throw std::invalid_argument("interval must be a finite number of seconds that is at least 0.0");
+                    }
+                    // Larger values would overflow the duration and the times computed from it.
+                    RateLimit rate_limit {
+                        std::chrono::duration_cast<std::chrono::steady_clock::duration>(
+                            std::chrono::duration<double>(std::min(interval, MaxRateLimitInterval))),
+                        debounce
+                    };
                     // Bad things happen if this is called after python shuts down.
                     // Add a wrapper to make sure python is still running.
                     auto py_valid = get_py_valid();
@@ -54,12 +76,15 @@ void create_signal_binding()
                         }
                     };
                     py::gil_scoped_release nogil;
-                    return self.connect(callback_wrapper, mode);
+                    return self.connect(callback_wrapper, mode, rate_limit);
                 },
                 py::arg("callback"),
-                py::arg("mode") = Amulet::ConnectionMode::Direct)
+                py::arg("mode") = Amulet::ConnectionMode::Direct,
+                py::arg("interval") = 0.0,
+                py::arg("debounce") = false)
             .def("disconnect", &signalT::disconnect, py::call_guard<py::gil_scoped_release>())
-            .def("emit", &signalT::emit, py::call_guard<py::gil_scoped_release>());
+            .def("emit", &signalT::emit, py::call_guard<py::gil_scoped_release>())
+            .def("emit_nowait", &signalT::emit_nowait, py::call_guard<py::gil_scoped_release>());
     }
 }
 
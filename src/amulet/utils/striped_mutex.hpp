@@ -0,0 +1,178 @@
+#pragma once
+
+#include <algorithm>
+#include <bit>
+#include <chrono>
+#include <cstddef>
+#include <cstdint>
+#include <functional>
+#include <memory>
+#include <span>
+#include <vector>
+
+#include <amulet/utils/mutex.hpp>
+#include <amulet/utils/task_manager/cancel_manager.hpp>
+
+namespace Amulet {
+
+// A fixed size table of OrderedMutex instances shared by an unbounded set of keys.
+// Each key maps to one stripe so the memory used does not depend on the number of keys.
+// Keys that map to the same stripe block each other. A larger stripe count makes this less likely.
+// Locking two keys that map to the same stripe from one thread raises Deadlock unless the stripe is re-entrant.
+// Use lock_all to lock several keys.
+template <typename KeyT, typename HashT = std::hash<KeyT>>
+class StripedOrderedMutex {
+private:
+    // Each mutex is on its own cache line so that threads using different stripes do not contend.
+    struct alignas(64) Stripe {
+        OrderedMutex mutex;
+    };
+
+    std::size_t mask;
+    std::unique_ptr<Stripe[]> stripes;
+    HashT hash;
+
+    // Mix the bits of the hash so that keys with similar hashes are spread over the stripes.
+    static std::size_t mix(std::uint64_t h)
+    {
+        h ^= h >> 33;
+        h *= 0xff51afd7ed558ccdULL;
+        h ^= h >> 33;
+        h *= 0xc4ceb9fe1a85ec53ULL;
+        h ^= h >> 33;
+        return static_cast<std::size_t>(h);
+    }
+
+public:
+    // Construct a table with stripe_count stripes rounded up to a power of two.
+    explicit StripedOrderedMutex(std::size_t stripe_count = 1024, HashT hash = HashT())
+        : mask(std::bit_ceil(std::max<std::size_t>(stripe_count, 1)) - 1)
+        , stripes(std::make_unique<Stripe[]>(mask + 1))
+        , hash(std::move(hash))
+    {
+    }
+
+    StripedOrderedMutex(const StripedOrderedMutex&) = delete;
+    StripedOrderedMutex(StripedOrderedMutex&&) = delete;
+
+    // The number of stripes.
+    // Thread safe.
+    std::size_t get_stripe_count() const
+    {
+        return mask + 1;
+    }
+
+    // Get the index of the stripe a key maps to.
+    // Thread safe.
+    std::size_t get_stripe_index(const KeyT& key) const
+    {
+        return mix(static_cast<std::uint64_t>(hash(key))) & mask;
+    }
+
+    // Get the mutex a key maps to.
+    // Thread safe.
+    OrderedMutex& get_mutex(const KeyT& key)
+    {
+        return stripes[get_stripe_index(key)].mutex;
+    }
+
+    // Locks the mutex of a key in the requested mode (default is read write unique).
+    // See OrderedMutex::lock.
+    // Thread safe.
+    template <ThreadAccessMode DesiredThreadAccessMode = ThreadAccessMode::ReadWrite, ThreadShareMode DesiredThreadShareMode = ThreadShareMode::Unique>
+    void lock(const KeyT& key, AbstractCancelManager& cancel_manager = global_VoidCancelManager)
+    {
+        get_mutex(key).template lock<DesiredThreadAccessMode, DesiredThreadShareMode>(cancel_manager);
+    }
+
+    // Tries to lock the mutex of a key in the requested mode (default is read write unique).
+    // See OrderedMutex::try_lock.
+    // Thread safe.
+    template <ThreadAccessMode DesiredThreadAccessMode = ThreadAccessMode::ReadWrite, ThreadShareMode DesiredThreadShareMode = ThreadShareMode::Unique>
+    bool try_lock(const KeyT& key)
+    {
+        return get_mutex(key).template try_lock<DesiredThreadAccessMode, DesiredThreadShareMode>();
+    }
+
+    // Like try_lock but with a timeout duration.
+    // See OrderedMutex::try_lock_for.
+    // Thread safe.
+    template <ThreadAccessMode DesiredThreadAccessMode = ThreadAccessMode::ReadWrite, ThreadShareMode DesiredThreadShareMode = ThreadShareMode::Unique, class Rep, class Period>
+    bool try_lock_for(const KeyT& key, const std::chrono::duration<Rep, Period>& timeout_duration, AbstractCancelManager& cancel_manager = global_VoidCancelManager)
+    {
+        return get_mutex(key).template try_lock_for<DesiredThreadAccessMode, DesiredThreadShareMode>(timeout_duration, cancel_manager);
+    }
+
+    // Like try_lock but with a timeout time.
+    // See OrderedMutex::try_lock_until.
+    // Thread safe.
+    template <ThreadAccessMode DesiredThreadAccessMode = ThreadAccessMode::ReadWrite, ThreadShareMode DesiredThreadShareMode = ThreadShareMode::Unique, class Clock, class Duration>
+    bool try_lock_until(const KeyT& key, const std::chrono::time_point<Clock, Duration>& timeout_time, AbstractCancelManager& cancel_manager = global_VoidCancelManager)
+    {
+        return get_mutex(key).template try_lock_until<DesiredThreadAccessMode, DesiredThreadShareMode>(timeout_time, cancel_manager);
+    }
+
+    // Unlock the mutex of a key.
+    // Must be called by the thread that locked it.
+    // Thread safe.
+    void unlock(const KeyT& key)
+    {
+        get_mutex(key).unlock();
+    }
+
+    // Get the lock requests to lock all of the keys in one mode.
+    // Keys that map to the same stripe share one request so each mutex is locked once.
+    // The requests are in stripe order.
+    // Thread safe.
+    std::vector<OrderedMutexLockRequest> get_lock_requests(
+        std::span<const KeyT> keys,
+        ThreadAccessMode access_mode = ThreadAccessMode::ReadWrite,
+        ThreadShareMode share_mode = ThreadShareMode::Unique)
+    {
+        std::vector<std::size_t> indexes;
+        indexes.reserve(keys.size());
+        for (const auto& key : keys) {
+            indexes.push_back(get_stripe_index(key));
+        }
+        std::sort(indexes.begin(), indexes.end());
+        indexes.erase(std::unique(indexes.begin(), indexes.end()), indexes.end());
+
+        std::vector<OrderedMutexLockRequest> requests;
+        requests.reserve(indexes.size());
+        for (const auto& index : indexes) {
+            requests.push_back({ &stripes[index].mutex, access_mode, share_mode });
+        }
+        return requests;
+    }
+
+    // Lock the mutexes of all of the keys in the requested mode without deadlocking.
+    // Either all of the mutexes are locked or none of them are.
+    // See Amulet::lock_all.
+    // Thread safe.
+    template <ThreadAccessMode DesiredThreadAccessMode = ThreadAccessMode::ReadWrite, ThreadShareMode DesiredThreadShareMode = ThreadShareMode::Unique>
+    void lock_all(std::span<const KeyT> keys, AbstractCancelManager& cancel_manager = global_VoidCancelManager)
+    {
+        Amulet::lock_all(get_lock_requests(keys, DesiredThreadAccessMode, DesiredThreadShareMode), cancel_manager);
+    }
+
+    // Like lock_all but with a timeout duration.
+    // See Amulet::try_lock_all_for.
+    // Thread safe.
+    template <ThreadAccessMode DesiredThreadAccessMode = ThreadAccessMode::ReadWrite, ThreadShareMode DesiredThreadShareMode = ThreadShareMode::Unique, class Rep, class Period>
+    bool try_lock_all_for(std::span<const KeyT> keys, const std::chrono::duration<Rep, Period>& timeout_duration, AbstractCancelManager& cancel_manager = global_VoidCancelManager)
+    {
+        return Amulet::try_lock_all_for(get_lock_requests(keys, DesiredThreadAccessMode, DesiredThreadShareMode), timeout_duration, cancel_manager);
+    }
+
+    // Unlock the mutexes of all of the keys locked with lock_all.
+    // Must be called by the thread that locked them.
+    // Thread safe.
+    void unlock_all(std::span<const KeyT> keys)
+    {
+        for (const auto& request : get_lock_requests(keys)) {
+            request.mutex->unlock();
+        }
+    }
+};
+
+} // namespace Amulet
@@ -7,9 +7,11 @@ from contextlib import AbstractContextManager, suppress
 from enum import Enum
 import itertools
 import sys
+import asyncio
 
 from amulet.utils.task_manager import AbstractCancelManager, CancelManager
 from amulet.utils.lock import (
+    AsyncLockToken,
     Deadlock,
     OrderedLock,
     ThreadAccessMode,
@@ -18,10 +20,14 @@ from amulet.utils.lock import (
     Lock,
     RLock,
     SharedLock,
+    StripedOrderedLock,
+    acquire_all,
+    get_ordered_lock_profiles,
 )
 
 from test_amulet_utils.test_lock_ import (
     throw_deadlock,
+    count_ordered_mutex,
     lock_ordered_mutex,
     lock_shared_mutex,
 )
@@ -108,8 +114,63 @@ class Abstract:
                 f"Expected {expected_time}s. Got {dt}s",
             )
 
+        def _timeout_cancel_test(
+            self,
+            hold: Callable[[], AbstractContextManager],
+            acquire: Callable[..., bool],
+            release: Callable[[], None],
+        ) -> None:
+            """Test acquiring with a timeout and a cancel manager while another thread holds the lock."""
+            step = ThreadStepManager()
+
+            def f() -> None:
+                with hold():
+                    step.increment()
+                    step.wait(2)
+
+            thread = Thread(target=f)
+            thread.start()
+            step.wait(1)
+
+            self.assertFalse(acquire(blocking=False))
+
+            t = time.time()
+            self.assertFalse(acquire(timeout=SLEEP_TIME))
+            self.assertLessEqual(SLEEP_TIME - 0.01, time.time() - t)
+
+            cancel_manager = CancelManager()
+            cancel_thread = Thread(
+                target=lambda: (time.sleep(SLEEP_TIME), cancel_manager.cancel())
+            )
+            t = time.time()
+            cancel_thread.start()
+            self.assertFalse(acquire(cancel_manager=cancel_manager))
+            dt = time.time() - t
+            self.assertTrue(
+                SLEEP_TIME - 0.01 <= dt <= SLEEP_TIME + TIME_TOLERANCE,
+                f"Expected {SLEEP_TIME}s. Got {dt}s",
+            )
+            cancel_thread.join()
+
+            # A waiting thread is woken when the lock is released.
+            release_thread = Thread(
+                target=lambda: (time.sleep(SLEEP_TIME), step.increment())
+            )
+            t = time.time()
+            release_thread.start()
+            self.assertTrue(acquire(timeout=10 * SLEEP_TIME))
+            dt = time.time() - t
+            self.assertLessEqual(dt, SLEEP_TIME + TIME_TOLERANCE)
+            release()
+            release_thread.join()
+            thread.join()
+
 
 class LockTestCase(Abstract.LockTestCase):
+    def test_timeout_cancel(self) -> None:
+        lock = Lock()
+        self._timeout_cancel_test(lambda: lock, lock.acquire, lock.release)
+
     def test_lock(self) -> None:
         lock = Lock()
         with lock:
@@ -164,6 +225,10 @@ class LockTestCase(Abstract.LockTestCase):
 
 
 class RLockTestCase(Abstract.LockTestCase):
+    def test_timeout_cancel(self) -> None:
+        lock = RLock()
+        self._timeout_cancel_test(lambda: lock, lock.acquire, lock.release)
+
     def test_rlock(self) -> None:
         lock = RLock()
         with lock:
@@ -219,6 +284,17 @@ class RLockTestCase(Abstract.LockTestCase):
 
 
 class SharedLockTestCase(Abstract.LockTestCase):
+    def test_timeout_cancel(self) -> None:
+        lock = SharedLock()
+        with self.subTest("unique"):
+            self._timeout_cancel_test(
+                lock.shared, lock.acquire_unique, lock.release_unique
+            )
+        with self.subTest("shared"):
+            self._timeout_cancel_test(
+                lock.unique, lock.acquire_shared, lock.release_shared
+            )
+
     def test_shared_lock(self) -> None:
         lock = SharedLock()
         lock.acquire_unique()
@@ -1054,6 +1130,487 @@ class OrderedLockTestCase(Abstract.LockTestCase):
                             f"Expected 2s. Got {dt}s",
                         )
 
+    def test_mutual_exclusion(self) -> None:
+        self.assertEqual(8 * 10_000, count_ordered_mutex(8, 10_000))
+
+    def test_reentrant(self) -> None:
+        self.assertFalse(OrderedLock().reentrant)
+        lock = OrderedLock(reentrant=True)
+        self.assertTrue(lock.reentrant)
+
+        def try_acquire() -> bool:
+            result = False
+
+            def func() -> None:
+                nonlocal result
+                result = lock.acquire(blocking=False)
+                if result:
+                    lock.release()
+
+            thread = Thread(target=func)
+            thread.start()
+            thread.join()
+            return result
+
+        with lock():
+            with lock(
+                thread_mode=(ThreadAccessMode.Read, ThreadShareMode.SharedReadOnly)
+            ):
+                with lock():
+                    self.assertFalse(try_acquire())
+                self.assertFalse(try_acquire())
+            self.assertFalse(try_acquire())
+        self.assertTrue(try_acquire())
+
+        with lock(thread_mode=(ThreadAccessMode.Read, ThreadShareMode.SharedReadOnly)):
+            # A mode that is not covered by the held mode must be upgraded.
+            with self.assertRaises(Deadlock):
+                lock.acquire()
+            with self.assertRaises(Deadlock):
+                lock.acquire(
+                    thread_mode=(ThreadAccessMode.ReadWrite, ThreadShareMode.Unique)
+                )
+        self.assertTrue(try_acquire())
+
+    def test_upgrade(self) -> None:
+        lock = OrderedLock()
+        shared_mode = (ThreadAccessMode.Read, ThreadShareMode.SharedReadOnly)
+        step = ThreadStepManager()
+        exec_order: list[str] = []
+
+        def reader() -> None:
+            with lock(thread_mode=shared_mode):
+                step.increment()
+                time.sleep(SLEEP_TIME)
+                exec_order.append("reader")
+
+        def writer() -> None:
+            step.wait(1)
+            step.increment()
+            with lock():
+                exec_order.append("writer")
+
+        with self.assertRaises(RuntimeError):
+            lock.upgrade()
+
+        with lock(thread_mode=shared_mode):
+            reader_thread = Thread(target=reader)
+            writer_thread = Thread(target=writer)
+            reader_thread.start()
+            writer_thread.start()
+            step.wait(2)
+            # The writer is queued behind the reader.
+            time.sleep(SLEEP_TIME / 4)
+            self.assertFalse(lock.upgrade(blocking=False))
+            # Downgrading must not increase the held mode.
+            with self.assertRaises(ValueError):
+                lock.downgrade(
+                    thread_mode=(ThreadAccessMode.ReadWrite, ThreadShareMode.Unique)
+                )
+            # The upgrade waits for the reader and takes priority over the queued writer.
+            self.assertTrue(lock.upgrade(timeout=5))
+            exec_order.append("upgrade")
+            lock.downgrade(thread_mode=shared_mode)
+            # The writer is still blocked by the shared lock.
+            self.assertTrue(writer_thread.is_alive())
+        reader_thread.join()
+        writer_thread.join()
+        self.assertEqual(["reader", "upgrade", "writer"], exec_order)
+
+    def test_acquire_all(self) -> None:
+        lock_a = OrderedLock()
+        lock_b = OrderedLock()
+        unique_mode = (ThreadAccessMode.ReadWrite, ThreadShareMode.Unique)
+        shared_mode = (ThreadAccessMode.Read, ThreadShareMode.SharedReadOnly)
+
+        def is_locked(lock: OrderedLock) -> bool:
+            result = True
+
+            def func() -> None:
+                nonlocal result
+                if lock.acquire(blocking=False):
+                    result = False
+                    lock.release()
+
+            thread = Thread(target=func)
+            thread.start()
+            thread.join()
+            return result
+
+        self.assertTrue(acquire_all([]))
+        self.assertTrue(acquire_all([(lock_a, shared_mode), (lock_b, unique_mode)]))
+        self.assertTrue(is_locked(lock_a))
+        self.assertTrue(is_locked(lock_b))
+        lock_a.release()
+        lock_b.release()
+
+        with self.assertRaises(Deadlock):
+            acquire_all([(lock_a, unique_mode), (lock_a, unique_mode)])
+        self.assertFalse(is_locked(lock_a))
+
+        # None of the locks are held if one could not be acquired.
+        def acquire_in_thread(**kwargs: Any) -> bool:
+            result = True
+
+            def func() -> None:
+                nonlocal result
+                result = acquire_all(
+                    [(lock_a, unique_mode), (lock_b, unique_mode)], **kwargs
+                )
+
+            thread = Thread(target=func)
+            thread.start()
+            if "cancel_manager" in kwargs:
+                time.sleep(SLEEP_TIME)
+                kwargs["cancel_manager"].cancel()
+            thread.join()
+            return result
+
+        with lock_b():
+            self.assertFalse(acquire_in_thread(blocking=False))
+            self.assertFalse(is_locked(lock_a))
+            self.assertFalse(acquire_in_thread(timeout=SLEEP_TIME))
+            self.assertFalse(is_locked(lock_a))
+            self.assertFalse(acquire_in_thread(cancel_manager=CancelManager()))
+            self.assertFalse(is_locked(lock_a))
+
+        # Acquiring in opposite orders does not deadlock.
+        counts = [0, 0]
+
+        def acquire_many(index: int, locks: list[OrderedLock]) -> None:
+            for _ in range(1000):
+                self.assertTrue(
+                    acquire_all([(lock, unique_mode) for lock in locks], timeout=5)
+                )
+                counts[index] += 1
+                for lock in locks:
+                    lock.release()
+
+        threads = [
+            Thread(target=acquire_many, args=(0, [lock_a, lock_b])),
+            Thread(target=acquire_many, args=(1, [lock_b, lock_a])),
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([1000, 1000], counts)
+
+    def test_acquire_async(self) -> None:
+        lock = OrderedLock()
+        locked = Condition()
+        release = Condition()
+
+        def hold() -> None:
+            with lock():
+                with locked:
+                    locked.notify()
+                with release:
+                    release.wait()
+
+        async def main() -> None:
+            # Coroutines are granted the lock in order.
+            order = []
+
+            async def worker(i: int) -> None:
+                async with lock.async_context():
+                    order.append(i)
+                    await asyncio.sleep(0.01)
+
+            await asyncio.gather(*(worker(i) for i in range(5)))
+            self.assertEqual([0, 1, 2, 3, 4], order)
+
+            with locked:
+                thread = Thread(target=hold)
+                thread.start()
+                locked.wait()
+
+            self.assertIsNone(await lock.acquire_async(blocking=False))
+            start = time.time()
+            self.assertIsNone(await lock.acquire_async(timeout=SLEEP_TIME))
+            self.assertLess(SLEEP_TIME - TIME_TOLERANCE, time.time() - start)
+            with self.assertRaises(LockNotAcquired):
+                async with lock.async_context(timeout=SLEEP_TIME):
+                    pass
+
+            cancel_manager = CancelManager()
+            asyncio.get_running_loop().call_later(SLEEP_TIME, cancel_manager.cancel)
+            self.assertIsNone(await lock.acquire_async(cancel_manager=cancel_manager))
+
+            task = asyncio.ensure_future(lock.acquire_async())
+            await asyncio.sleep(SLEEP_TIME)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+            # The event loop is not blocked while waiting.
+            future = lock.acquire_async()
+            await asyncio.sleep(SLEEP_TIME)
+            self.assertFalse(future.done())
+            with release:
+                release.notify()
+            token = await future
+            self.assertIsInstance(token, AsyncLockToken)
+            lock.release_async(token)
+            thread.join()
+
+            token = await lock.acquire_async(blocking=False)
+            self.assertIsNotNone(token)
+            # The lock is held by the token and not the event loop thread.
+            with self.assertRaises(RuntimeError):
+                lock.release()
+            with self.assertRaises(ValueError):
+                OrderedLock().release_async(token)
+            lock.release_async(token)
+            with self.assertRaises(RuntimeError):
+                lock.release_async(token)
+
+        asyncio.run(main())
+
+    def test_acquire_async_release_order(self) -> None:
+        # Each coroutine releases its own mode whatever order they are released in.
+        lock = OrderedLock()
+        read_mode = (ThreadAccessMode.Read, ThreadShareMode.SharedReadWrite)
+        write_mode = (ThreadAccessMode.ReadWrite, ThreadShareMode.SharedReadWrite)
+
+        def try_acquire_read() -> bool:
+            result = False
+
+            def acquire() -> None:
+                nonlocal result
+                result = lock.acquire(
+                    blocking=False,
+                    thread_mode=(ThreadAccessMode.Read, ThreadShareMode.SharedReadOnly),
+                )
+                if result:
+                    lock.release()
+
+            thread = Thread(target=acquire)
+            thread.start()
+            thread.join()
+            return result
+
+        async def main() -> None:
+            token_a = await lock.acquire_async(thread_mode=read_mode)
+            token_b = await lock.acquire_async(thread_mode=write_mode)
+            self.assertIsNotNone(token_a)
+            self.assertIsNotNone(token_b)
+            self.assertFalse(try_acquire_read())
+            # Release the writer first. Only the reader holds the lock.
+            lock.release_async(token_b)
+            self.assertTrue(try_acquire_read())
+            lock.release_async(token_a)
+
+            async with lock.async_context(thread_mode=read_mode):
+                async with lock.async_context(thread_mode=write_mode) as token:
+                    self.assertIsInstance(token, AsyncLockToken)
+                    self.assertFalse(try_acquire_read())
+                self.assertTrue(try_acquire_read())
+
+        asyncio.run(main())
+
+    def test_acquire_async_closed_loop(self) -> None:
+        # A request granted after its event loop has closed must not leak the lock.
+        lock = OrderedLock()
+        lock.acquire()
+
+        async def start() -> Any:
+            return lock.acquire_async()
+
+        loop = asyncio.new_event_loop()
+        future = loop.run_until_complete(start())
+        self.assertFalse(future.done())
+        loop.close()
+
+        lock.release()
+        self.assertTrue(lock.acquire(timeout=1.0))
+        lock.release()
+
+    def test_acquire_async_reentrant(self) -> None:
+        # A coroutine holding a re-entrant lock does not let other code on the event loop thread acquire it.
+        lock = OrderedLock(reentrant=True)
+
+        async def main() -> None:
+            async with lock.async_context():
+                self.assertFalse(lock.acquire(blocking=False))
+            self.assertTrue(lock.acquire(blocking=False))
+            lock.release()
+
+        asyncio.run(main())
+
+    def test_context_manager(self) -> None:
+        lock = OrderedLock()
+        result = True
+
+        def acquire() -> None:
+            nonlocal result
+            result = lock.acquire(blocking=False)
+            if result:
+                lock.release()
+
+        with lock:
+            thread = Thread(target=acquire)
+            thread.start()
+            thread.join()
+            self.assertFalse(result)
+        thread = Thread(target=acquire)
+        thread.start()
+        thread.join()
+        self.assertTrue(result)
+
+        # The context manager can be reused.
+        context_manager = lock(
+            thread_mode=(ThreadAccessMode.Read, ThreadShareMode.SharedReadOnly)
+        )
+        for _ in range(2):
+            with context_manager:
+                with self.assertRaises(Deadlock):
+                    lock.acquire()
+        del lock
+        with context_manager:
+            pass
+
+    def test_profile(self) -> None:
+        lock = OrderedLock()
+        shared_mode = (ThreadAccessMode.Read, ThreadShareMode.SharedReadOnly)
+        unique_mode = (ThreadAccessMode.ReadWrite, ThreadShareMode.Unique)
+        self.assertFalse(lock.profiling)
+        # Nothing is recorded until profiling is enabled.
+        with lock():
+            pass
+        self.assertEqual(0, sum(lock.profile.acquire_count.values()))
+
+        lock.enable_profiling("test_profile")
+        self.assertTrue(lock.profiling)
+        try:
+            with lock():
+                pass
+            with lock(thread_mode=shared_mode):
+                pass
+
+            def acquire(timeout: float) -> None:
+                with suppress(LockNotAcquired):
+                    with lock(timeout=timeout):
+                        pass
+
+            # One acquire call waits for the lock and one times out.
+            thread_1 = Thread(target=acquire, args=(5,))
+            thread_2 = Thread(target=acquire, args=(SLEEP_TIME / 2,))
+            with lock():
+                thread_1.start()
+                thread_2.start()
+                time.sleep(SLEEP_TIME)
+            thread_1.join()
+            thread_2.join()
+
+            profile = lock.profile
+            self.assertEqual("test_profile", profile.name)
+            self.assertEqual(3, profile.acquire_count[unique_mode])
+            self.assertEqual(1, profile.acquire_count[shared_mode])
+            self.assertEqual(1, profile.contended_count)
+            self.assertEqual(1, profile.timeout_count)
+            self.assertEqual(0, profile.cancel_count)
+            self.assertLess(SLEEP_TIME / 2, profile.max_wait_time)
+            self.assertLessEqual(profile.max_wait_time, profile.total_wait_time)
+            self.assertEqual(4, sum(profile.hold_time_histogram))
+
+            profiles = get_ordered_lock_profiles()
+            self.assertIn("test_profile", [profile.name for profile in profiles])
+            self.assertEqual(1, len(get_ordered_lock_profiles(1)))
+
+            lock.reset_profile()
+            self.assertEqual(0, sum(lock.profile.acquire_count.values()))
+        finally:
+            lock.disable_profiling()
+        self.assertFalse(lock.profiling)
+        self.assertNotIn(
+            "test_profile", [profile.name for profile in get_ordered_lock_profiles()]
+        )
+
+    def test_max_spin(self) -> None:
+        lock = OrderedLock()
+        self.assertIsNone(lock.max_spin)
+        lock.max_spin = 10
+        self.assertEqual(10, lock.max_spin)
+        lock.max_spin = None
+        self.assertIsNone(lock.max_spin)
+
+        default_max_spin = OrderedLock.get_default_max_spin()
+        try:
+            OrderedLock.set_default_max_spin(5)
+            self.assertEqual(5, OrderedLock.get_default_max_spin())
+        finally:
+            OrderedLock.set_default_max_spin(default_max_spin)
+
+    def test_spin_stats(self) -> None:
+        for max_spin in (0, 1000):
+            with self.subTest(max_spin=max_spin):
+                lock = OrderedLock()
+                lock.max_spin = max_spin
+
+                def acquire() -> None:
+                    with lock(timeout=5):
+                        pass
+
+                # Uncontended calls do not spin.
+                acquire()
+                stats = lock.spin_stats
+                self.assertEqual(0, stats.spin_count)
+                self.assertEqual(0, stats.park_count)
+
+                # The lock is held for longer than the spin so the thread must wait in the queue.
+                thread = Thread(target=acquire)
+                with lock():
+                    thread.start()
+                    time.sleep(SLEEP_TIME)
+                thread.join()
+                stats = lock.spin_stats
+                self.assertEqual(1 if max_spin else 0, stats.spin_count)
+                self.assertEqual(0, stats.spin_success_count)
+                self.assertEqual(1, stats.park_count)
+
+                lock.reset_spin_stats()
+                stats = lock.spin_stats
+                self.assertEqual(0, stats.spin_count)
+                self.assertEqual(0, stats.park_count)
+
+    def test_shared_burst(self) -> None:
+        # All readers queued behind a writer should run in parallel when it is released.
+        lock = OrderedLock()
+        step = ThreadStepManager()
+        reader_count = 16
+        end_times: list[float] = []
+
+        def reader() -> None:
+            step.increment()
+            with lock(
+                timeout=5,
+                thread_mode=(ThreadAccessMode.Read, ThreadShareMode.SharedReadOnly),
+            ):
+                time.sleep(SLEEP_TIME)
+            end_times.append(time.time())
+
+        threads = [Thread(target=reader) for _ in range(reader_count)]
+        with lock(
+            thread_mode=(ThreadAccessMode.ReadWrite, ThreadShareMode.Unique),
+        ):
+            for thread in threads:
+                thread.start()
+            step.wait(reader_count)
+            # Give the readers time to queue.
+            time.sleep(SLEEP_TIME)
+            t = time.time()
+
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(reader_count, len(end_times))
+        dt = max(end_times) - t
+        self.assertTrue(
+            SLEEP_TIME - 0.01 <= dt <= SLEEP_TIME + TIME_TOLERANCE,
+            f"Expected {SLEEP_TIME}s. Got {dt}s",
+        )
+
     def test_shared_speed_1(self) -> None:
         with Timer():
             shared_mutex = SharedLock()
@@ -1135,3 +1692,79 @@ class OrderedLockTestCase(Abstract.LockTestCase):
             t2.join()
 
             ordered_mutex.release()
+
+
+class StripedOrderedLockTestCase(TestCase):
+    def test_constructor(self) -> None:
+        self.assertEqual(1024, StripedOrderedLock().stripe_count)
+        self.assertEqual(1, StripedOrderedLock(0).stripe_count)
+        self.assertEqual(16, StripedOrderedLock(16).stripe_count)
+        self.assertEqual(32, StripedOrderedLock(17).stripe_count)
+
+    def test_get_lock(self) -> None:
+        lock = StripedOrderedLock(16)
+        self.assertIs(lock.get_lock((1, 2)), lock.get_lock((1, 2)))
+        # All keys share the lock if there is one stripe.
+        lock = StripedOrderedLock(1)
+        self.assertIs(lock.get_lock((1, 2)), lock.get_lock("key"))
+        # Keys are spread over the stripes.
+        lock = StripedOrderedLock(16)
+        locks = [lock.get_lock((x, z)) for x in range(8) for z in range(8)]
+        self.assertLess(8, len({id(l) for l in locks}))
+
+    def test_lock(self) -> None:
+        lock = StripedOrderedLock(1)
+        result = True
+
+        def acquire(key: Any) -> None:
+            nonlocal result
+            result = lock.acquire(key, blocking=False)
+            if result:
+                lock.release(key)
+
+        with lock((0, 0)):
+            thread = Thread(target=acquire, args=((1, 1),))
+            thread.start()
+            thread.join()
+            self.assertFalse(result)
+            # A key in the same stripe is the same lock.
+            with self.assertRaises(Deadlock):
+                lock.acquire((1, 1))
+
+        self.assertTrue(lock.acquire((0, 0), timeout=1))
+        lock.release((0, 0))
+
+        thread = Thread(target=acquire, args=((1, 1),))
+        thread.start()
+        thread.join()
+        self.assertTrue(result)
+
+    def test_acquire_all(self) -> None:
+        lock = StripedOrderedLock(4)
+        keys = [(x, z) for x in range(4) for z in range(4)]
+        result = True
+
+        def acquire(key: Any) -> None:
+            nonlocal result
+            result = lock.acquire(key, blocking=False)
+            if result:
+                lock.release(key)
+
+        self.assertTrue(lock.acquire_all(keys, timeout=1))
+        for key in keys:
+            thread = Thread(target=acquire, args=(key,))
+            thread.start()
+            thread.join()
+            self.assertFalse(result)
+        lock.release_all(keys)
+
+        def acquire_all() -> None:
+            nonlocal result
+            result = lock.acquire_all(keys, blocking=False)
+            if result:
+                lock.release_all(keys)
+
+        thread = Thread(target=acquire_all)
+        thread.start()
+        thread.join()
+        self.assertTrue(result)
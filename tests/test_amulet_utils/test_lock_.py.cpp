@@ -1,17 +1,83 @@
 #include <pybind11/pybind11.h>
 
+#include <chrono>
+#include <optional>
 #include <shared_mutex>
+#include <thread>
+#include <vector>
 
+#include <amulet/pybind11_extensions/contextlib.hpp>
 #include <amulet/pybind11_extensions/py_module.hpp>
 
+#include <amulet/utils/cancellable_mutex.hpp>
 #include <amulet/utils/mutex.hpp>
+#include <amulet/utils/task_manager/cancel_manager.hpp>
 
 namespace py = pybind11;
+namespace pyext = Amulet::pybind11_extensions;
+
+// Acquire the mutex as the context manager OrderedLock.__call__ used to return did.
+// This is called with the GIL released.
+static bool acquire_mutex(
+    Amulet::OrderedMutex& mutex,
+    bool blocking,
+    double timeout,
+    Amulet::AbstractCancelManager& cancel_manager,
+    const std::pair<Amulet::ThreadAccessMode, Amulet::ThreadShareMode>& thread_mode)
+{
+    return Amulet::detail::visit_thread_mode(thread_mode.first, thread_mode.second, [&]<Amulet::ThreadAccessMode AccessMode, Amulet::ThreadShareMode ShareMode>() -> bool {
+        if (blocking) {
+            if (0 < timeout) {
+                return mutex.try_lock_for<AccessMode, ShareMode>(std::chrono::duration<double>(timeout), cancel_manager);
+            } else {
+                return mutex.try_lock_for<AccessMode, ShareMode>(std::chrono::years(1), cancel_manager);
+            }
+        } else {
+            return mutex.try_lock<AccessMode, ShareMode>();
+        }
+    });
+}
 
 void init_test_lock(py::module m_parent){
     auto m = m_parent.def_submodule("test_lock_");
     m.def("throw_deadlock", [](){ throw Amulet::Deadlock("Deadlock encountered."); });
 
+    m.def(
+        "generic_ordered_mutex_context",
+        [](
+            Amulet::OrderedMutex& mutex,
+            bool blocking,
+            double timeout,
+            Amulet::AbstractCancelManager& cancel_manager,
+            const std::pair<Amulet::ThreadAccessMode, Amulet::ThreadShareMode>& thread_mode) {
+            // The generic context manager OrderedLock.__call__ used to return.
+            // This is used to benchmark the native context manager against it.
+            return pyext::contextlib::make_context_manager<void, std::optional<bool>>(
+                [&mutex, blocking, timeout, &cancel_manager, thread_mode]() -> void {
+                    bool locked;
+                    {
+                        py::gil_scoped_release nogil;
+                        locked = acquire_mutex(mutex, blocking, timeout, cancel_manager, thread_mode);
+                    }
+                    if (!locked) {
+                        py::set_error(py::module::import("amulet.utils.lock").attr("LockNotAcquired"), "Lock was not acquired.");
+                        throw py::error_already_set();
+                    }
+                },
+                [&mutex](py::object, py::object, py::object) -> std::optional<bool> {
+                    py::gil_scoped_release nogil;
+                    mutex.unlock();
+                    return false;
+                });
+        },
+        py::arg("lock"),
+        py::arg("blocking") = true,
+        py::arg("timeout") = -1.0,
+        py::arg("cancel_manager") = Amulet::VoidCancelManager(),
+        py::arg("thread_mode") = std::make_pair(Amulet::ThreadAccessMode::ReadWrite, Amulet::ThreadShareMode::Unique),
+        py::keep_alive<0, 1>(),
+        py::keep_alive<0, 4>());
+
     m.def("lock_ordered_mutex", [](Amulet::OrderedMutex& mutex, size_t count) {
         for (size_t i = 0; i < count; i++) {
             mutex.lock<Amulet::ThreadAccessMode::ReadWrite, Amulet::ThreadShareMode::SharedReadWrite>();
@@ -19,7 +85,39 @@ void init_test_lock(py::module m_parent){
         }
     });
 
-    m.def("lock_shared_mutex", [](std::shared_mutex& mutex, size_t count) {
+    m.def("count_ordered_mutex", [](size_t thread_count, size_t count) {
+        // Each thread increments the counter with the mutex locked uniquely and reads it with the mutex locked shared.
+        // If the mutex allows two writers in parallel increments are lost.
+        Amulet::OrderedMutex mutex;
+        size_t counter = 0;
+        bool valid = true;
+        {
+            py::gil_scoped_release nogil;
+            std::vector<std::thread> threads;
+            for (size_t i = 0; i < thread_count; i++) {
+                threads.emplace_back([&]() {
+                    for (size_t j = 0; j < count; j++) {
+                        mutex.lock();
+                        size_t value = counter;
+                        std::this_thread::yield();
+                        counter = value + 1;
+                        mutex.unlock();
+                        mutex.lock_shared();
+                        if (counter == 0) {
+                            valid = false;
+                        }
+                        mutex.unlock_shared();
+                    }
+                });
+            }
+            for (auto& thread : threads) {
+                thread.join();
+            }
+        }
+        return valid ? counter : 0;
+    });
+
+    m.def("lock_shared_mutex", [](Amulet::CancellableMutex<std::shared_mutex>& mutex, size_t count) {
         for (size_t i = 0; i < count; i++) {
             mutex.lock_shared();
             mutex.unlock_shared();
@@ -1,5 +1,21 @@
-from amulet.utils.lock import SharedLock, OrderedLock
+from contextlib import AbstractContextManager
+
+from amulet.utils.lock import (
+    SharedLock,
+    OrderedLock,
+    ThreadAccessMode,
+    ThreadShareMode,
+)
+from amulet.utils.task_manager import AbstractCancelManager
 
 def throw_deadlock() -> None: ...
 def lock_shared_mutex(lock: SharedLock, count: int) -> None: ...
 def lock_ordered_mutex(lock: OrderedLock, count: int) -> None: ...
+def count_ordered_mutex(thread_count: int, count: int) -> int: ...
+def generic_ordered_mutex_context(
+    lock: OrderedLock,
+    blocking: bool = True,
+    timeout: float = -1.0,
+    cancel_manager: AbstractCancelManager = ...,
+    thread_mode: tuple[ThreadAccessMode, ThreadShareMode] = ...,
+) -> AbstractContextManager[None]: ...
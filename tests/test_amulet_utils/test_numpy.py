@@ -2,7 +2,37 @@ import unittest
 import numpy
 from numpy.testing import assert_array_equal
 
-from amulet.utils.numpy import unique_inverse
+from amulet.utils.numpy import (
+    UniqueInverseMethod,
+    UniquePalette,
+    remap,
+    unique_inverse,
+    unique_inverse_many,
+)
+
+IntDTypes = (
+    numpy.uint8,
+    numpy.uint16,
+    numpy.uint32,
+    numpy.uint64,
+    numpy.int8,
+    numpy.int16,
+    numpy.int32,
+    numpy.int64,
+)
+
+
+def first_occurrence_unique(
+    arr: numpy.ndarray,
+) -> tuple[numpy.ndarray, numpy.ndarray]:
+    """A reference implementation of unique_inverse built on numpy.unique."""
+    sorted_unique, first_index, sorted_inverse = numpy.unique(
+        arr, return_index=True, return_inverse=True
+    )
+    order = numpy.argsort(first_index)
+    rank = numpy.empty_like(order)
+    rank[order] = numpy.arange(order.size)
+    return sorted_unique[order], rank[sorted_inverse].reshape(arr.shape)
 
 
 class TestUtilsNumpy(unittest.TestCase):
@@ -29,6 +59,354 @@ class TestUtilsNumpy(unittest.TestCase):
                         cy_unique_values[cy_index_array],
                     )
 
+    def test_dtypes(self) -> None:
+        for dtype in IntDTypes:
+            with self.subTest(dtype=dtype):
+                info = numpy.iinfo(dtype)
+                arr = numpy.random.default_rng().integers(
+                    info.min, info.max, size=1000, dtype=dtype, endpoint=True
+                )
+                unique, inverse = unique_inverse(arr)
+                self.assertEqual(dtype, unique.dtype)
+                self.assertEqual(numpy.uint32, inverse.dtype)
+                expected_unique, expected_inverse = first_occurrence_unique(arr)
+                assert_array_equal(expected_unique, unique)
+                assert_array_equal(expected_inverse, inverse)
+
+    def test_invalid_dtype(self) -> None:
+        with self.assertRaises(ValueError):
+            unique_inverse(numpy.zeros(10, dtype=numpy.float32))
+
+    def test_parallel(self) -> None:
+        # Large enough to be split across threads.
+        for dtype in (numpy.uint16, numpy.uint32, numpy.int64):
+            for count in (1, 100, 30_000):
+                with self.subTest(dtype=dtype, count=count):
+                    arr = numpy.random.randint(0, count, size=1_000_000, dtype=dtype)
+                    unique, inverse = unique_inverse(arr, thread_count=8)
+                    expected_unique, expected_inverse = first_occurrence_unique(arr)
+                    assert_array_equal(expected_unique, unique)
+                    assert_array_equal(expected_inverse, inverse)
+
+    def test_value_range(self) -> None:
+        # Small ranges offset from zero use a lookup table. Large ranges use a hash map.
+        rng = numpy.random.default_rng()
+        for dtype, low, high in (
+            (numpy.int16, -20_000, 20_000),
+            (numpy.int32, -100, 100),
+            (numpy.int64, 2**40, 2**40 + 1000),
+            (numpy.int64, -(2**62), 2**62),
+            (numpy.uint64, 2**63, 2**64 - 1),
+        ):
+            for size in (1, 10, 100_000):
+                with self.subTest(dtype=dtype, low=low, high=high, size=size):
+                    arr = rng.integers(low, high, size=size, dtype=dtype, endpoint=True)
+                    unique, inverse = unique_inverse(arr, thread_count=4)
+                    expected_unique, expected_inverse = first_occurrence_unique(arr)
+                    assert_array_equal(expected_unique, unique)
+                    assert_array_equal(expected_inverse, inverse)
+
+    def test_max_value(self) -> None:
+        arr = numpy.random.randint(0, 4096, size=100_000, dtype=numpy.uint32)
+        expected_unique, expected_inverse = first_occurrence_unique(arr)
+        for max_value in (4095, 10_000, 2**32 - 1):
+            with self.subTest(max_value=max_value):
+                unique, inverse = unique_inverse(arr, max_value=max_value)
+                assert_array_equal(expected_unique, unique)
+                assert_array_equal(expected_inverse, inverse)
+
+        with self.assertRaises(ValueError):
+            unique_inverse(arr, max_value=10)
+        with self.assertRaises(ValueError):
+            unique_inverse(numpy.array([1, 2, 3], dtype=numpy.int32), max_value=-1)
+        with self.assertRaises(ValueError):
+            unique_inverse(numpy.array([1, 2, 3], dtype=numpy.uint8), max_value=-1)
+
+    def test_max_value_overflow(self) -> None:
+        # Hints larger than the dtype are clamped to the dtype maximum.
+        for dtype, max_value in (
+            (numpy.uint8, 300),
+            (numpy.int8, 2**40),
+            (numpy.int32, 2**40),
+            (numpy.uint64, 2**70),
+        ):
+            with self.subTest(dtype=dtype, max_value=max_value):
+                arr = numpy.array([5, 0, 127, 5, 0], dtype=dtype)
+                unique, inverse = unique_inverse(arr, max_value=max_value)
+                assert_array_equal(numpy.array([5, 0, 127], dtype=dtype), unique)
+                assert_array_equal(numpy.array([0, 1, 2, 0, 1]), inverse)
+                ((unique, inverse),) = unique_inverse_many([arr], max_value=max_value)
+                assert_array_equal(numpy.array([5, 0, 127], dtype=dtype), unique)
+                assert_array_equal(numpy.array([0, 1, 2, 0, 1]), inverse)
+
+    def test_method(self) -> None:
+        rng = numpy.random.default_rng()
+        for dtype, high, size in (
+            (numpy.uint8, 255, 100_000),
+            (numpy.int32, 1000, 100_000),
+            (numpy.int64, 2**62, 10),
+            (numpy.int64, 2**62, 300_000),
+            (numpy.uint64, 2**64 - 1, 300_000),
+            (numpy.uint32, 2**32 - 1, 1_000_000),
+        ):
+            arr = rng.integers(0, high, size=size, dtype=dtype, endpoint=True)
+            # Repeat the values in a different order.
+            arr = numpy.concatenate([arr, arr[::-3]])
+            expected_unique, expected_inverse = first_occurrence_unique(arr)
+            for method in (
+                UniqueInverseMethod.Auto,
+                UniqueInverseMethod.Hash,
+                UniqueInverseMethod.FlatHash,
+            ):
+                for thread_count in (1, 4):
+                    with self.subTest(
+                        dtype=dtype,
+                        high=high,
+                        size=size,
+                        method=method,
+                        thread_count=thread_count,
+                    ):
+                        unique, inverse = unique_inverse(
+                            arr, method=method, thread_count=thread_count
+                        )
+                        assert_array_equal(expected_unique, unique)
+                        assert_array_equal(expected_inverse, inverse)
+
+    def test_strided(self) -> None:
+        rng = numpy.random.default_rng()
+        base = rng.integers(0, 100, size=(64, 96, 64), dtype=numpy.uint32)
+        wide = base.astype(numpy.int64) * 2**40
+        views = {
+            "3d": base,
+            "fortran": numpy.asfortranarray(base),
+            "transpose": base.transpose(2, 0, 1),
+            "slice": base[::2, 1:-1, ::3],
+            "negative": base[::-1, :, ::-2],
+            "sub_chunk": base[16:32, 16:32, 16:32],
+            "column": base[:, 5, 7],
+            "broadcast": numpy.broadcast_to(base[0, 0], (40, 64)),
+            "hash": wide[:, ::3, 1::2],
+            "0d": base[1, 2, 3, ...],
+            "empty": base[:, :0],
+        }
+        for name, arr in views.items():
+            for thread_count in (1, 4):
+                with self.subTest(name=name, thread_count=thread_count):
+                    unique, inverse = unique_inverse(arr, thread_count=thread_count)
+                    self.assertEqual(arr.shape, inverse.shape)
+                    expected_unique, expected_inverse = first_occurrence_unique(arr)
+                    assert_array_equal(expected_unique, unique)
+                    assert_array_equal(expected_inverse, inverse)
+                    assert_array_equal(arr, unique[inverse])
+
+    def test_unique_inverse_many(self) -> None:
+        rng = numpy.random.default_rng()
+        for dtype, high in (
+            (numpy.uint16, 2**16 - 1),
+            (numpy.uint32, 4095),
+            (numpy.int64, 2**62),
+        ):
+            chunks = rng.integers(0, high, size=(20, 16, 16, 16), dtype=dtype)
+            # Mix contiguous arrays, views and sizes.
+            arrays = [
+                *chunks,
+                chunks[0, ::2],
+                chunks[:, 0, 0, 0],
+                chunks[1, :0],
+                rng.integers(0, 3, size=100_000, dtype=dtype),
+            ]
+            for thread_count in (1, 4):
+                with self.subTest(dtype=dtype, thread_count=thread_count):
+                    results = unique_inverse_many(arrays, thread_count=thread_count)
+                    self.assertEqual(len(arrays), len(results))
+                    for arr, (unique, inverse) in zip(arrays, results):
+                        self.assertEqual(dtype, unique.dtype)
+                        self.assertEqual(arr.shape, inverse.shape)
+                        expected_unique, expected_inverse = first_occurrence_unique(arr)
+                        assert_array_equal(expected_unique, unique)
+                        assert_array_equal(expected_inverse, inverse)
+
+        self.assertEqual([], unique_inverse_many([]))
+        with self.assertRaises(ValueError):
+            unique_inverse_many(
+                [
+                    numpy.zeros(10, dtype=numpy.uint32),
+                    numpy.zeros(10, dtype=numpy.uint16),
+                ]
+            )
+
+    def test_out(self) -> None:
+        arr = numpy.random.randint(0, 1000, size=(100, 200), dtype=numpy.int32)
+        expected_unique, expected_inverse = first_occurrence_unique(arr)
+        inverse_out = numpy.empty(arr.shape, dtype=numpy.uint32)
+        unique_out = numpy.empty(2000, dtype=numpy.int32)
+        for thread_count in (1, 4):
+            with self.subTest(thread_count=thread_count):
+                unique, inverse = unique_inverse(
+                    arr,
+                    thread_count=thread_count,
+                    inverse_out=inverse_out,
+                    unique_out=unique_out,
+                )
+                self.assertIs(inverse_out, inverse)
+                self.assertTrue(numpy.shares_memory(unique_out, unique))
+                assert_array_equal(expected_unique, unique)
+                assert_array_equal(expected_inverse, inverse)
+
+        palette = UniquePalette(numpy.zeros(0, dtype=numpy.int32))
+        inverse = palette.unique_inverse(arr, inverse_out=inverse_out)
+        self.assertIs(inverse_out, inverse)
+        assert_array_equal(expected_inverse, inverse)
+
+        readonly = numpy.empty(arr.shape, dtype=numpy.uint32)
+        readonly.flags.writeable = False
+        for kwargs in (
+            {"inverse_out": numpy.empty(arr.shape, dtype=numpy.int32)},
+            {"inverse_out": numpy.empty(arr.size, dtype=numpy.uint32)},
+            {"inverse_out": numpy.empty(arr.shape[::-1], dtype=numpy.uint32).T},
+            {"inverse_out": readonly},
+            {"unique_out": numpy.empty(10, dtype=numpy.int32)},
+            {"unique_out": numpy.empty(2000, dtype=numpy.int64)},
+            {"unique_out": numpy.empty((2, 2000), dtype=numpy.int32)},
+        ):
+            with self.subTest(kwargs=kwargs):
+                with self.assertRaises(ValueError):
+                    unique_inverse(arr, **kwargs)
+
+        # An invalid unique_out is rejected before inverse_out is written.
+        inverse_out = numpy.zeros(arr.shape, dtype=numpy.uint32)
+        with self.assertRaises(ValueError):
+            unique_inverse(
+                arr,
+                inverse_out=inverse_out,
+                unique_out=numpy.empty(2000, dtype=numpy.int64),
+            )
+        self.assertFalse(inverse_out.any())
+
+    def test_unique_view(self) -> None:
+        # The unique values are returned without copying and stay valid.
+        arr = numpy.arange(1000, dtype=numpy.uint64) % 7
+        unique, _ = unique_inverse(arr)
+        self.assertTrue(unique.flags.c_contiguous)
+        self.assertIsNotNone(unique.base)
+        del arr
+        assert_array_equal(numpy.arange(7, dtype=numpy.uint64), unique)
+
+    def test_unique_palette(self) -> None:
+        rng = numpy.random.default_rng()
+        for dtype, high in (
+            (numpy.uint8, 255),
+            (numpy.int32, 5000),
+            (numpy.uint64, 2**63),
+        ):
+            arrays = [
+                rng.integers(0, high, size=size, dtype=dtype)
+                for size in (10, 1000, 0, 200_000, 16)
+            ]
+            arrays.append(arrays[3].reshape(500, 400)[::3, 1::2])
+            for thread_count in (1, 4):
+                with self.subTest(dtype=dtype, thread_count=thread_count):
+                    initial = numpy.array([7, 3, 5], dtype=dtype)
+                    palette = UniquePalette(initial)
+                    self.assertEqual(3, len(palette))
+                    inverses = [
+                        palette.unique_inverse(arr, thread_count=thread_count)
+                        for arr in arrays
+                    ]
+                    # The palette is the initial values followed by values in first found order.
+                    expected_values, _ = first_occurrence_unique(
+                        numpy.concatenate([initial, *(arr.ravel() for arr in arrays)])
+                    )
+                    values = palette.values
+                    self.assertEqual(dtype, values.dtype)
+                    self.assertEqual(len(expected_values), len(palette))
+                    assert_array_equal(expected_values, values)
+                    for arr, inverse in zip(arrays, inverses):
+                        self.assertEqual(arr.shape, inverse.shape)
+                        assert_array_equal(arr, values[inverse])
+
+        palette = UniquePalette(numpy.zeros(0, dtype=numpy.uint16))
+        self.assertEqual(0, len(palette))
+        with self.assertRaises(ValueError):
+            palette.unique_inverse(numpy.zeros(10, dtype=numpy.uint32))
+        with self.assertRaises(ValueError):
+            UniquePalette(numpy.array([1, 2, 1], dtype=numpy.uint32))
+        with self.assertRaises(ValueError):
+            UniquePalette(numpy.zeros(3, dtype=numpy.float32))
+
+    def test_remap(self) -> None:
+        rng = numpy.random.default_rng()
+        uint_dtypes = (numpy.uint8, numpy.uint16, numpy.uint32, numpy.uint64)
+        for index_dtype in uint_dtypes:
+            for value_dtype in uint_dtypes:
+                for lut_size in (1, 200, 300):
+                    with self.subTest(
+                        index_dtype=index_dtype,
+                        value_dtype=value_dtype,
+                        lut_size=lut_size,
+                    ):
+                        lut = rng.integers(
+                            0,
+                            numpy.iinfo(value_dtype).max,
+                            size=lut_size,
+                            dtype=value_dtype,
+                            endpoint=True,
+                        )
+                        index = rng.integers(
+                            0, min(lut_size, 256), size=(300, 400), dtype=index_dtype
+                        )
+                        for thread_count in (1, 4):
+                            out = remap(index, lut, thread_count=thread_count)
+                            self.assertEqual(value_dtype, out.dtype)
+                            assert_array_equal(lut[index], out)
+                        view = index[::-1, 1::3]
+                        assert_array_equal(lut[view], remap(view, lut, thread_count=4))
+                        assert_array_equal(
+                            lut[index], remap(index, numpy.repeat(lut, 2)[::2])
+                        )
+
+    def test_remap_out(self) -> None:
+        rng = numpy.random.default_rng()
+        arr = rng.integers(0, 1000, size=200_000, dtype=numpy.uint64)
+        unique, inverse = unique_inverse(arr)
+        lut = (unique * 2).astype(numpy.uint32)
+        expected = (arr * 2).astype(numpy.uint32)
+
+        out = numpy.empty(arr.shape, dtype=numpy.uint32)
+        self.assertIs(out, remap(inverse, lut, out=out, thread_count=4))
+        assert_array_equal(expected, out)
+
+        # In place
+        self.assertIs(inverse, remap(inverse, lut, out=inverse, thread_count=4))
+        assert_array_equal(expected, inverse)
+
+        index = numpy.arange(100, dtype=numpy.uint32)
+        lut = numpy.arange(100, dtype=numpy.uint32)
+        for out in (
+            numpy.empty(200, dtype=numpy.uint32)[::2],
+            numpy.empty(100, dtype=numpy.uint16),
+            numpy.empty(99, dtype=numpy.uint32),
+        ):
+            with self.subTest(out=out):
+                with self.assertRaises(ValueError):
+                    remap(index, lut, out=out)
+        # Partial overlap
+        buffer = numpy.arange(101, dtype=numpy.uint32)
+        with self.assertRaises(ValueError):
+            remap(buffer[:100], lut, out=buffer[1:])
+        with self.assertRaises(ValueError):
+            remap(buffer[100:0:-1], lut, out=buffer[:100])
+
+        # Out of range
+        with self.assertRaises(ValueError):
+            remap(numpy.array([0, 1, 100], dtype=numpy.uint32), lut)
+        with self.assertRaises(ValueError):
+            remap(numpy.array([[0, 1, 100]], dtype=numpy.uint32)[:, ::2], lut)
+        with self.assertRaises(ValueError):
+            remap(index.astype(numpy.int32), lut)
+        with self.assertRaises(ValueError):
+            remap(index, lut.reshape(10, 10))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -5,7 +5,12 @@ import time
 import weakref
 import gc
 
-from amulet.utils.signal import ConnectionMode
+from amulet.utils.signal import (
+    ConnectionMode,
+    get_async_worker_count,
+    set_async_worker_count,
+    get_async_queue_depth,
+)
 
 from test_amulet_utils.test_signal_ import SignalTest
 
@@ -245,6 +250,138 @@ class SignalTestCase(TestCase):
         self.assertEqual(2, count)
         cls.signal_0.disconnect(token)
 
+    def test_async_workers(self) -> None:
+        cls = SignalTest()
+
+        lock = Lock()
+        order: list[int] = []
+        count = 0
+
+        def callback_1(a: int):
+            time.sleep(0.2)
+            with lock:
+                order.append(a)
+
+        def callback_2(a: int):
+            nonlocal count
+            time.sleep(0.2)
+            with lock:
+                count += 1
+
+        old_worker_count = get_async_worker_count()
+        with self.assertRaises(ValueError):
+            set_async_worker_count(0)
+        set_async_worker_count(2)
+        try:
+            self.assertEqual(2, get_async_worker_count())
+            token_1 = cls.signal_1.connect(callback_1, ConnectionMode.Async)
+            token_2 = cls.signal_1.connect(callback_2, ConnectionMode.Async)
+
+            for i in range(3):
+                cls.signal_1.emit(i)
+            self.assertLess(0, get_async_queue_depth())
+            # The two callbacks run at the same time.
+            time.sleep(0.9)
+            self.assertEqual(3, count)
+            # Each callback is called in the order the signal was emitted.
+            self.assertEqual([0, 1, 2], order)
+            self.assertEqual(0, get_async_queue_depth())
+
+            cls.signal_1.disconnect(token_1)
+            cls.signal_1.disconnect(token_2)
+        finally:
+            set_async_worker_count(old_worker_count)
+
+    def test_rate_limit(self) -> None:
+        cls = SignalTest()
+
+        lock = Lock()
+        throttle_values: list[int] = []
+        debounce_values: list[int] = []
+
+        def on_throttle(a: int):
+            with lock:
+                throttle_values.append(a)
+
+        def on_debounce(a: int):
+            with lock:
+                debounce_values.append(a)
+
+        for interval in (-1.0, float("nan"), float("inf")):
+            with self.subTest(interval=interval):
+                with self.assertRaises(ValueError):
+                    cls.signal_1.connect(on_throttle, interval=interval)
+        # Very large values are clamped.
+        token = cls.signal_1.connect(on_throttle, interval=1e300)
+        cls.signal_1.disconnect(token)
+
+        token_1 = cls.signal_1.connect(on_throttle, interval=0.2)
+        token_2 = cls.signal_1.connect(
+            on_debounce, ConnectionMode.Async, interval=0.2, debounce=True
+        )
+
+        t = time.time()
+        i = 0
+        while time.time() - t < 0.5:
+            cls.signal_1.emit(i)
+            i += 1
+        # The first emission is called directly. The rest are coalesced.
+        self.assertEqual(0, throttle_values[0])
+        self.assertLessEqual(len(throttle_values), 4)
+        self.assertEqual([], debounce_values)
+
+        time.sleep(0.5)
+        # The latest value is delivered once the emissions stop.
+        self.assertLessEqual(len(throttle_values), 5)
+        self.assertEqual(i - 1, throttle_values[-1])
+        self.assertEqual([i - 1], debounce_values)
+
+        cls.signal_1.disconnect(token_1)
+        cls.signal_1.disconnect(token_2)
+
+    def test_parallel(self) -> None:
+        cls = SignalTest()
+
+        lock = Lock()
+        count = 0
+
+        def callback():
+            nonlocal count
+            time.sleep(0.5)
+            with lock:
+                count += 1
+
+        token_1 = cls.signal_0.connect(callback, ConnectionMode.Parallel)
+        token_2 = cls.signal_0.connect(callback, ConnectionMode.Parallel)
+
+        # emit blocks until the parallel callbacks finish.
+        t = time.time()
+        cls.signal_0.emit()
+        dt = time.time() - t
+        self.assertEqual(2, count)
+        self.assertLess(0.49, dt)
+        self.assertGreater(0.9, dt)
+
+        # emit_nowait returns a handle to wait for them.
+        t = time.time()
+        emission = cls.signal_0.emit_nowait()
+        dt = time.time() - t
+        self.assertGreater(0.1, dt)
+        self.assertFalse(emission.is_done())
+        emission.wait()
+        dt = time.time() - t
+        self.assertTrue(emission.is_done())
+        self.assertEqual(4, count)
+        self.assertGreater(0.9, dt)
+
+        # The callbacks run even if the handle is not waited on.
+        cls.signal_0.emit_nowait()
+        time.sleep(1.5)
+        self.assertEqual(6, count)
+
+        cls.signal_0.disconnect(token_1)
+        cls.signal_0.disconnect(token_2)
+
     def test_lifetime(self) -> None:
         cls = SignalTest()
         signal = cls.signal_0
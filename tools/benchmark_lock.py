@@ -0,0 +1,90 @@
+"""
+Benchmark the ways of acquiring and releasing an uncontended OrderedLock from Python.
+
+The native context manager is compared against the generic context manager OrderedLock.__call__ used to return.
+Calling the lock with no arguments returns the lock itself so it is timed separately from calling it with arguments.
+This uses a helper from the test extension so the tests must be compiled first (tools/compile_tests.py).
+
+python tools/benchmark_lock.py
+"""
+
+import argparse
+import os
+import sys
+import time
+from contextlib import AbstractContextManager
+from typing import Callable
+
+from amulet.utils.lock import OrderedLock
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(__file__)), "tests"))
+
+from test_amulet_utils.test_lock_ import generic_ordered_mutex_context
+
+
+def time_with(
+    get_context_manager: Callable[[], AbstractContextManager], count: int, repeat: int
+) -> float:
+    """Get the fastest time in seconds per with block."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(count):
+            with get_context_manager():
+                pass
+        best = min(best, (time.perf_counter() - start) / count)
+    return best
+
+
+def time_acquire_release(lock: OrderedLock, count: int, repeat: int) -> float:
+    """Get the fastest time in seconds per acquire and release call pair."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(count):
+            lock.acquire()
+            lock.release()
+        best = min(best, (time.perf_counter() - start) / count)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument(
+        "--count",
+        type=int,
+        default=100_000,
+        help="The number of times the lock is acquired per run.",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=5,
+        help="The number of runs. The fastest time is recorded.",
+    )
+    args = parser.parse_args()
+
+    lock = OrderedLock()
+    context_manager = lock(blocking=True)
+    timings = {
+        "generic context manager": time_with(
+            lambda: generic_ordered_mutex_context(lock), args.count, args.repeat
+        ),
+        "with lock()": time_with(lambda: lock(), args.count, args.repeat),
+        "with lock(blocking=True)": time_with(
+            lambda: lock(blocking=True), args.count, args.repeat
+        ),
+        "reused context manager": time_with(
+            lambda: context_manager, args.count, args.repeat
+        ),
+        "with lock": time_with(lambda: lock, args.count, args.repeat),
+        "acquire()/release()": time_acquire_release(lock, args.count, args.repeat),
+    }
+
+    baseline = timings["generic context manager"]
+    for name, seconds in timings.items():
+        print(f"{name:<26} {seconds * 1e9:8.0f}ns {baseline / seconds:5.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""
+Benchmark the amulet.utils.numpy kernels against numpy.
+
+The results are written as JSON so that runs on the same hardware can be compared between releases.
+
+python tools/benchmark_numpy.py --output results.json
+python tools/benchmark_numpy.py --output new.json --compare results.json
+"""
+
+import argparse
+import datetime
+import itertools
+import json
+import os
+import platform
+import sys
+import time
+from typing import Any, Callable
+
+import numpy
+
+import amulet.utils
+from amulet.utils.numpy import UniqueInverseMethod, remap, unique_inverse
+
+DTypes = {
+    "uint16": numpy.uint16,
+    "uint32": numpy.uint32,
+    "int64": numpy.int64,
+}
+# Cubes of chunk sized arrays up to large arrays.
+Sizes = (16**3, 128**3, 256**3)
+# The number of unique values as a fraction of the array size or an absolute count.
+Cardinalities = {
+    "16": 16,
+    "4096": 4096,
+    "1%": 0.01,
+    "100%": 1.0,
+}
+Layouts = ("contiguous", "transposed", "strided")
+Methods = {
+    "auto": UniqueInverseMethod.Auto,
+    "hash": UniqueInverseMethod.Hash,
+    "flat_hash": UniqueInverseMethod.FlatHash,
+}
+
+
+def timeit(func: Callable[[], Any], repeat: int) -> float:
+    """Get the fastest time in seconds to call func."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def get_side(size: int) -> int:
+    return round(size ** (1 / 3))
+
+
+def make_array(
+    rng: numpy.random.Generator,
+    dtype: type[numpy.integer],
+    size: int,
+    cardinality: int | float,
+    layout: str,
+) -> numpy.ndarray | None:
+    """Create a cube array with the given properties or None if the combination is not possible."""
+    unique_count = (
+        cardinality if isinstance(cardinality, int) else max(1, int(size * cardinality))
+    )
+    info = numpy.iinfo(dtype)
+    if info.max - info.min + 1 < unique_count:
+        return None
+    # Spread the values over the full range of the type.
+    step = (int(info.max) - int(info.min)) // max(1, unique_count - 1)
+    values = rng.integers(0, unique_count, size=size, dtype=numpy.uint64)
+    arr = (values * numpy.uint64(step)).astype(dtype)
+    if layout == "contiguous":
+        return arr.reshape(get_side(size), get_side(size), -1)
+    elif layout == "transposed":
+        return arr.reshape(get_side(size), get_side(size), -1).transpose(2, 0, 1)
+    elif layout == "strided":
+        # Every other element of a larger array.
+        return numpy.repeat(arr, 2)[::2]
+    raise ValueError(layout)
+
+
+def run(quick: bool, repeat: int, thread_count: int) -> list[dict[str, Any]]:
+    rng = numpy.random.default_rng(0)
+    sizes = Sizes[:2] if quick else Sizes
+    results = []
+    for (
+        (dtype_name, dtype),
+        size,
+        (cardinality_name, cardinality),
+        layout,
+    ) in itertools.product(DTypes.items(), sizes, Cardinalities.items(), Layouts):
+        arr = make_array(rng, dtype, size, cardinality, layout)
+        if arr is None:
+            continue
+        # Fewer repeats for large arrays.
+        case_repeat = max(1, repeat * Sizes[1] // max(size, Sizes[1]))
+        case = {
+            "dtype": dtype_name,
+            "size": size,
+            "cardinality": cardinality_name,
+            "layout": layout,
+        }
+
+        timings = {
+            "numpy_unique": timeit(
+                lambda: numpy.unique(arr, return_inverse=True), case_repeat
+            ),
+        }
+        for method_name, method in Methods.items():
+            timings[f"unique_inverse_{method_name}"] = timeit(
+                lambda: unique_inverse(arr, method=method, thread_count=thread_count),
+                case_repeat,
+            )
+
+        unique, inverse = unique_inverse(arr, thread_count=thread_count)
+        lut = numpy.arange(len(unique), dtype=numpy.uint32)
+        out = numpy.empty_like(inverse)
+        timings["numpy_take"] = timeit(lambda: lut[inverse], case_repeat)
+        timings["remap"] = timeit(
+            lambda: remap(inverse, lut, out=out, thread_count=thread_count),
+            case_repeat,
+        )
+
+        results.append({**case, "seconds": timings})
+        print(
+            ", ".join(f"{key}={value}" for key, value in case.items()),
+            ", ".join(f"{key}={value * 1000:.3f}ms" for key, value in timings.items()),
+            sep="\n    ",
+        )
+    return results
+
+
+def compare(
+    results: list[dict[str, Any]], previous: list[dict[str, Any]], threshold: float
+) -> int:
+    """Print the benchmarks that are slower than the previous run and return how many there are."""
+
+    def get_key(result: dict[str, Any]) -> tuple:
+        return result["dtype"], result["size"], result["cardinality"], result["layout"]
+
+    previous_results = {get_key(result): result for result in previous}
+    regressions = 0
+    for result in results:
+        previous_result = previous_results.get(get_key(result))
+        if previous_result is None:
+            continue
+        for name, seconds in result["seconds"].items():
+            if name.startswith("numpy"):
+                continue
+            previous_seconds = previous_result["seconds"].get(name)
+            if previous_seconds and previous_seconds * (1 + threshold) < seconds:
+                regressions += 1
+                print(
+                    f"Regression: {name} {get_key(result)} "
+                    f"{previous_seconds * 1000:.3f}ms -> {seconds * 1000:.3f}ms"
+                )
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--output", help="The path to write the JSON results to.")
+    parser.add_argument(
+        "--compare", help="The path to a previous JSON results file to compare to."
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="The fractional slowdown reported as a regression. Default is 0.1",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=5,
+        help="The number of times each benchmark is run. The fastest time is recorded.",
+    )
+    parser.add_argument(
+        "--thread-count",
+        type=int,
+        default=0,
+        help="The maximum number of threads to use. If 0 (default), the hardware concurrency is used.",
+    )
+    parser.add_argument("--quick", action="store_true", help="Skip the largest arrays.")
+    args = parser.parse_args()
+
+    results = run(args.quick, args.repeat, args.thread_count)
+    data = {
+        "time": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "amulet_utils": amulet.utils.__version__,
+        "numpy": numpy.__version__,
+        "python": sys.version,
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "thread_count": args.thread_count,
+        "repeat": args.repeat,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(data, f, indent=4)
+
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        if compare(results, previous["results"], args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()